@@ -0,0 +1,156 @@
+# artifact_writer.py
+"""
+Background writer for debug artifacts (extracted/annotated/result images).
+
+Encoding three JPEGs and writing them to disk used to happen inline in the
+verification loop. ArtifactWriter moves rendering, encoding and disk I/O to a
+background thread behind a bounded queue:
+
+- Sampling: decided at submit time, before anything is rendered or copied
+  (e.g. keep 1% of passes and every reject)
+- Backpressure: when the queue is full the artifact set is dropped and counted,
+  the caller never waits
+- Format/quality: jpg, png or webp with the matching OpenCV quality parameter
+
+Images may be passed as arrays or as zero-argument callables; callables are
+rendered on the writer thread, so annotation drawing is off the critical path too.
+Arrays are not copied: callers must not modify them after submitting.
+"""
+
+import atexit
+import os
+import queue
+import random
+import threading
+from typing import Callable, Dict, Optional, Union
+
+import cv2
+import numpy as np
+
+from kyc_logging import get_logger
+
+logger = get_logger("artifacts")
+
+ImageSource = Union[np.ndarray, Callable[[], Optional[np.ndarray]]]
+
+_ENCODE_PARAMS = {
+    'jpg': lambda quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+    'webp': lambda quality: [cv2.IMWRITE_WEBP_QUALITY, quality],
+    # PNG is lossless: map quality 0-100 onto compression effort 9-0
+    'png': lambda quality: [cv2.IMWRITE_PNG_COMPRESSION, max(0, min(9, (100 - quality) // 10))],
+}
+
+
+class ArtifactWriter:
+    """Sampled, bounded, non-blocking image artifact writer"""
+
+    def __init__(self, output_dir: Optional[str] = None, pass_sample_rate: float = 1.0,
+                 reject_sample_rate: float = 1.0, image_format: str = 'jpg', quality: int = 90,
+                 queue_size: int = 64):
+        """
+        Args:
+            output_dir: Default directory for artifacts (submit() may override it).
+            pass_sample_rate: Fraction of passing documents whose artifacts are kept.
+            reject_sample_rate: Fraction of rejected documents whose artifacts are kept.
+            image_format: 'jpg', 'png' or 'webp'.
+            quality: Encoder quality 0-100.
+            queue_size: Artifact sets waiting to be written before new ones are dropped.
+        """
+        if image_format not in _ENCODE_PARAMS:
+            raise ValueError(f"Unsupported artifact format: {image_format}")
+        self.output_dir = output_dir
+        self.pass_sample_rate = pass_sample_rate
+        self.reject_sample_rate = reject_sample_rate
+        self.image_format = image_format
+        self.encode_params = _ENCODE_PARAMS[image_format](quality)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stats_lock = threading.Lock()
+        self._counts = {'submitted': 0, 'sampled_out': 0, 'dropped': 0, 'written': 0, 'errors': 0}
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._counts[name] += n
+
+    def should_save(self, passed: bool) -> bool:
+        """Sampling decision for one document"""
+        rate = self.pass_sample_rate if passed else self.reject_sample_rate
+        return rate >= 1.0 or random.random() < rate
+
+    def submit(self, base_name: str, images: Dict[str, ImageSource], passed: bool,
+               output_dir: Optional[str] = None) -> bool:
+        """
+        Queue images for writing as <output_dir>/<base_name>_<suffix>.<format>.
+
+        Returns:
+            True if queued, False if sampled out or dropped (queue full).
+        """
+        if not self.should_save(passed):
+            self._count('sampled_out')
+            return False
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((output_dir or self.output_dir, base_name, images))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('submitted')
+        return True
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, output_dir: Optional[str], base_name: str, images: Dict[str, ImageSource]):
+        try:
+            if output_dir is None:
+                raise ValueError("no output directory configured")
+            os.makedirs(output_dir, exist_ok=True)
+            for suffix, source in images.items():
+                image = source() if callable(source) else source
+                if image is None:
+                    continue
+                ok, encoded = cv2.imencode(f'.{self.image_format}', image, self.encode_params)
+                if not ok:
+                    raise ValueError(f"could not encode {suffix} image")
+                with open(os.path.join(output_dir, f'{base_name}_{suffix}.{self.image_format}'), 'wb') as f:
+                    f.write(encoded.data)
+            self._count('written')
+        except Exception as e:
+            self._count('errors')
+            logger.warning("Could not write artifacts for %s: %s", base_name, e)
+
+    def flush(self):
+        """Block until every queued artifact set has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write what is queued and stop the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            counts = dict(self._counts)
+        counts['queue_depth'] = self._queue.qsize()
+        return counts
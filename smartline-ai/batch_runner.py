@@ -0,0 +1,442 @@
+# batch_runner.py
+"""
+Streaming batch verification of archived ID images.
+
+EgyptianIDVerificationPipeline.process_folder is fine for a handful of images;
+this runner is for hundreds of thousands:
+
+- Inputs are streamed: directories (recursive), glob patterns and manifest files
+  (one path per line) are expanded lazily, never into one big list
+- Images are decoded ahead of time by background threads (cv2.imread releases
+  the GIL) while a process pool runs the verifier, one pipeline per worker.
+  Decoded frames go to workers through shared memory (only a handle is pickled)
+- Results are appended to JSONL (or Parquet part files) as they complete, so
+  memory stays flat and partial runs are usable
+- A checkpoint file records every finished path; re-running the same command
+  resumes where it stopped. A path is checkpointed only once its result is
+  readable on disk (a flushed JSONL line, a closed and renamed Parquet part),
+  so a crash can repeat (never lose) the last few images.
+
+Usage:
+    python batch_runner.py /archive/ids "/archive/2023/**/*.jpg" --manifest todo.txt \\
+        --output-dir runs/audit --workers 8
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import cv2
+import numpy as np
+
+from artifact_writer import ArtifactWriter
+from image_ingest import FrameHandle, SharedFrame
+from kyc_logging import configure_logging, get_logger
+from production_egyptian_id_verifier_enhanced import EgyptianIDVerificationPipeline
+from verification_cache import _to_json_value
+
+logger = get_logger("batch")
+
+IMAGE_EXTENSIONS = EgyptianIDVerificationPipeline.IMAGE_EXTENSIONS
+GLOB_CHARS = set('*?[')
+
+
+# ==================== INPUTS ====================
+
+def _walk_images(directory: str) -> Iterator[str]:
+    """Image files under directory, depth first, in name order per directory"""
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            yield from _walk_images(entry.path)
+        elif entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield entry.path
+
+
+def _read_manifest(manifest_path: str) -> Iterator[str]:
+    """Paths listed in a manifest file (relative paths are relative to the manifest)"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8') as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+def iter_input_paths(inputs: Iterable[str] = (), manifests: Iterable[str] = ()) -> Iterator[str]:
+    """
+    Lazily expand inputs into image paths.
+
+    Args:
+        inputs: Directories (walked recursively), glob patterns ('**' allowed) or files.
+        manifests: Text files listing one image path per line.
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            yield from _walk_images(item)
+        elif GLOB_CHARS & set(item):
+            for path in glob.iglob(item, recursive=True):
+                if path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield path
+        else:
+            yield item
+    for manifest in manifests:
+        yield from _read_manifest(manifest)
+
+
+# ==================== OUTPUTS ====================
+
+class Checkpoint:
+    """Append-only list of finished input paths"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def mark(self, paths: List[str]):
+        if paths:
+            self._file.write(''.join(p + '\n' for p in paths))
+            self._file.flush()
+            self.done.update(paths)
+
+    def close(self):
+        self._file.close()
+
+
+def _flatten(record: Dict) -> Dict:
+    """Columnar view of a result (the full verification stays available as JSON)"""
+    verification = record.get('verification', {})
+    extracted = verification.get('extracted_data', {})
+    return {
+        'path': record['path'],
+        'file': record.get('file'),
+        'success': bool(record.get('success', False)),
+        'error': record.get('error'),
+        'is_egyptian_id': bool(record.get('is_egyptian_id', False)),
+        'confidence': float(record.get('confidence', 0.0)),
+        'detection_strategy': record.get('detection_strategy'),
+        'id_number': extracted.get('id_number'),
+        'elapsed_seconds': float(record.get('elapsed_seconds', 0.0)),
+        'verification_json': json.dumps(verification, default=_to_json_value) if verification else None
+    }
+
+
+class JSONLResultWriter:
+    """One JSON object per line; every record is durable once written"""
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, 'results.jsonl')
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, record: Dict) -> List[str]:
+        """Write a record; returns the input paths now safely on disk"""
+        self._file.write(json.dumps(record, default=_to_json_value) + '\n')
+        self._file.flush()
+        return [record['path']]
+
+    def close(self) -> List[str]:
+        self._file.close()
+        return []
+
+
+class ParquetResultWriter:
+    """
+    Flattened records written as Parquet part files of rows_per_part rows (needs pyarrow).
+
+    A Parquet file is unreadable until its footer is written on close, so every
+    flush writes a complete part file under a temporary name and renames it into
+    place; only then are its paths reported for the checkpoint. Read the results
+    as the dataset results-*.parquet.
+    """
+
+    def __init__(self, output_dir: str, rows_per_part: int = 1000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)") from e
+        self._pa = pa
+        self._pq = pq
+        self._schema = pa.schema([
+            ('path', pa.string()), ('file', pa.string()), ('success', pa.bool_()), ('error', pa.string()),
+            ('is_egyptian_id', pa.bool_()), ('confidence', pa.float64()), ('detection_strategy', pa.string()),
+            ('id_number', pa.string()), ('elapsed_seconds', pa.float64()), ('verification_json', pa.string())
+        ])
+
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, 'results-*.parquet')
+        self.rows_per_part = rows_per_part
+        self._rows: List[Dict] = []
+        self._part = 0
+
+    def _part_path(self, part: int) -> str:
+        return os.path.join(self.output_dir, f'results-{part:05d}.parquet')
+
+    def write(self, record: Dict) -> List[str]:
+        self._rows.append(_flatten(record))
+        return self._flush() if len(self._rows) >= self.rows_per_part else []
+
+    def _flush(self) -> List[str]:
+        if not self._rows:
+            return []
+        while os.path.exists(self._part_path(self._part)):
+            self._part += 1
+        path = self._part_path(self._part)
+        # A crash before the rename leaves only a .tmp file, which readers ignore
+        self._pq.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema), path + '.tmp')
+        os.replace(path + '.tmp', path)
+        paths = [row['path'] for row in self._rows]
+        self._rows = []
+        return paths
+
+    def close(self) -> List[str]:
+        return self._flush()
+
+
+# ==================== WORKERS ====================
+
+_worker_pipeline: Optional[EgyptianIDVerificationPipeline] = None
+_worker_options: Dict = {}
+
+
+def _init_worker(artifact_dir: Optional[str], artifact_options: Dict, full_report: bool,
+                 log_level: Optional[str]):
+    """Build one pipeline (and OCR engine) per worker process"""
+    global _worker_pipeline, _worker_options
+    configure_logging(level=log_level)
+    artifacts = ArtifactWriter(artifact_dir, **artifact_options)
+    # Pool workers skip atexit: drain the artifact queue when the worker exits
+    multiprocessing.util.Finalize(artifacts, artifacts.close, exitpriority=10)
+    _worker_pipeline = EgyptianIDVerificationPipeline(output_dir=artifact_dir, artifact_writer=artifacts)
+    _worker_options = {'save_output': artifact_dir is not None, 'full_report': full_report}
+
+
+def _process_decoded(path: str, image: np.ndarray) -> Dict:
+    """Verify one decoded image in the current process"""
+    start = time.time()
+    try:
+        result = _worker_pipeline.process_array(image, path, **_worker_options)
+    except Exception as e:
+        logger.exception("Failed to process %s", path)
+        result = {'success': False, 'error': str(e), 'is_egyptian_id': False, 'file': os.path.basename(path)}
+    result['path'] = path
+    result['elapsed_seconds'] = time.time() - start
+    return result
+
+
+# Frames whose views were still referenced (e.g. by a queued artifact) when their task ended
+_deferred_frames: List[SharedFrame] = []
+
+
+def _process_shared(path: str, handle: FrameHandle) -> Dict:
+    """Verify a frame the parent placed in shared memory"""
+    _deferred_frames[:] = [frame for frame in _deferred_frames if not frame.close()]
+    frame = SharedFrame.attach(handle)
+    result = _process_decoded(path, frame.array)
+    if not frame.close():
+        _deferred_frames.append(frame)
+    return result
+
+
+def _decode(path: str, shared: bool):
+    """Decode an image file, optionally into shared memory for a worker process"""
+    image = cv2.imread(path)
+    if image is None or not shared:
+        return image
+    return SharedFrame.from_array(image)
+
+
+def _release_frame(frame):
+    if isinstance(frame, SharedFrame):
+        frame.close()
+        frame.unlink()
+
+
+# ==================== RUNNER ====================
+
+class BatchRunner:
+    """Streams images through a pool of verifier processes with incremental, resumable output"""
+
+    def __init__(self, output_dir: str, workers: int = 4, decode_threads: int = 2,
+                 prefetch: int = 16, output_format: str = 'jsonl', save_artifacts: bool = False,
+                 artifact_options: Optional[Dict] = None, full_report: bool = True, resume: bool = True,
+                 log_level: Optional[str] = None):
+        """
+        Args:
+            output_dir: Receives results, the checkpoint and (optionally) artifacts/.
+            workers: Verifier processes (0 = run in this process).
+            decode_threads: Background threads decoding upcoming images.
+            prefetch: Decoded images kept ready ahead of the workers.
+            output_format: 'jsonl' or 'parquet'.
+            save_artifacts: Write extracted/annotated/result images to output_dir/artifacts.
+            artifact_options: ArtifactWriter sampling/format options (default: 1% of
+                passes, every reject).
+            full_report: Run every feature check (no short-circuit), as process_folder does.
+            resume: Skip paths already in the checkpoint (False starts a fresh checkpoint).
+        """
+        if output_format not in ('jsonl', 'parquet'):
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_dir = output_dir
+        self.workers = workers
+        self.decode_threads = decode_threads
+        self.prefetch = max(prefetch, 1)
+        self.output_format = output_format
+        self.artifact_dir = os.path.join(output_dir, 'artifacts') if save_artifacts else None
+        self.artifact_options = artifact_options if artifact_options is not None else \
+            {'pass_sample_rate': 0.01, 'reject_sample_rate': 1.0}
+        self.full_report = full_report
+        self.resume = resume
+        self.log_level = log_level
+
+    def _results(self, paths: Iterator[str]) -> Iterator[Dict]:
+        """Yield results in completion order, decoding ahead and bounding work in flight"""
+        worker_args = (self.artifact_dir, self.artifact_options, self.full_report, self.log_level)
+        # Workers are spawned, not forked: the pool starts them on demand while decode
+        # and logging threads are running, and a fork could inherit a held lock
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=worker_args) \
+            if self.workers > 0 else None
+        if pool is None:
+            _init_worker(*worker_args)
+        max_in_flight = max(self.workers, 1) * 2
+        shared = pool is not None
+
+        with ThreadPoolExecutor(self.decode_threads, thread_name_prefix="decode") as decoder:
+            decoding: deque = deque()  # (path, Future[image or SharedFrame]) in input order
+            in_flight: Dict[Future, SharedFrame] = {}
+
+            def refill():
+                while len(decoding) < self.prefetch:
+                    path = next(paths, None)
+                    if path is None:
+                        return
+                    decoding.append((path, decoder.submit(_decode, path, shared)))
+
+            try:
+                refill()
+                while decoding or in_flight:
+                    while decoding and len(in_flight) < max_in_flight:
+                        path, future = decoding.popleft()
+                        refill()
+                        image = future.result()
+                        if image is None:
+                            yield {'success': False, 'error': 'Cannot read image', 'is_egyptian_id': False,
+                                   'file': os.path.basename(path), 'path': path}
+                        elif pool is None:
+                            yield _process_decoded(path, image)
+                        else:
+                            in_flight[pool.submit(_process_shared, path, image.handle)] = image
+                    if in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _release_frame(in_flight.pop(future))
+                            yield future.result()
+            finally:
+                if pool is not None:
+                    pool.shutdown(wait=True, cancel_futures=True)
+                else:
+                    _worker_pipeline.artifacts.close()
+                for frame in in_flight.values():
+                    _release_frame(frame)
+                for _, future in decoding:
+                    if not future.cancel():
+                        _release_frame(future.result())
+
+    def run(self, paths: Iterable[str]) -> Dict:
+        """Process every path not yet checkpointed; returns run statistics"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        checkpoint_path = os.path.join(self.output_dir, 'checkpoint.txt')
+        writer = ParquetResultWriter(self.output_dir) if self.output_format == 'parquet' \
+            else JSONLResultWriter(self.output_dir)
+        if not self.resume and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        checkpoint = Checkpoint(checkpoint_path)
+
+        stats = {'processed': 0, 'skipped': 0, 'detected': 0, 'valid_ids': 0, 'failed': 0}
+        seen: Set[str] = set()
+
+        def pending() -> Iterator[str]:
+            for path in paths:
+                if path in checkpoint.done or path in seen:
+                    stats['skipped'] += 1
+                    continue
+                seen.add(path)
+                yield path
+
+        if checkpoint.done:
+            logger.info("Resuming: %d images already processed", len(checkpoint.done))
+        start = time.time()
+        try:
+            for result in self._results(pending()):
+                stats['processed'] += 1
+                stats['detected'] += bool(result.get('success'))
+                stats['valid_ids'] += bool(result.get('is_egyptian_id'))
+                stats['failed'] += not result.get('success')
+                checkpoint.mark(writer.write(result))
+                if stats['processed'] % 100 == 0:
+                    logger.info("%d images processed (%.1f/s)", stats['processed'],
+                                stats['processed'] / (time.time() - start))
+        finally:
+            checkpoint.mark(writer.close())
+            checkpoint.close()
+
+        stats['elapsed_seconds'] = time.time() - start
+        stats['results_path'] = writer.path
+        return stats
+
+
+# ==================== MAIN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream archived ID images through the verifier")
+    parser.add_argument('inputs', nargs='*', help="Image directories, glob patterns or image files")
+    parser.add_argument('--manifest', action='append', default=[], help="File listing one image path per line")
+    parser.add_argument('--output-dir', required=True, help="Directory for results and the checkpoint")
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Verifier processes (0 = inline)")
+    parser.add_argument('--decode-threads', type=int, default=2)
+    parser.add_argument('--prefetch', type=int, default=16, help="Decoded images kept ahead of the workers")
+    parser.add_argument('--save-artifacts', action='store_true', help="Also write extracted/annotated images")
+    parser.add_argument('--artifact-pass-rate', type=float, default=0.01, help="Share of passing IDs saved")
+    parser.add_argument('--artifact-reject-rate', type=float, default=1.0, help="Share of rejected IDs saved")
+    parser.add_argument('--artifact-format', choices=('jpg', 'png', 'webp'), default='jpg')
+    parser.add_argument('--artifact-quality', type=int, default=90)
+    parser.add_argument('--fast', action='store_true', help="Short-circuit feature checks instead of a full report")
+    parser.add_argument('--restart', action='store_true', help="Ignore the existing checkpoint")
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    if not args.inputs and not args.manifest:
+        parser.error("no inputs given")
+
+    configure_logging(level=args.log_level)
+    runner = BatchRunner(
+        args.output_dir, workers=args.workers, decode_threads=args.decode_threads,
+        prefetch=args.prefetch, output_format=args.format, save_artifacts=args.save_artifacts,
+        artifact_options={'pass_sample_rate': args.artifact_pass_rate,
+                          'reject_sample_rate': args.artifact_reject_rate,
+                          'image_format': args.artifact_format, 'quality': args.artifact_quality},
+        full_report=not args.fast, resume=not args.restart, log_level=args.log_level
+    )
+    stats = runner.run(iter_input_paths(args.inputs, args.manifest))
+
+    print(f"[DONE] {stats['processed']} processed, {stats['skipped']} skipped in {stats['elapsed_seconds']:.1f}s")
+    print(f"       {stats['detected']} documents detected, {stats['valid_ids']} valid Egyptian IDs, "
+          f"{stats['failed']} failed")
+    print(f"[Saved] {stats['results_path']}")
+
+
+if __name__ == '__main__':
+    main()
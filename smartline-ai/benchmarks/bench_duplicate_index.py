@@ -0,0 +1,78 @@
+# bench_duplicate_index.py
+"""
+NearDuplicateIndex lookup latency with same-template card hashes.
+
+Every national ID shares one template, so the card pHash/dHash of different
+people's cards sit within a few bits of each other; only the photo hash tells
+them apart. Entries are generated that way: card hashes 0-3 bits from one base,
+photo hashes random. Queries are resubmissions of indexed cards (a few bits of
+noise on every hash) and new cards (a fresh photo hash).
+
+Usage:
+    python benchmarks/bench_duplicate_index.py [--entries 1000000] [--queries 500]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from duplicate_detection import NearDuplicateIndex  # noqa: E402
+
+
+def near(rng, value, max_bits):
+    for bit in rng.choice(64, size=int(rng.integers(0, max_bits + 1)), replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def card(rng, base_phash, base_dhash, photo):
+    return {'card_phash': f"{near(rng, base_phash, 3):016x}", 'card_dhash': f"{near(rng, base_dhash, 3):016x}",
+            'photo_phash': f"{photo:016x}"}
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    print(f"{label:22} mean {np.mean(timings) * 1e3:7.3f} ms   p50 {timings[len(timings) // 2] * 1e3:7.3f} ms   "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1e3:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base_phash, base_dhash = int(rng.integers(0, 2 ** 63)), int(rng.integers(0, 2 ** 63))
+    photos = [int(p) for p in rng.integers(0, 2 ** 63, size=args.entries, dtype=np.uint64) * 2]
+
+    index = NearDuplicateIndex(max_distance=4)
+    start = time.perf_counter()
+    for i, photo in enumerate(photos):
+        index.add(f"s{i}", card(rng, base_phash, base_dhash, photo))
+    print(f"{args.entries} entries indexed in {time.perf_counter() - start:.1f} s")
+
+    for label, resubmission in (('resubmitted card', True), ('new card', False)):
+        timings, found = [], 0
+        for _ in range(args.queries):
+            if resubmission:
+                photo = near(rng, photos[int(rng.integers(len(photos)))], 2)
+            else:
+                photo = int(rng.integers(0, 2 ** 63)) * 2
+            hashes = card(rng, base_phash, base_dhash, photo)
+            start = time.perf_counter()
+            matches = index.lookup(hashes)
+            timings.append(time.perf_counter() - start)
+            found += bool(matches['card'])
+        report(label, timings)
+        print(f"{'':22} card matches in {found}/{args.queries} lookups")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# bench_duplicate_radius.py
+"""
+Calibration of the near-duplicate radii (KYC_DUPLICATE_MAX_DISTANCE,
+KYC_DUPLICATE_REUSE_DISTANCE) on a set of ID card images.
+
+Every image in the fixture directory is taken to be a different card (a different
+person). Same-card pairs are simulated by resubmitting each card the way reused
+photos arrive: JPEG recompression, a small crop, a brightness shift and a slight
+rotation, then localization and warping by DocumentDetector as in production.
+For each hash kind and for the combined rule NearDuplicateIndex uses (card pHash,
+card dHash and photo pHash all within the radius) the script prints, per radius,
+the share of same-card pairs matched and the share of cross-card pairs falsely
+matched. Pick the largest radius whose false match rate is acceptable.
+
+Usage:
+    python benchmarks/bench_duplicate_radius.py fixtures/cards [--variants 4] [--max-radius 12]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from duplicate_detection import hex_to_hash  # noqa: E402
+from production_egyptian_id_verifier_enhanced import DocumentDetector, EnhancedConfig, PerceptualHasher  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+KINDS = ('card_phash', 'card_dhash', 'photo_phash')
+
+
+def resubmit(image, rng):
+    """The same card, recompressed, cropped, re-lit and slightly rotated"""
+    h, w = image.shape[:2]
+    crop = rng.uniform(0.0, 0.03)
+    y0, x0 = int(h * crop * rng.random()), int(w * crop * rng.random())
+    out = image[y0:h - int(h * crop) + y0, x0:w - int(w * crop) + x0]
+    out = cv2.convertScaleAbs(out, alpha=rng.uniform(0.85, 1.15), beta=rng.uniform(-20, 20))
+    center = (out.shape[1] / 2, out.shape[0] / 2)
+    rotation = cv2.getRotationMatrix2D(center, rng.uniform(-2.0, 2.0), 1.0)
+    out = cv2.warpAffine(out, rotation, (out.shape[1], out.shape[0]), borderMode=cv2.BORDER_REPLICATE)
+    ok, encoded = cv2.imencode('.jpg', out, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(55, 90))])
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+
+def card_hashes(detector, image):
+    localization = detector.localize(image)
+    card = detector.extract(image, localization) if localization.found else image
+    hashes = PerceptualHasher.compute(card, EnhancedConfig.LAYOUT)
+    return {kind: hex_to_hash(hashes[kind]) for kind in KINDS}
+
+
+def distances(a, b):
+    return {kind: bin(a[kind] ^ b[kind]).count('1') for kind in KINDS}
+
+
+def report(label, same, cross, max_radius):
+    print(f"\n{label}")
+    print(f"{'radius':>8} {'same-card matched':>18} {'cross-card matched':>19}")
+    for radius in range(max_radius + 1):
+        hit = sum(1 for d in same if d <= radius) / len(same)
+        false = sum(1 for d in cross if d <= radius) / len(cross)
+        print(f"{radius:>8} {hit:>18.1%} {false:>19.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('fixtures', help='Directory of card images, one card per person')
+    parser.add_argument('--variants', type=int, default=4, help='Resubmissions simulated per card')
+    parser.add_argument('--max-radius', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    detector = DocumentDetector()
+    rng = np.random.default_rng(args.seed)
+    cards = []
+    for name in sorted(os.listdir(args.fixtures)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(os.path.join(args.fixtures, name))
+            if image is not None:
+                cards.append(image)
+    if len(cards) < 2:
+        parser.error("need at least two card images")
+
+    originals = [card_hashes(detector, image) for image in cards]
+    same = [distances(original, card_hashes(detector, resubmit(image, rng)))
+            for image, original in zip(cards, originals) for _ in range(args.variants)]
+    cross = [distances(a, b) for a, b in itertools.combinations(originals, 2)]
+    print(f"{len(cards)} cards: {len(same)} same-card pairs, {len(cross)} cross-card pairs")
+
+    for kind in KINDS:
+        report(kind, [d[kind] for d in same], [d[kind] for d in cross], args.max_radius)
+    report("combined (max of the three)", [max(d.values()) for d in same],
+           [max(d.values()) for d in cross], args.max_radius)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# bench_face_detectors.py
+"""
+Face detector latency and recall: Haar cascades vs. the OpenCV DNN (SSD) backend.
+
+Runs every detector over a fixture set of face images (selfies, ID photo crops)
+normalized the way LivenessEngine sees them. Recall counts images where at least
+the expected number of faces was found; expected counts come from an optional
+labels.json ({"file name": face_count}) in the fixture directory, default 1.
+
+Usage:
+    python benchmarks/bench_face_detectors.py fixtures/faces [--model-dir models] [--batch 8]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from face_detection import DnnFaceDetector, HaarFaceDetector, SSD_PROTOTXT, SSD_WEIGHTS  # noqa: E402
+from liveness_engine import LivenessEngine  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def load_fixtures(folder):
+    labels_path = os.path.join(folder, 'labels.json')
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding='utf-8') as f:
+            labels = json.load(f)
+
+    fixtures = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(folder, name))
+        if image is None:
+            continue
+        frame, _ = LivenessEngine.normalize(image)
+        fixtures.append((name, frame, int(labels.get(name, 1))))
+    return fixtures
+
+
+def report(label, timings, found, fixtures):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    hits = sum(1 for count, (_, _, expected) in zip(found, fixtures) if count >= expected)
+    print(f"{label:34} mean {mean * 1e3:7.2f} ms   p50 {timings[len(timings) // 2] * 1e3:7.2f} ms   "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1e3:7.2f} ms   recall {hits / len(fixtures):6.1%}")
+
+
+def run_single(label, detector, fixtures, min_size):
+    timings, found = [], []
+    for _, frame, _ in fixtures:
+        start = time.perf_counter()
+        faces = detector.detect(frame, min_size=min_size)
+        timings.append(time.perf_counter() - start)
+        found.append(len(faces))
+    report(label, timings, found, fixtures)
+
+
+def run_batched(label, detector, fixtures, min_size, batch):
+    timings, found = [], []
+    for i in range(0, len(fixtures), batch):
+        frames = [frame for _, frame, _ in fixtures[i:i + batch]]
+        start = time.perf_counter()
+        detections = detector.detect_batch(frames, min_size=min_size)
+        elapsed = time.perf_counter() - start
+        timings.extend([elapsed / len(frames)] * len(frames))  # per image
+        found.extend(len(faces) for faces in detections)
+    report(label, timings, found, fixtures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('fixtures', help="Directory of face images (optional labels.json)")
+    parser.add_argument('--model-dir', default=os.getenv("KYC_FACE_DNN_MODEL_DIR"),
+                        help="Directory holding the SSD model files")
+    parser.add_argument('--batch', type=int, default=8, help="Images per DNN forward pass")
+    parser.add_argument('--confidence', type=float, default=0.5)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        parser.error(f"no images in {args.fixtures}")
+    print(f"{len(fixtures)} images, longest side {LivenessEngine.FRAME_SIDE}px\n")
+
+    min_size = (LivenessEngine.MIN_FACE_SIDE, LivenessEngine.MIN_FACE_SIDE)
+    run_single("haar (scaleFactor 1.1, liveness)", HaarFaceDetector(1.1, 5), fixtures, min_size)
+    run_single("haar (scaleFactor 1.05, ID photo)", HaarFaceDetector(1.05, 3), fixtures, min_size)
+
+    if not args.model_dir:
+        print("\n(dnn skipped: pass --model-dir or set KYC_FACE_DNN_MODEL_DIR)")
+        return
+    detector = DnnFaceDetector(os.path.join(args.model_dir, SSD_PROTOTXT),
+                               os.path.join(args.model_dir, SSD_WEIGHTS), args.confidence)
+    detector.detect(fixtures[0][1])  # warm-up: first forward pass allocates
+    run_single("dnn ssd (one image per pass)", detector, fixtures, min_size)
+    run_batched(f"dnn ssd (batch {args.batch})", detector, fixtures, min_size, args.batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# bench_face_index.py
+"""
+FaceEmbeddingIndex search latency and recall at production scale.
+
+Builds a compacted IVF segment (as a background compaction would) over synthetic
+face embeddings - `people` identities of unit norm, each with a few selfies
+jittered around it - plus a delta of recent inserts, with every entry's metadata
+in SQLite. Queries are fresh selfies of indexed people; recall counts how many of
+the brute-force matches within max_distance (up to max_matches) search() returns.
+
+Usage:
+    python benchmarks/bench_face_index.py [--entries 2000000] [--nprobe 16] [--queries 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import face_index as fi  # noqa: E402
+
+SELFIE_JITTER = 0.02  # per-dimension noise between selfies of one person (distance ~0.23)
+
+
+def build_index(directory, entries, delta, nprobe, rng):
+    index = fi.FaceEmbeddingIndex(directory, nprobe=nprobe, compact_threshold=10 ** 9)
+    people = max(1, entries // 3)
+    identities = rng.normal(size=(people, fi.DIM)).astype(np.float32)
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    owners = rng.integers(0, people, entries + delta)
+
+    vectors = np.empty((entries, fi.DIM), dtype=np.float16)
+    for start in range(0, entries, 100_000):
+        end = min(entries, start + 100_000)
+        noise = rng.normal(scale=SELFIE_JITTER, size=(end - start, fi.DIM)).astype(np.float32)
+        vectors[start:end] = identities[owners[start:end]] + noise
+
+    start = time.perf_counter()
+    nlist = min(index._target_lists(entries), index.nlist)
+    centroids = fi._train_centroids(vectors, nlist, iterations=4, max_samples=200_000)
+    assignment = fi._nearest_centroids(vectors, centroids)
+    index._segment = index._write_segment(centroids, vectors, np.arange(1, entries + 1), assignment,
+                                          entries, entries, 1)
+    index._db.executemany(
+        "INSERT INTO face_entries (entry_id, driver_id, session_id, created_at) VALUES (?, ?, ?, 0)",
+        ((i + 1, f"driver{owners[i]}", f"s{i + 1}") for i in range(entries))
+    )
+    index._db.commit()
+    print(f"segment: {entries} entries, {nlist} lists, built in {time.perf_counter() - start:.1f} s")
+
+    for i in range(entries, entries + delta):
+        jitter = rng.normal(scale=SELFIE_JITTER, size=fi.DIM).astype(np.float32)
+        index.add(f"driver{owners[i]}", f"s{i + 1}", identities[owners[i]] + jitter)
+    all_vectors = np.concatenate([vectors.astype(np.float32), index._delta[:index._delta_size]])
+    return index, identities, all_vectors
+
+
+def brute_force(vectors, query, max_distance, max_matches):
+    distances = np.sqrt(np.maximum(((vectors - query) ** 2).sum(axis=1), 0.0))
+    within = np.flatnonzero(distances <= max_distance)
+    return set((within[np.argsort(distances[within], kind='stable')][:max_matches] + 1).tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=2_000_000, help='Compacted entries')
+    parser.add_argument('--delta', type=int, default=5000, help='Entries inserted since the last compaction')
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        index, identities, vectors = build_index(directory, args.entries, args.delta, args.nprobe, rng)
+
+        timings, found, expected = [], 0, 0
+        for _ in range(args.queries):
+            person = rng.integers(len(identities))
+            query = identities[person] + rng.normal(scale=SELFIE_JITTER, size=fi.DIM).astype(np.float32)
+            start = time.perf_counter()
+            matches = index.search(query)
+            timings.append(time.perf_counter() - start)
+
+            truth = brute_force(vectors, query, index.max_distance, index.max_matches)
+            expected += len(truth)
+            found += len(truth & {int(m['session_id'][1:]) for m in matches})
+
+        timings.sort()
+        print(f"search (nprobe {args.nprobe}): mean {np.mean(timings) * 1e3:.2f} ms   "
+              f"p50 {timings[len(timings) // 2] * 1e3:.2f} ms   p95 {timings[int(len(timings) * 0.95)] * 1e3:.2f} ms")
+        print(f"recall@{index.max_matches}: {found / max(expected, 1):.1%} ({found}/{expected})")
+
+
+if __name__ == '__main__':
+    main()
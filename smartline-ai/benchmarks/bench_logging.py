@@ -0,0 +1,84 @@
+# bench_logging.py
+"""
+Per-request logging overhead: print() banners vs. the kyc_logging layer.
+
+Replays the console output a single /internal/verify request used to produce
+(activity ping, banners, lighting, nine feature lines, decision) against a
+log file, the way uvicorn's stdout is redirected by start_kyc_service.sh.
+
+Usage:
+    python benchmarks/bench_logging.py [--requests 20000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from kyc_logging import configure_logging, get_logger, shutdown_logging  # noqa: E402
+
+FEATURES = ['aspect_ratio', 'layout_structure', 'photo_left_side', 'pyramids_sphinx', 'eagle_emblem',
+            'arabic_header', 'color_scheme', 'security_pattern', 'id_number_valid']
+
+
+def request_with_print(out):
+    print("[KYC] Activity ping - shutdown timer reset to 1800s", file=out)
+    print("\n" + "=" * 70, file=out)
+    print("[SEARCH] ENHANCED EGYPTIAN NATIONAL ID FEATURE VERIFICATION", file=out)
+    print("=" * 70, file=out)
+    print("[INFO] Detected lighting: daylight", file=out)
+    print(f"   Color temperature shift: {3.25:.1f}", file=out)
+    for name in FEATURES:
+        print(f"[OK] {name.replace('_', ' ').title():25} [{0.85:.2f}] (weight: {0.10:.2f}) - message", file=out)
+    print("\n" + "=" * 70, file=out)
+    print(f"[PASS] High confidence match ({81.2:.1f}%)", file=out)
+    print(f"Overall Confidence: {81.2:.1f}%", file=out)
+    print("=" * 70 + "\n", file=out)
+
+
+def request_with_logger(logger):
+    logger.debug("Activity ping - shutdown timer reset to %ss", 1800)
+    logger.debug("Detected lighting: %s (color temperature shift: %.1f)", "daylight", 3.25)
+    for name in FEATURES:
+        logger.debug("%s %-25s [%.2f] (weight: %.2f) - %s", "[OK]", name, 0.85, 0.10, "message")
+    logger.info("%s (overall confidence: %.1f%%)", "[PASS] High confidence match", 81.2)
+
+
+def run(label, fn, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    print(f"{label:38} mean {mean * 1e6:8.2f} us   p50 {timings[len(timings) // 2] * 1e6:8.2f} us   "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:8.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'kyc_service.log'), 'w') as log_file:
+            run("before: print() to log file", lambda: request_with_print(log_file), args.requests)
+
+            logger = get_logger("bench")
+            configure_logging(level="WARNING", stream=log_file)
+            run("after: quiet (default WARNING)", lambda: request_with_logger(logger), args.requests)
+
+            configure_logging(level="INFO", sample_rate=0.01, stream=log_file)
+            run("after: INFO, 1% sampling, async", lambda: request_with_logger(logger), args.requests)
+
+            configure_logging(level="DEBUG", stream=log_file)
+            run("after: DEBUG, async (full trace)", lambda: request_with_logger(logger), args.requests)
+            shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# bulk_validate_ids.py
+"""
+Offline audit of national ID numbers stored in a CSV export (e.g. the drivers table).
+
+The CSV is streamed in chunks through EgyptianIDValidator.validate_bulk, so memory
+use is bounded by the chunk size whatever the file size. Every input row is
+written back with the validation columns appended.
+
+Usage:
+    python bulk_validate_ids.py drivers.csv --id-column national_id -o audited.csv
+    mysql ... --batch | python bulk_validate_ids.py - --delimiter tab --invalid-only
+"""
+
+import argparse
+import csv
+import itertools
+import sys
+import time
+from typing import Dict, Iterator, List
+
+from production_egyptian_id_verifier_enhanced import EgyptianIDValidator
+
+OUTPUT_COLUMNS = ('id_valid', 'id_birth_date', 'id_age', 'id_governorate_code', 'id_governorate', 'id_gender')
+
+
+def iter_chunks(rows: Iterator[Dict], chunk_size: int) -> Iterator[List[Dict]]:
+    """Split a row iterator into lists of at most chunk_size rows"""
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_csv(reader: csv.DictReader, writer: csv.DictWriter, id_column: str,
+                 chunk_size: int = 100000, invalid_only: bool = False) -> Dict:
+    """Validate every row of reader and write it (with OUTPUT_COLUMNS) to writer"""
+    validator = EgyptianIDValidator()
+    total = valid = 0
+
+    for chunk in iter_chunks(iter(reader), chunk_size):
+        columns = validator.validate_bulk([row.get(id_column) for row in chunk])
+        birth_dates = columns['birth_date'].astype(str)
+        for i, row in enumerate(chunk):
+            is_valid = bool(columns['valid'][i])
+            valid += is_valid
+            if invalid_only and is_valid:
+                continue
+            row.update({
+                'id_valid': int(is_valid),
+                'id_birth_date': birth_dates[i] if is_valid else '',
+                'id_age': int(columns['age'][i]) if is_valid else '',
+                'id_governorate_code': columns['governorate_code'][i],
+                'id_governorate': columns['governorate'][i],
+                'id_gender': columns['gender'][i]
+            })
+            writer.writerow(row)
+        total += len(chunk)
+
+    return {'rows': total, 'valid': valid, 'invalid': total - valid}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate Egyptian national ID numbers in a CSV file")
+    parser.add_argument('input', help="Input CSV file ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="Output CSV file (default: stdout)")
+    parser.add_argument('--id-column', default='national_id', help="Column holding the ID number")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="Rows validated per batch")
+    parser.add_argument('--delimiter', default=',', help="Field delimiter ('tab' for TSV)")
+    parser.add_argument('--invalid-only', action='store_true', help="Only write rows that fail validation")
+    args = parser.parse_args()
+
+    delimiter = '\t' if args.delimiter == 'tab' else args.delimiter
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+
+    start = time.time()
+    try:
+        reader = csv.DictReader(source, delimiter=delimiter)
+        if reader.fieldnames is None or args.id_column not in reader.fieldnames:
+            parser.error(f"column '{args.id_column}' not found in input header")
+        writer = csv.DictWriter(target, fieldnames=list(reader.fieldnames) + list(OUTPUT_COLUMNS),
+                                delimiter=delimiter)
+        writer.writeheader()
+        summary = validate_csv(reader, writer, args.id_column, args.chunk_size, args.invalid_only)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = time.time() - start
+    print(f"[DONE] {summary['rows']} rows in {elapsed:.1f}s - "
+          f"{summary['valid']} valid, {summary['invalid']} invalid", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+# duplicate_detection.py
+"""
+Cross-session duplicate detection for ID documents.
+
+Fraudsters reuse the same ID card photo - slightly cropped or recompressed - on
+many captain accounts, which the exact content-hash cache cannot see. Each
+verified card contributes 64-bit perceptual hashes (see PerceptualHasher in the
+verifier) to a near-duplicate index:
+
+- card_phash + card_dhash of the warped card, together with photo_phash: the
+  whole card was reused. All national IDs share one template, so the card hashes
+  of two different people's cards are close; only the portrait tells them apart
+- photo_phash of the photo region alone: the portrait was pasted onto another card
+
+The default radii come from benchmarks/bench_duplicate_radius.py. Since the card
+hashes of all cards sit in one tight cluster, only the photo hashes are indexed:
+a lookup finds the few entries with a similar portrait and checks their card
+hashes directly (benchmarks/bench_duplicate_index.py).
+
+Lookup uses multi-index hashing: each hash is split into 4 chunks of 16 bits,
+and by pigeonhole any hash within Hamming distance r of the query agrees with it
+to within r // 4 bits on at least one chunk. Each chunk is kept as a sorted
+array, so a lookup is a handful of binary searches plus a popcount over the few
+candidates - sub-millisecond with millions of entries. Recent inserts go to an
+unsorted tail that is scanned linearly and merged into the sorted arrays once
+it grows past TAIL_MERGE_SIZE.
+
+Entries are persisted in SQLite (optional) and reloaded on start.
+
+National ID numbers are tracked separately by IDNumberIndex: the same valid
+14-digit number submitted from several sessions is a strong duplicate signal
+even when the photos differ.
+"""
+
+import itertools
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from kyc_logging import get_logger
+
+logger = get_logger("duplicates")
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+NUM_CHUNKS = HASH_BITS // CHUNK_BITS
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Number of set bits of each uint64"""
+    as_bytes = np.ascontiguousarray(values, dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int32)
+
+
+def hex_to_hash(value: str) -> int:
+    """16-char hex hash -> unsigned 64-bit int"""
+    return int(value, 16)
+
+
+def _to_signed(value: int) -> int:
+    """SQLite INTEGER is signed 64-bit"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class _GrowableArray:
+    """Append-only numpy array with amortized O(1) appends"""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self._data):
+            self._data = np.concatenate([self._data, np.zeros_like(self._data)])
+        self._data[self.size] = value
+        self.size += 1
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self.size]
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit hashes; positions are insertion order"""
+
+    TAIL_MERGE_SIZE = 4096
+
+    def __init__(self, max_distance: int = 8):
+        """
+        Args:
+            max_distance: Largest query radius supported (chunk probes are precomputed for it).
+        """
+        self.max_distance = max_distance
+        self.hashes = _GrowableArray(np.uint64)
+
+        # Per chunk: sorted chunk values and the positions they belong to
+        self._chunk_keys = [np.zeros(0, dtype=np.uint16) for _ in range(NUM_CHUNKS)]
+        self._chunk_pos = [np.zeros(0, dtype=np.int64) for _ in range(NUM_CHUNKS)]
+        self._sorted_count = 0
+
+        # XOR masks of every chunk value within max_distance // 4 bits
+        flips = max_distance // NUM_CHUNKS
+        masks = [0]
+        for n in range(1, flips + 1):
+            for bits in itertools.combinations(range(CHUNK_BITS), n):
+                masks.append(sum(1 << b for b in bits))
+        self._probe_masks = np.array(masks, dtype=np.uint16)
+
+    def __len__(self) -> int:
+        return self.hashes.size
+
+    @staticmethod
+    def _chunk(values: np.ndarray, index: int) -> np.ndarray:
+        return ((values >> np.uint64(index * CHUNK_BITS)) & np.uint64(0xFFFF)).astype(np.uint16)
+
+    def add(self, value: int) -> int:
+        """Insert a hash; returns its position"""
+        self.hashes.append(np.uint64(value))
+        if self.hashes.size - self._sorted_count >= self.TAIL_MERGE_SIZE:
+            self._merge_tail()
+        return self.hashes.size - 1
+
+    def _merge_tail(self):
+        """Merge the unsorted tail into the per-chunk sorted arrays"""
+        tail = self.hashes.values[self._sorted_count:]
+        tail_pos = np.arange(self._sorted_count, self.hashes.size, dtype=np.int64)
+        for i in range(NUM_CHUNKS):
+            tail_keys = self._chunk(tail, i)
+            order = np.argsort(tail_keys, kind='stable')
+            tail_keys, positions = tail_keys[order], tail_pos[order]
+            insert_at = np.searchsorted(self._chunk_keys[i], tail_keys, side='right')
+            self._chunk_keys[i] = np.insert(self._chunk_keys[i], insert_at, tail_keys)
+            self._chunk_pos[i] = np.insert(self._chunk_pos[i], insert_at, positions)
+        self._sorted_count = self.hashes.size
+
+    def query(self, value: int, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Positions of all hashes within Hamming distance radius (<= max_distance).
+
+        Returns:
+            (positions, distances) sorted by distance
+        """
+        if radius > self.max_distance:
+            raise ValueError(f"radius {radius} exceeds index max_distance {self.max_distance}")
+        query = np.array([value], dtype=np.uint64)
+        masks = self._probe_masks[popcount64(self._probe_masks.astype(np.uint64)) <= radius // NUM_CHUNKS]
+
+        candidates = []
+        for i in range(NUM_CHUNKS):
+            keys = self._chunk_keys[i]
+            if len(keys) == 0:
+                continue
+            probes = self._chunk(query, i)[0] ^ masks
+            starts = np.searchsorted(keys, probes, side='left')
+            ends = np.searchsorted(keys, probes, side='right')
+            for start, end in zip(starts, ends):
+                if end > start:
+                    candidates.append(self._chunk_pos[i][start:end])
+
+        # Unsorted tail is scanned directly
+        candidates.append(np.arange(self._sorted_count, self.hashes.size, dtype=np.int64))
+
+        positions = np.unique(np.concatenate(candidates))
+        if len(positions) == 0:
+            return positions, np.zeros(0, dtype=np.int32)
+        distances = popcount64(self.hashes.values[positions] ^ query[0])
+        keep = distances <= radius
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return positions[order], distances[order]
+
+
+class NearDuplicateIndex:
+    """Perceptual-hash index of verified cards, shared across sessions"""
+
+    def __init__(self, db_path: Optional[str] = None, max_distance: int = 4,
+                 reuse_max_distance: int = 2, max_matches: int = 5):
+        """
+        Args:
+            db_path: SQLite file for persistence (None = in memory only).
+            max_distance: Hamming radius (of 64 bits) reported as a near-duplicate.
+            reuse_max_distance: Tighter radius within which a trusted result's visual
+                checks may be reused (never its extracted fields).
+            max_matches: Matches reported per hash kind.
+        """
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.reuse_max_distance = reuse_max_distance
+        self.max_matches = max_matches
+
+        self._lock = threading.Lock()
+        self._photo_index = HammingIndex(max_distance)
+        self._card_phash = _GrowableArray(np.uint64)  # position -> card hashes (not indexed)
+        self._card_dhash = _GrowableArray(np.uint64)
+        self._entry_ids = _GrowableArray(np.int64)  # position -> SQLite entry_id
+
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        if db_path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS card_hashes ("
+            " entry_id INTEGER PRIMARY KEY, session_id TEXT NOT NULL,"
+            " card_phash INTEGER NOT NULL, card_dhash INTEGER NOT NULL, photo_phash INTEGER NOT NULL,"
+            " result_key TEXT, trusted INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT entry_id, card_phash, card_dhash, photo_phash FROM card_hashes ORDER BY entry_id"
+        )
+        count = 0
+        for entry_id, card_phash, card_dhash, photo_phash in rows:
+            self._index_entry(entry_id, _to_unsigned(card_phash), _to_unsigned(card_dhash),
+                              _to_unsigned(photo_phash))
+            count += 1
+        if count:
+            logger.info("Loaded %d card hashes into the near-duplicate index", count)
+
+    def _index_entry(self, entry_id: int, card_phash: int, card_dhash: int, photo_phash: int):
+        self._photo_index.add(photo_phash)
+        self._card_phash.append(np.uint64(card_phash))
+        self._card_dhash.append(np.uint64(card_dhash))
+        self._entry_ids.append(entry_id)
+
+    def add(self, session_id: str, hashes: Dict[str, str], result_key: Optional[str] = None,
+            trusted: bool = False):
+        """
+        Index a verified card.
+
+        Args:
+            hashes: PerceptualHasher.compute() output (hex strings).
+            result_key: Result cache key of this verification (for reuse by near-duplicates).
+            trusted: Whether the result is confident enough to be reused.
+        """
+        card_phash = hex_to_hash(hashes['card_phash'])
+        card_dhash = hex_to_hash(hashes['card_dhash'])
+        photo_phash = hex_to_hash(hashes['photo_phash'])
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO card_hashes (session_id, card_phash, card_dhash, photo_phash,"
+                " result_key, trusted, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, _to_signed(card_phash), _to_signed(card_dhash), _to_signed(photo_phash),
+                 result_key, int(trusted), time.time())
+            )
+            self._db.commit()
+            self._index_entry(cursor.lastrowid, card_phash, card_dhash, photo_phash)
+
+    def _describe(self, positions: np.ndarray, distances: np.ndarray,
+                  exclude_session: Optional[str]) -> List[Dict]:
+        """Join matched positions with their SQLite rows (caller holds the lock)"""
+        matches = []
+        for position, distance in zip(positions, distances):
+            row = self._db.execute(
+                "SELECT session_id, result_key, trusted FROM card_hashes WHERE entry_id = ?",
+                (int(self._entry_ids.values[position]),)
+            ).fetchone()
+            if row is None or row[0] == exclude_session:
+                continue
+            matches.append({'session_id': row[0], 'distance': int(distance),
+                            'result_key': row[1], 'trusted': bool(row[2])})
+            if len(matches) >= self.max_matches:
+                break
+        return matches
+
+    def lookup(self, hashes: Dict[str, str], exclude_session: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """
+        Previously indexed cards that look like this one.
+
+        Returns:
+            {'card': [...], 'photo': [...]} - each match has session_id, distance,
+            result_key and trusted, nearest first. A card match needs its card
+            pHash, card dHash and photo pHash all within max_distance (its
+            distance is the largest of the three); photo matches that are not
+            also card matches are listed under 'photo'.
+        """
+        card_phash = np.uint64(hex_to_hash(hashes['card_phash']))
+        card_dhash = np.uint64(hex_to_hash(hashes['card_dhash']))
+        with self._lock:
+            # Every match needs a similar portrait: the photo index narrows the
+            # search, the card hashes of those few candidates are checked directly
+            positions, photo_distances = self._photo_index.query(hex_to_hash(hashes['photo_phash']),
+                                                                 self.max_distance)
+            distances = np.maximum.reduce([
+                photo_distances,
+                popcount64(self._card_phash.values[positions] ^ card_phash),
+                popcount64(self._card_dhash.values[positions] ^ card_dhash)
+            ])
+            is_card = distances <= self.max_distance
+            order = np.argsort(distances[is_card], kind='stable')
+            card = self._describe(positions[is_card][order], distances[is_card][order], exclude_session)
+            photo = self._describe(positions[~is_card], photo_distances[~is_card], exclude_session)
+        return {'card': card, 'photo': photo}
+
+    def trusted_result_key(self, matches: Dict[str, List[Dict]]) -> Optional[str]:
+        """Result key of the nearest trusted card match close enough to reuse (card and photo)"""
+        for match in matches.get('card', []):
+            if match['distance'] > self.reuse_max_distance:
+                break
+            if match['trusted'] and match['result_key']:
+                return match['result_key']
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._photo_index), 'persistent': self.db_path is not None}
+
+
+class IDNumberIndex:
+    """Validated national ID numbers -> sessions that submitted them (SQLite)"""
+
+    def __init__(self, db_path: Optional[str] = None, max_sessions: int = 20):
+        """
+        Args:
+            db_path: SQLite file (None = in memory only).
+            max_sessions: Sessions returned per lookup.
+
+        Rows live in a WITHOUT ROWID table clustered on (id_number, session_id), so
+        the primary key is the covering index: a lookup is one O(log n) B-tree
+        descent and each row costs ~30 bytes on disk. Memory use is SQLite's page
+        cache, independent of the number of entries.
+        """
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        if db_path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS id_numbers ("
+            " id_number INTEGER NOT NULL, session_id TEXT NOT NULL, created_at REAL NOT NULL,"
+            " PRIMARY KEY (id_number, session_id)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def sessions_for(self, id_number: str, exclude_session: Optional[str] = None) -> List[str]:
+        """Sessions that previously submitted this ID number, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT session_id, created_at FROM id_numbers WHERE id_number = ?",
+                (int(id_number),)
+            ).fetchall()
+        rows.sort(key=lambda row: row[1])
+        return [row[0] for row in rows if row[0] != exclude_session][:self.max_sessions]
+
+    def add(self, id_number: str, session_id: str):
+        """Record that session_id submitted id_number (idempotent)"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO id_numbers (id_number, session_id, created_at) VALUES (?, ?, ?)",
+                (int(id_number), session_id, time.time())
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM id_numbers").fetchone()[0]
+        return {'entries': count, 'persistent': self.db_path is not None}
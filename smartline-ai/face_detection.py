@@ -0,0 +1,168 @@
+# face_detection.py
+"""
+Pluggable face detectors for the liveness checks and the ID photo check.
+
+- HaarFaceDetector: the OpenCV Haar cascade (no model files needed)
+- DnnFaceDetector: OpenCV DNN ResNet-10 SSD (Caffe). Handles rotated and small
+  faces better than Haar, costs the same at any scaleFactor, and detects a batch
+  of images (e.g. a selfie and a card's photo region) in one forward pass
+
+create_face_detector() picks the backend from KYC_FACE_DETECTOR ('haar' or 'dnn')
+and falls back to Haar when the DNN model files are missing. The SSD model is
+read from KYC_FACE_DNN_MODEL_DIR (default: ./models next to this file):
+
+    deploy.prototxt
+    res10_300x300_ssd_iter_140000.caffemodel
+
+Detections are int32 arrays of (x, y, w, h) rows in the input image's pixels.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from kyc_logging import get_logger
+
+logger = get_logger("faces")
+
+Size = Optional[Tuple[int, int]]
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+SSD_PROTOTXT = "deploy.prototxt"
+SSD_WEIGHTS = "res10_300x300_ssd_iter_140000.caffemodel"
+
+
+def filter_face_sizes(faces: np.ndarray, min_size: Size = None, max_size: Size = None) -> np.ndarray:
+    """Keep detections within [min_size, max_size] (width, height)"""
+    faces = np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+    keep = np.ones(len(faces), dtype=bool)
+    if min_size is not None:
+        keep &= (faces[:, 2] >= min_size[0]) & (faces[:, 3] >= min_size[1])
+    if max_size is not None:
+        keep &= (faces[:, 2] <= max_size[0]) & (faces[:, 3] <= max_size[1])
+    return faces[keep]
+
+
+class FaceDetector(ABC):
+    """Face detector interface"""
+
+    name = "base"
+    batched = False  # detect_batch() shares one inference pass across images
+
+    @abstractmethod
+    def detect(self, image: np.ndarray, min_size: Size = None, max_size: Size = None) -> np.ndarray:
+        """Faces in a BGR or grayscale image as (x, y, w, h) rows"""
+
+    def detect_batch(self, images: Sequence[np.ndarray], min_size: Size = None,
+                     max_size: Size = None) -> List[np.ndarray]:
+        """detect() for several images"""
+        return [self.detect(image, min_size, max_size) for image in images]
+
+
+class HaarFaceDetector(FaceDetector):
+    """Haar cascade detector (one CascadeClassifier per thread - they are not thread safe)"""
+
+    name = "haar"
+
+    def __init__(self, scale_factor: float = 1.1, min_neighbors: int = 5,
+                 cascade: str = 'haarcascade_frontalface_default.xml'):
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.cascade_path = cv2.data.haarcascades + cascade
+        self._local = threading.local()
+
+    def _cascade(self) -> cv2.CascadeClassifier:
+        cascade = getattr(self._local, 'cascade', None)
+        if cascade is None:
+            cascade = self._local.cascade = cv2.CascadeClassifier(self.cascade_path)
+        return cascade
+
+    def detect(self, image: np.ndarray, min_size: Size = None, max_size: Size = None) -> np.ndarray:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        faces = self._cascade().detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                 minNeighbors=self.min_neighbors,
+                                                 minSize=min_size or (0, 0), maxSize=max_size or (0, 0))
+        return np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+
+
+# Loaded networks, per thread (cv2.dnn.Net.forward is not safe to share) and per model
+_dnn_nets = threading.local()
+
+
+class DnnFaceDetector(FaceDetector):
+    """OpenCV DNN ResNet-10 SSD face detector with batched inference"""
+
+    name = "dnn"
+    batched = True
+
+    INPUT_SIZE = (300, 300)
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, prototxt: str, weights: str, confidence: float = 0.5):
+        self.prototxt = prototxt
+        self.weights = weights
+        self.confidence = confidence
+        self._net()  # fail now, not on the first request, if the model cannot be loaded
+
+    def _net(self) -> "cv2.dnn.Net":
+        nets: Dict[Tuple[str, str], "cv2.dnn.Net"] = getattr(_dnn_nets, 'nets', None)
+        if nets is None:
+            nets = _dnn_nets.nets = {}
+        key = (self.prototxt, self.weights)
+        if key not in nets:
+            nets[key] = cv2.dnn.readNetFromCaffe(self.prototxt, self.weights)
+        return nets[key]
+
+    def detect(self, image: np.ndarray, min_size: Size = None, max_size: Size = None) -> np.ndarray:
+        return self.detect_batch([image], min_size, max_size)[0]
+
+    def detect_batch(self, images: Sequence[np.ndarray], min_size: Size = None,
+                     max_size: Size = None) -> List[np.ndarray]:
+        if not images:
+            return []
+        bgr = [cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image for image in images]
+        blob = cv2.dnn.blobFromImages(bgr, 1.0, self.INPUT_SIZE, self.MEAN, swapRB=False, crop=False)
+        net = self._net()
+        net.setInput(blob)
+        # (1, 1, N, 7): image index, class, confidence, x1, y1, x2, y2 (relative)
+        detections = net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.confidence]
+
+        results = []
+        for index, image in enumerate(bgr):
+            h, w = image.shape[:2]
+            rows = detections[detections[:, 0] == index]
+            boxes = np.clip(rows[:, 3:7], 0.0, 1.0) * [w, h, w, h]
+            faces = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]]).round().astype(np.int32)
+            faces = faces[(faces[:, 2] > 0) & (faces[:, 3] > 0)]
+            results.append(filter_face_sizes(faces, min_size, max_size))
+        return results
+
+
+def create_face_detector(backend: Optional[str] = None, scale_factor: float = 1.1, min_neighbors: int = 5,
+                         confidence: float = 0.5, model_dir: Optional[str] = None) -> FaceDetector:
+    """
+    Build the configured face detector.
+
+    Args:
+        backend: 'haar' or 'dnn' (default: KYC_FACE_DETECTOR, else 'haar').
+        scale_factor, min_neighbors: Haar cascade parameters.
+        confidence: Minimum DNN detection confidence.
+        model_dir: Directory holding the SSD model (default: KYC_FACE_DNN_MODEL_DIR or ./models).
+    """
+    backend = (backend or os.getenv("KYC_FACE_DETECTOR", "haar")).lower()
+    if backend == "dnn":
+        model_dir = model_dir or os.getenv("KYC_FACE_DNN_MODEL_DIR", DEFAULT_MODEL_DIR)
+        prototxt = os.path.join(model_dir, SSD_PROTOTXT)
+        weights = os.path.join(model_dir, SSD_WEIGHTS)
+        try:
+            return DnnFaceDetector(prototxt, weights, confidence)
+        except cv2.error as e:
+            logger.warning("DNN face detector unavailable (%s) - falling back to Haar", str(e).strip()[:200])
+    elif backend != "haar":
+        logger.warning("Unknown face detector backend %r - using Haar", backend)
+    return HaarFaceDetector(scale_factor, min_neighbors)
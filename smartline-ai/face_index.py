@@ -0,0 +1,429 @@
+# face_index.py
+"""
+One-to-many face deduplication: the same person registering several captain accounts.
+
+Every live selfie's embedding goes into FaceEmbeddingIndex, an IVF (inverted file)
+approximate-nearest-neighbour index:
+
+- Compacted segment: embeddings as float16, grouped by their nearest of `nlist`
+  k-means centroids so each list is one contiguous slice of a memory-mapped file
+  (vectors.f16). A query scans only the `nprobe` lists closest to it - about
+  nprobe / nlist of the data, a few ms with millions of captains on a CPU
+- Delta: embeddings inserted since the last compaction, held in RAM and scanned
+  exhaustively
+- Compaction: once the delta reaches compact_threshold, a background thread
+  assigns it to the lists and writes a new segment generation; the manifest is
+  replaced atomically, so readers and restarts always see a complete segment.
+  Centroids are retrained (k-means on the whole set) while the index is small and
+  has grown 4x since the last training, then frozen
+
+Entry metadata (driver, session, verified national ID number) lives in SQLite;
+embeddings are kept there only until they are compacted, so a restart rebuilds the
+delta without losing inserts. Without a directory the index is memory only.
+
+Searches leave out the querying captain's own entries: those with the same
+driver_id, or with the same verified ID number (the same person; several
+accounts on one ID number are DUPLICATE_ID_NUMBER's job).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from kyc_logging import get_logger
+
+logger = get_logger("faces")
+
+DIM = 128
+MANIFEST = "manifest.json"
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """Index of the nearest centroid of each vector (chunked to bound memory)"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        assignment[start:start + chunk] = np.argmin(centroid_norms - 2.0 * block @ centroids.T, axis=1)
+    return assignment
+
+
+def _squared_norms(vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    norms = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        norms[start:start + chunk] = (block ** 2).sum(axis=1)
+    return norms
+
+
+def _train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0,
+                     max_samples: int = 100_000) -> np.ndarray:
+    """Plain k-means (Lloyd) on a sample of the vectors; empty lists are re-seeded from random vectors"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > max_samples:
+        vectors = vectors[np.sort(rng.choice(len(vectors), max_samples, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroids(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        centroids[filled] = sums / counts[filled, np.newaxis]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids.astype(np.float32)
+
+
+class _Segment:
+    """Immutable compacted IVF segment"""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, vectors: np.ndarray,
+                 norms: np.ndarray, entry_ids: np.ndarray, max_entry_id: int, trained_on: int,
+                 generation: int = 0):
+        self.centroids = centroids  # nlist x DIM float32
+        self.centroid_norms = (centroids ** 2).sum(axis=1)
+        self.offsets = offsets  # nlist + 1 int64: list i is rows offsets[i]:offsets[i+1]
+        self.vectors = vectors  # N x DIM float16 (memmap when persistent)
+        self.norms = norms  # N float32 squared norms
+        self.entry_ids = entry_ids  # N int64
+        self.max_entry_id = max_entry_id
+        self.trained_on = trained_on
+        self.generation = generation
+
+    @classmethod
+    def empty(cls) -> "_Segment":
+        return cls(np.zeros((0, DIM), np.float32), np.zeros(1, np.int64), np.zeros((0, DIM), np.float16),
+                   np.zeros(0, np.float32), np.zeros(0, np.int64), 0, 0)
+
+    def __len__(self) -> int:
+        return len(self.entry_ids)
+
+
+class FaceEmbeddingIndex:
+    """IVF index of face embeddings over a memory-mapped float16 segment plus an in-memory delta"""
+
+    RETRAIN_GROWTH = 4  # retrain centroids when the index has grown this much since training...
+    RETRAIN_MAX_ENTRIES = 1_000_000  # ...until it is this large (centroids are stable by then)
+
+    def __init__(self, directory: Optional[str] = None, nlist: int = 4096, nprobe: int = 16,
+                 compact_threshold: int = 20000, max_distance: float = 0.45, max_matches: int = 5):
+        """
+        Args:
+            directory: Where the segment files and metadata live (None = memory only).
+            nlist: Maximum number of IVF lists (fewer while the index is small).
+            nprobe: Lists scanned per query.
+            compact_threshold: Delta size that triggers a background compaction.
+            max_distance: Embedding distance reported as the same person (stricter
+                than 1:1 matching: one query is compared with every captain).
+            max_matches: Matches returned per query.
+        """
+        self.directory = directory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.compact_threshold = compact_threshold
+        self.max_distance = max_distance
+        self.max_matches = max_matches
+
+        self._lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self._segment = _Segment.empty()
+        self._delta = np.zeros((1024, DIM), dtype=np.float32)
+        self._delta_ids = np.zeros(1024, dtype=np.int64)
+        self._delta_size = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "faces.sqlite") if directory else ":memory:",
+                                   check_same_thread=False)
+        if directory:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS face_entries ("
+            " entry_id INTEGER PRIMARY KEY, driver_id TEXT, session_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL, embedding BLOB, id_number TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(face_entries)")}
+        if 'id_number' not in columns:  # index created before ID numbers were recorded
+            self._db.execute("ALTER TABLE face_entries ADD COLUMN id_number TEXT")
+        self._db.commit()
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if self.directory and os.path.exists(self._path(MANIFEST)):
+            with open(self._path(MANIFEST), encoding='utf-8') as f:
+                manifest = json.load(f)
+            generation = manifest['generation']
+            count = manifest['count']
+            vectors = (np.memmap(self._path(f"vectors-{generation}.f16"), dtype=np.float16, mode='r',
+                                 shape=(count, DIM)) if count else np.zeros((0, DIM), np.float16))
+            self._segment = _Segment(
+                np.load(self._path(f"centroids-{generation}.npy")),
+                np.load(self._path(f"offsets-{generation}.npy")),
+                vectors,
+                np.load(self._path(f"norms-{generation}.npy")),
+                np.load(self._path(f"entry_ids-{generation}.npy")),
+                manifest['max_entry_id'], manifest['trained_on'], generation
+            )
+
+        # Inserts not compacted yet
+        rows = self._db.execute(
+            "SELECT entry_id, embedding FROM face_entries WHERE entry_id > ? ORDER BY entry_id",
+            (self._segment.max_entry_id,)
+        )
+        for entry_id, embedding in rows:
+            self._append_delta(entry_id, np.frombuffer(embedding, dtype=np.float16).astype(np.float32))
+        logger.info("Face index loaded: %d compacted, %d pending", len(self._segment), self._delta_size)
+
+    def _append_delta(self, entry_id: int, embedding: np.ndarray):
+        """Caller holds the lock (or is the constructor)"""
+        if self._delta_size == len(self._delta):
+            self._delta = np.concatenate([self._delta, np.zeros_like(self._delta)])
+            self._delta_ids = np.concatenate([self._delta_ids, np.zeros_like(self._delta_ids)])
+        self._delta[self._delta_size] = embedding
+        self._delta_ids[self._delta_size] = entry_id
+        self._delta_size += 1
+
+    def __len__(self) -> int:
+        return len(self._segment) + self._delta_size
+
+    # ---------- inserts ----------
+
+    def add(self, driver_id: Optional[str], session_id: str, embedding: np.ndarray,
+            id_number: Optional[str] = None) -> int:
+        """Insert an embedding; returns its entry id. May start a background compaction."""
+        embedding16 = np.asarray(embedding, dtype=np.float16)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO face_entries (driver_id, session_id, created_at, embedding, id_number)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (driver_id, session_id, time.time(), embedding16.tobytes(), id_number)
+            )
+            self._db.commit()
+            entry_id = cursor.lastrowid
+            # Stored at the precision it will be compacted to, so results do not shift on compaction
+            self._append_delta(entry_id, embedding16.astype(np.float32))
+            should_compact = self._delta_size >= self.compact_threshold
+        if should_compact and not self._compacting.locked():
+            threading.Thread(target=self.compact, name="face-index-compaction", daemon=True).start()
+        return entry_id
+
+    # ---------- queries ----------
+
+    def _scan(self, segment: _Segment, query: np.ndarray, query_norm: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(squared distances, entry ids) of the nprobe nearest lists"""
+        if len(segment) == 0:
+            return np.zeros(0, np.float32), np.zeros(0, np.int64)
+        nprobe = min(self.nprobe, len(segment.centroids))
+        centroid_dist = segment.centroid_norms - 2.0 * segment.centroids @ query
+        probes = np.argpartition(centroid_dist, nprobe - 1)[:nprobe]
+        distances, ids = [], []
+        for probe in probes:
+            start, end = segment.offsets[probe], segment.offsets[probe + 1]
+            if end > start:
+                dots = np.asarray(segment.vectors[start:end], dtype=np.float32) @ query
+                distances.append(segment.norms[start:end] - 2.0 * dots + query_norm)
+                ids.append(segment.entry_ids[start:end])
+        if not distances:
+            return np.zeros(0, np.float32), np.zeros(0, np.int64)
+        return np.concatenate(distances), np.concatenate(ids)
+
+    def search(self, embedding: np.ndarray, exclude_driver: Optional[str] = None,
+               exclude_session: Optional[str] = None, exclude_id_number: Optional[str] = None) -> List[Dict]:
+        """
+        Entries within max_distance of embedding, closest first (at most max_matches),
+        leaving out the session's own entries and the captain's own: those of
+        exclude_driver or recorded with exclude_id_number.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm = float(query @ query)
+        with self._lock:
+            segment = self._segment
+            delta = self._delta[:self._delta_size]
+            delta_ids = self._delta_ids[:self._delta_size]
+
+        distances, entry_ids = self._scan(segment, query, query_norm)
+        if len(delta):
+            delta_distances = ((delta - query) ** 2).sum(axis=1)
+            distances = np.concatenate([distances, delta_distances])
+            entry_ids = np.concatenate([entry_ids, delta_ids])
+
+        keep = distances <= self.max_distance ** 2
+        distances, entry_ids = distances[keep], entry_ids[keep]
+        if len(entry_ids) == 0:
+            return []
+        order = np.argsort(distances, kind='stable')
+        distances, entry_ids = distances[order], entry_ids[order]
+
+        # Metadata is fetched a batch of candidates at a time, until max_matches
+        # survive the exclusions (a captain's own sessions may be the nearest)
+        batch = self.max_matches * 4
+        matches = []
+        for start in range(0, len(entry_ids), batch):
+            candidates = entry_ids[start:start + batch].tolist()
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT entry_id, driver_id, session_id, id_number FROM face_entries"
+                    f" WHERE entry_id IN ({','.join('?' * len(candidates))})", candidates
+                ).fetchall()
+            meta = {row[0]: row[1:] for row in rows}
+
+            for entry_id, distance in zip(candidates, distances[start:start + batch]):
+                driver_id, session_id, id_number = meta.get(entry_id, (None, None, None))
+                if session_id is None or session_id == exclude_session:
+                    continue
+                if exclude_driver is not None and driver_id == exclude_driver:
+                    continue
+                if exclude_id_number is not None and id_number == exclude_id_number:
+                    continue
+                matches.append({'driver_id': driver_id, 'session_id': session_id,
+                                'distance': float(np.sqrt(max(distance, 0.0)))})
+                if len(matches) == self.max_matches:
+                    return matches
+        return matches
+
+    # ---------- compaction ----------
+
+    def _target_lists(self, count: int) -> int:
+        return int(np.clip(4 * np.sqrt(count), 1, self.nlist))
+
+    def compact(self):
+        """Merge the delta into a new segment generation (blocking; one compaction at a time)"""
+        with self._compacting:
+            with self._lock:
+                old = self._segment
+                delta = self._delta[:self._delta_size].copy()
+                delta_ids = self._delta_ids[:self._delta_size].copy()
+            if len(delta) == 0:
+                return
+            start = time.time()
+            total = len(old) + len(delta)
+
+            retrain = (len(old.centroids) == 0 or
+                       (total <= self.RETRAIN_MAX_ENTRIES and total >= old.trained_on * self.RETRAIN_GROWTH))
+            if retrain:
+                # Small enough to hold in RAM: retrain, reassign everything
+                vectors = np.concatenate([np.asarray(old.vectors), delta.astype(np.float16)])
+                entry_ids = np.concatenate([old.entry_ids, delta_ids])
+                nlist = min(self._target_lists(total), total)
+                centroids = _train_centroids(vectors, nlist)
+                assignment = _nearest_centroids(vectors, centroids)
+                segment = self._write_segment(centroids, vectors, entry_ids, assignment,
+                                              int(delta_ids.max()), total, old.generation + 1)
+            else:
+                segment = self._merge_segment(old, delta, delta_ids)
+
+            with self._lock:
+                self._segment = segment
+                # Keep what was inserted while compacting (new buffers: searches may still read the old ones)
+                remaining = self._delta_size - len(delta)
+                capacity = max(1024, 2 * remaining)
+                self._delta = np.concatenate([self._delta[len(delta):self._delta_size],
+                                              np.zeros((capacity - remaining, DIM), np.float32)])
+                self._delta_ids = np.concatenate([self._delta_ids[len(delta):self._delta_size],
+                                                  np.zeros(capacity - remaining, np.int64)])
+                self._delta_size = remaining
+                # Compacted embeddings live in the segment files from now on
+                if self.directory:
+                    self._db.execute("UPDATE face_entries SET embedding = NULL WHERE entry_id <= ?",
+                                     (segment.max_entry_id,))
+                    self._db.commit()
+            self._remove_generation(old.generation)
+            logger.info("Face index compacted: %d entries, %d lists%s in %.1fs", len(segment),
+                        len(segment.centroids), " (retrained)" if retrain else "", time.time() - start)
+
+    def _merge_segment(self, old: _Segment, delta: np.ndarray, delta_ids: np.ndarray) -> _Segment:
+        """New segment = old lists with the delta appended to each, centroids unchanged"""
+        assignment = _nearest_centroids(delta, old.centroids)
+        order = np.argsort(assignment, kind='stable')
+        delta, delta_ids, assignment = delta[order], delta_ids[order], assignment[order]
+        nlist = len(old.centroids)
+        delta_counts = np.bincount(assignment, minlength=nlist)
+        delta_offsets = np.concatenate([[0], np.cumsum(delta_counts)])
+        old_counts = np.diff(old.offsets)
+        offsets = np.concatenate([[0], np.cumsum(old_counts + delta_counts)]).astype(np.int64)
+        total = int(offsets[-1])
+        generation = old.generation + 1
+
+        vectors = self._allocate_vectors(generation, total)
+        norms = np.empty(total, np.float32)
+        entry_ids = np.empty(total, np.int64)
+        delta16 = delta.astype(np.float16)
+        delta_norms = _squared_norms(delta16)
+        for i in range(nlist):
+            out = offsets[i]
+            a, b = old.offsets[i], old.offsets[i + 1]
+            n_old = b - a
+            vectors[out:out + n_old] = old.vectors[a:b]
+            norms[out:out + n_old] = old.norms[a:b]
+            entry_ids[out:out + n_old] = old.entry_ids[a:b]
+            c, d = delta_offsets[i], delta_offsets[i + 1]
+            vectors[out + n_old:offsets[i + 1]] = delta16[c:d]
+            norms[out + n_old:offsets[i + 1]] = delta_norms[c:d]
+            entry_ids[out + n_old:offsets[i + 1]] = delta_ids[c:d]
+        return self._finish_segment(old.centroids, offsets, vectors, norms, entry_ids,
+                                    max(old.max_entry_id, int(delta_ids.max())), old.trained_on, generation)
+
+    def _write_segment(self, centroids: np.ndarray, vectors: np.ndarray, entry_ids: np.ndarray,
+                       assignment: np.ndarray, max_entry_id: int, trained_on: int, generation: int) -> _Segment:
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))]).astype(np.int64)
+        stored = self._allocate_vectors(generation, len(vectors))
+        stored[:] = vectors[order]
+        norms = _squared_norms(stored)
+        return self._finish_segment(centroids, offsets, stored, norms, entry_ids[order],
+                                    max_entry_id, trained_on, generation)
+
+    def _allocate_vectors(self, generation: int, count: int) -> np.ndarray:
+        if self.directory and count:
+            return np.memmap(self._path(f"vectors-{generation}.f16"), dtype=np.float16, mode='w+',
+                             shape=(count, DIM))
+        return np.empty((count, DIM), dtype=np.float16)
+
+    def _finish_segment(self, centroids, offsets, vectors, norms, entry_ids, max_entry_id,
+                        trained_on, generation) -> _Segment:
+        """Flush the files of a new generation and publish it through the manifest"""
+        if self.directory:
+            if isinstance(vectors, np.memmap):
+                vectors.flush()
+                vectors = np.memmap(vectors.filename, dtype=np.float16, mode='r', shape=vectors.shape)
+            np.save(self._path(f"centroids-{generation}.npy"), centroids)
+            np.save(self._path(f"offsets-{generation}.npy"), offsets)
+            np.save(self._path(f"norms-{generation}.npy"), norms)
+            np.save(self._path(f"entry_ids-{generation}.npy"), entry_ids)
+            manifest = {'generation': generation, 'count': len(entry_ids), 'max_entry_id': max_entry_id,
+                        'trained_on': trained_on}
+            with open(self._path(MANIFEST + ".tmp"), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(self._path(MANIFEST + ".tmp"), self._path(MANIFEST))
+        return _Segment(centroids, offsets, vectors, norms, entry_ids, max_entry_id, trained_on, generation)
+
+    def _remove_generation(self, generation: int):
+        """Delete the files of a superseded generation (open memmaps stay valid on POSIX)"""
+        if not self.directory or generation == 0:
+            return
+        for name in ("vectors-{}.f16", "centroids-{}.npy", "offsets-{}.npy", "norms-{}.npy", "entry_ids-{}.npy"):
+            try:
+                os.remove(self._path(name.format(generation)))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._segment) + self._delta_size, 'compacted': len(self._segment),
+                    'pending': self._delta_size, 'lists': len(self._segment.centroids),
+                    'persistent': self.directory is not None}
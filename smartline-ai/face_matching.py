@@ -0,0 +1,174 @@
+# face_matching.py
+"""
+Selfie-to-ID-photo face matching.
+
+- FaceEmbedder: 128-d face embeddings from face_recognition (dlib), computed for
+  face boxes that liveness / the ID photo check already detected - no second
+  detection pass
+- EmbeddingCache: LRU of embeddings keyed by the content hash of the uploaded
+  media, so resubmitted selfies and ID photos are not embedded again
+- CaptainFaceHistory: previous selfie embeddings per captain (optional SQLite
+  file), compared against a new selfie in one vectorized distance computation
+
+face_recognition is optional: without it FaceEmbedder.available is False and the
+service skips the face-match stage.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from kyc_logging import get_logger
+
+logger = get_logger("faces")
+
+EMBEDDING_SIZE = 128
+DEFAULT_TOLERANCE = 0.6  # face_recognition's usual same-person distance
+
+
+def face_distances(known: np.ndarray, embedding: np.ndarray) -> np.ndarray:
+    """Euclidean distance from embedding to every row of known (N x 128)"""
+    if len(known) == 0:
+        return np.empty(0, dtype=np.float32)
+    return np.linalg.norm(known - embedding, axis=1)
+
+
+class FaceEmbedder:
+    """face_recognition embeddings for known face boxes"""
+
+    def __init__(self, model: str = 'small', num_jitters: int = 1):
+        """
+        Args:
+            model: Landmark model, 'small' (5 points, faster) or 'large' (68 points).
+            num_jitters: Re-samplings averaged per embedding (higher = slower, steadier).
+        """
+        self.model = model
+        self.num_jitters = num_jitters
+        self._face_recognition = None
+        try:
+            import face_recognition
+            self._face_recognition = face_recognition
+        except ImportError as e:
+            logger.warning("face_recognition not available - face matching disabled: %s", str(e)[:80])
+
+    @property
+    def available(self) -> bool:
+        return self._face_recognition is not None
+
+    def embed(self, image: np.ndarray, box: Sequence[int]) -> Optional[np.ndarray]:
+        """Embedding of the face at box (x, y, w, h) of a BGR image, None if it cannot be computed"""
+        if not self.available:
+            return None
+        h, w = image.shape[:2]
+        x, y, bw, bh = [int(v) for v in box]
+        location = (max(y, 0), min(x + bw, w), min(y + bh, h), max(x, 0))  # (top, right, bottom, left)
+        rgb = np.ascontiguousarray(image[:, :, ::-1])
+        encodings = self._face_recognition.face_encodings(rgb, known_face_locations=[location],
+                                                          num_jitters=self.num_jitters, model=self.model)
+        return encodings[0].astype(np.float32) if encodings else None
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of embeddings (None = no usable face) keyed by media hash"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Optional[np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """(found, embedding) - a cached None means the media had no usable face"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, self._entries[key]
+
+    def put(self, key: str, embedding: Optional[np.ndarray]):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+
+class CaptainFaceHistory:
+    """Selfie embeddings of each captain's previous verifications"""
+
+    def __init__(self, db_path: Optional[str] = None, max_per_captain: int = 20):
+        """
+        Args:
+            db_path: SQLite file (None = in-memory, lost on restart).
+            max_per_captain: Most recent embeddings kept per captain.
+        """
+        self.max_per_captain = max_per_captain
+        self.persistent = db_path is not None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS captain_faces ("
+            " driver_id TEXT NOT NULL, session_id TEXT NOT NULL, created_at REAL NOT NULL,"
+            " embedding BLOB NOT NULL, PRIMARY KEY (driver_id, session_id)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def embeddings_for(self, driver_id: str, exclude_session: Optional[str] = None) -> Tuple[List[str], np.ndarray]:
+        """(session ids, N x 128 embedding matrix) of a captain's previous selfies, newest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT session_id, embedding FROM captain_faces WHERE driver_id = ? AND session_id != ?"
+                " ORDER BY created_at DESC LIMIT ?",
+                (driver_id, exclude_session or "", self.max_per_captain)
+            ).fetchall()
+        if not rows:
+            return [], np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), EMBEDDING_SIZE)
+        return [row[0] for row in rows], matrix
+
+    def add(self, driver_id: str, session_id: str, embedding: np.ndarray):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO captain_faces VALUES (?, ?, ?, ?)",
+                             (driver_id, session_id, time.time(), embedding.astype(np.float32).tobytes()))
+            # Keep only the newest max_per_captain
+            self._db.execute(
+                "DELETE FROM captain_faces WHERE driver_id = ? AND session_id NOT IN ("
+                " SELECT session_id FROM captain_faces WHERE driver_id = ? ORDER BY created_at DESC LIMIT ?)",
+                (driver_id, driver_id, self.max_per_captain)
+            )
+            self._db.commit()
+
+    def compare(self, driver_id: str, embedding: np.ndarray, tolerance: float = DEFAULT_TOLERANCE,
+                exclude_session: Optional[str] = None) -> Optional[Dict]:
+        """Distances of a new selfie to the captain's previous ones (None without history)"""
+        sessions, known = self.embeddings_for(driver_id, exclude_session)
+        if not sessions:
+            return None
+        distances = face_distances(known, embedding)
+        best = int(np.argmin(distances))
+        return {
+            'previous_sessions': len(sessions),
+            'matching_sessions': int(np.count_nonzero(distances <= tolerance)),
+            'min_distance': float(distances[best]),
+            'closest_session': sessions[best],
+            'matched': bool(distances[best] <= tolerance)
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM captain_faces").fetchone()[0]
+        return {'entries': entries, 'persistent': self.persistent}
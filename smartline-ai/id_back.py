@@ -0,0 +1,237 @@
+# id_back.py
+"""
+Back-of-card (id_back) pipeline for the Egyptian national ID.
+
+The back carries the card's expiry date and a barcode. IDBackPipeline reuses the
+front's DocumentDetector to localize and rectify the card, then reads the
+BACK_LAYOUT regions:
+- BarcodeReader: decodes the barcode strip (zbar via pyzbar) and keeps a 14-digit
+  run that passes EgyptianIDValidator - a few milliseconds
+- expiry date: OCR of the expiry line only (glare-checked like the front's OCR
+  regions); the latest plausible date read is the expiry
+
+The barcode stage runs first and publishes its ID number on a BarcodeHint. It is
+a cross-check, never a source: the front still reads the number from its ID
+region, and when that reading agrees with the barcode the front skips its
+full-card OCR pass (see verify_all_features(id_number_hint=...)). Callers compare
+the two numbers.
+
+pyzbar is optional: without it BarcodeReader.available is False and the ID number
+comes from the front-side OCR as before. (OpenCV's own barcode detector only
+decodes EAN/UPC, which cannot carry a 14-digit number.)
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from image_ingest import decode_image
+from kyc_logging import get_logger
+from production_egyptian_id_verifier_enhanced import (
+    DocumentDetector, EnhancedEgyptianIDFeatureDetector, GlareMap, deadline_scope
+)
+
+logger = get_logger("id_back")
+
+# Arabic-Indic and Eastern Arabic-Indic digits, as printed on the card
+ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+DATE_PATTERN = re.compile(r'(\d{4})\s*[/\-.]\s*(\d{1,2})\s*[/\-.]\s*(\d{1,2})'
+                          r'|(\d{1,2})\s*[/\-.]\s*(\d{1,2})\s*[/\-.]\s*(\d{4})')
+EXPIRY_YEARS = (2000, 2100)
+
+
+def parse_expiry_date(text: str) -> Optional[date]:
+    """Latest plausible date (Y/M/D or D/M/Y, any digit script) in OCR text, or None"""
+    latest = None
+    for match in DATE_PATTERN.finditer(text.translate(ARABIC_DIGITS)):
+        if match.group(1):
+            year, month, day = match.group(1), match.group(2), match.group(3)
+        else:
+            day, month, year = match.group(4), match.group(5), match.group(6)
+        try:
+            found = date(int(year), int(month), int(day))
+        except ValueError:
+            continue
+        if EXPIRY_YEARS[0] <= found.year <= EXPIRY_YEARS[1] and (latest is None or found > latest):
+            latest = found
+    return latest
+
+
+class BarcodeHint:
+    """ID number read from the barcode, handed from the back pipeline to the front one"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._id_number: Optional[str] = None
+
+    def publish(self, id_number: Optional[str]):
+        """Set the number (None = no usable barcode); only the first call counts"""
+        if not self._event.is_set():
+            self._id_number = id_number
+            self._event.set()
+
+    def get(self) -> Optional[str]:
+        """The published number, or None if there is none (yet) - never blocks"""
+        return self._id_number if self._event.is_set() else None
+
+
+class BarcodeReader:
+    """zbar barcode decoding (pyzbar)"""
+
+    def __init__(self):
+        self._pyzbar = None
+        try:
+            from pyzbar import pyzbar
+            self._pyzbar = pyzbar
+        except ImportError as e:
+            logger.warning("pyzbar not available - id_back barcodes are not decoded: %s", str(e)[:80])
+
+    @property
+    def available(self) -> bool:
+        return self._pyzbar is not None
+
+    def decode(self, gray: np.ndarray) -> List[Dict[str, str]]:
+        """[{'type', 'data'}] of every barcode found in a grayscale image"""
+        if self._pyzbar is None:
+            return []
+        return [{'type': symbol.type, 'data': symbol.data.decode('utf-8', errors='replace')}
+                for symbol in self._pyzbar.decode(gray)]
+
+
+class IDBackPipeline:
+    """Localization, barcode decoding and expiry-date OCR for the back of the card"""
+
+    def __init__(self, detector: DocumentDetector, verifier: EnhancedEgyptianIDFeatureDetector,
+                 barcode_reader: Optional[BarcodeReader] = None, max_workers: int = 4):
+        """
+        Args:
+            detector: The front pipeline's DocumentDetector (localization is shared).
+            verifier: The front feature detector, for its OCR engine, ID validator and
+                glare-aware OCR region handling.
+            barcode_reader: Barcode decoder (default: a new BarcodeReader).
+            max_workers: Back sides processed concurrently (see submit).
+        """
+        self.detector = detector
+        self.verifier = verifier
+        self.config = verifier.config
+        self.barcode_reader = barcode_reader or BarcodeReader()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='id-back')
+        self._counts = {'processed': 0, 'not_found': 0, 'barcode_id_numbers': 0, 'expiry_dates': 0}
+        self._stats_lock = threading.Lock()
+
+    def submit(self, data, hint: Optional[BarcodeHint] = None, deadline: Optional[float] = None) -> Future:
+        """Run process() in the background (the encoded data must stay valid until it finishes)"""
+        return self._pool.submit(self.process, data, hint, deadline)
+
+    def process(self, data, hint: Optional[BarcodeHint] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Read the back of the card from an encoded image.
+
+        hint receives the barcode's ID number (or None) as soon as the barcode stage
+        is done; deadline (time.monotonic()) bounds localization and the expiry-date
+        OCR. Errors are reported as {'success': False, 'error': ...}, like an image
+        without a card.
+        """
+        start = time.perf_counter()
+        try:
+            with deadline_scope(deadline):
+                result = self._process(data, hint, deadline)
+        except Exception as e:
+            logger.exception("id_back processing failed")
+            result = {'success': False, 'error': f"Back of the ID could not be processed: {e}"}
+        finally:
+            if hint is not None:
+                hint.publish(None)  # failed before the barcode stage
+        result['elapsed_ms'] = (time.perf_counter() - start) * 1000.0
+        self._count(result)
+        return result
+
+    def _process(self, data, hint: Optional[BarcodeHint], deadline: Optional[float]) -> Dict[str, Any]:
+        image = decode_image(data)
+        if image is None:
+            return {'success': False, 'error': 'Cannot decode image'}
+        localization = self.detector.localize(image)
+        if not localization.found:
+            return {'success': False, 'error': 'No document detected', 'detection_strategy': localization.strategy}
+        card = self.detector.extract(image, localization)
+
+        barcode = self._read_barcode(card)
+        if hint is not None:
+            hint.publish(barcode.get('id_number'))
+
+        return {
+            'success': True,
+            'detection_strategy': localization.strategy,
+            'barcode': barcode,
+            'expiry': self._read_expiry(card, deadline)
+        }
+
+    def _read_barcode(self, card: np.ndarray) -> Dict[str, Any]:
+        if not self.barcode_reader.available:
+            return {'status': 'unavailable'}
+        gray = cv2.cvtColor(card, cv2.COLOR_BGR2GRAY) if len(card.shape) == 3 else card
+        # The strip first; the whole card if the layout is off
+        symbols = self.barcode_reader.decode(self.verifier._get_region(gray, 'barcode_region', self.config.BACK_LAYOUT))
+        if not symbols:
+            symbols = self.barcode_reader.decode(gray)
+        if not symbols:
+            return {'status': 'not_found'}
+
+        result = {'status': 'decoded', 'symbologies': [symbol['type'] for symbol in symbols], 'id_number': None}
+        for symbol in symbols:
+            validation = self._find_id_number(symbol['data'])
+            if validation is not None:
+                result.update({'id_number': validation['id_number'], 'info': validation['info']})
+                break
+        return result
+
+    def _find_id_number(self, payload: str) -> Optional[Dict]:
+        """Validation of the first valid 14-digit window of the payload's digit runs"""
+        for run in re.findall(r'\d{14,}', payload.translate(ARABIC_DIGITS)):
+            for i in range(len(run) - 13):
+                if run[i] in '23':
+                    validation = self.verifier.validator.validate(run[i:i + 14])
+                    if validation['valid']:
+                        return validation
+        return None
+
+    def _read_expiry(self, card: np.ndarray, deadline: Optional[float]) -> Dict[str, Any]:
+        ocr = self.verifier.ocr
+        if not ocr.is_available():
+            return {'status': 'unavailable'}
+        if deadline is not None and time.monotonic() >= deadline:
+            return {'status': 'deadline'}
+
+        region = self.verifier._get_region(card, 'expiry_region', self.config.BACK_LAYOUT)
+        region = self.verifier._ocr_ready(region, GlareMap.compute(region, self.config).mask)
+        if region is None:
+            return {'status': 'glare'}
+        text = ocr.extract_text(region)
+
+        expiry = parse_expiry_date(text)
+        if expiry is None:
+            return {'status': 'not_found'}
+        return {'status': 'read', 'date': expiry.isoformat(), 'expired': expiry < date.today()}
+
+    def _count(self, result: Dict[str, Any]):
+        with self._stats_lock:
+            self._counts['processed'] += 1
+            if not result['success']:
+                self._counts['not_found'] += 1
+                return
+            if result['barcode'].get('id_number'):
+                self._counts['barcode_id_numbers'] += 1
+            if result['expiry']['status'] == 'read':
+                self._counts['expiry_dates'] += 1
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            counts = dict(self._counts)
+        counts['barcode_reader'] = self.barcode_reader.available
+        return counts
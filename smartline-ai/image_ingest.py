@@ -0,0 +1,338 @@
+# image_ingest.py
+"""
+Low-copy image ingestion for the service and the batch runner.
+
+- BufferPool: downloads are streamed into reusable bytearrays (pre-sized from
+  Content-Length) instead of accumulating response.content, so a request holds
+  one compressed copy per image and steady-state traffic allocates nothing new
+- decode_image: decodes straight from any buffer (bytes, bytearray, memoryview)
+  through a zero-copy np.frombuffer view
+- decode_thumbnail: a small preview using libjpeg's DCT-domain downscaling
+  (IMREAD_REDUCED_*), a fraction of the cost of a full decode
+- MultipartIngest: multipart/form-data request bodies parsed as they stream in,
+  file parts written directly into pooled buffers (no temp files, no spooling)
+- SharedFrame: a decoded frame in a multiprocessing.shared_memory block; worker
+  processes receive a small picklable handle instead of the pixel data
+"""
+
+import sys
+import threading
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from kyc_logging import get_logger
+
+logger = get_logger("ingest")
+
+
+def decode_image(data, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """Decode an encoded image from any buffer without copying it first"""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+
+
+# Reduced decodes by factor (grayscale, color)
+_REDUCED_FLAGS = {
+    8: (cv2.IMREAD_REDUCED_GRAYSCALE_8, cv2.IMREAD_REDUCED_COLOR_8),
+    4: (cv2.IMREAD_REDUCED_GRAYSCALE_4, cv2.IMREAD_REDUCED_COLOR_4),
+    2: (cv2.IMREAD_REDUCED_GRAYSCALE_2, cv2.IMREAD_REDUCED_COLOR_2),
+    1: (cv2.IMREAD_GRAYSCALE, cv2.IMREAD_COLOR),
+}
+
+
+def decode_thumbnail(data, max_side: int, color: bool = True) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+    """
+    Decode a preview whose longest side is max_side (or the full image when smaller).
+
+    Returns (thumbnail, (width, height)) with the original size estimated from the
+    reduced decode (exact up to the reduction factor), or None if undecodable.
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    factor = 8
+    image = cv2.imdecode(buffer, _REDUCED_FLAGS[factor][color])
+    if image is None:
+        return None
+    # Too small at 1/8: decode again at the largest reduction still covering max_side
+    if max(image.shape[:2]) < max_side:
+        needed = max(image.shape[:2]) * factor / float(max_side)
+        factor = next(f for f in (4, 2, 1) if f <= needed or f == 1)
+        image = cv2.imdecode(buffer, _REDUCED_FLAGS[factor][color])
+    h, w = image.shape[:2]
+    size = (w * factor, h * factor)
+    scale = max_side / float(max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                           interpolation=cv2.INTER_AREA)
+    return image, size
+
+
+# ==================== BUFFER POOL ====================
+
+class PooledBuffer:
+    """A bytearray leased from a BufferPool; data is valid up to .length"""
+
+    def __init__(self, pool: "BufferPool", buffer: bytearray):
+        self._pool = pool
+        self.buffer = buffer
+        self.length = 0
+
+    def reserve(self, size: int):
+        """Make room for size bytes in total (grows the underlying bytearray)"""
+        if size > len(self.buffer):
+            self.buffer.extend(bytes(size - len(self.buffer)))
+
+    def write(self, chunk):
+        """Append a chunk"""
+        end = self.length + len(chunk)
+        if end > len(self.buffer):
+            self.reserve(max(end, len(self.buffer) * 2))
+        self.buffer[self.length:end] = chunk
+        self.length = end
+
+    def view(self) -> memoryview:
+        """Zero-copy view of the data (release it before the buffer goes back to the pool)"""
+        return memoryview(self.buffer)[:self.length]
+
+    def release(self):
+        """Return the buffer to its pool"""
+        if self.buffer is not None:
+            self._pool._give_back(self.buffer)
+            self.buffer = None
+
+
+class BufferPool:
+    """Reusable download buffers, bounded in count and size"""
+
+    def __init__(self, max_buffers: int = 32, initial_size: int = 1 << 20, max_pooled_size: int = 32 << 20):
+        """
+        Args:
+            max_buffers: Idle buffers kept for reuse.
+            initial_size: Size of newly allocated buffers.
+            max_pooled_size: Buffers grown beyond this are freed instead of pooled.
+        """
+        self.max_buffers = max_buffers
+        self.initial_size = initial_size
+        self.max_pooled_size = max_pooled_size
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, size_hint: int = 0) -> PooledBuffer:
+        """Lease a buffer able to hold at least size_hint bytes"""
+        with self._lock:
+            buffer = self._free.pop() if self._free else None
+            if buffer is not None:
+                self.reused += 1
+            else:
+                self.allocated += 1
+        if buffer is None:
+            buffer = bytearray(max(size_hint, self.initial_size))
+        leased = PooledBuffer(self, buffer)
+        leased.reserve(size_hint)
+        return leased
+
+    def _give_back(self, buffer: bytearray):
+        if len(buffer) > self.max_pooled_size:
+            return
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buffer)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'idle_buffers': len(self._free), 'allocated': self.allocated, 'reused': self.reused}
+
+
+async def stream_into(response, buffer: PooledBuffer):
+    """Copy an httpx streaming response body into a pooled buffer"""
+    content_length = response.headers.get('content-length')
+    if content_length and content_length.isdigit():
+        buffer.reserve(int(content_length))
+    async for chunk in response.aiter_bytes():
+        buffer.write(chunk)
+
+
+# ==================== MULTIPART UPLOADS ====================
+
+class MultipartError(ValueError):
+    """Malformed or oversized multipart body"""
+
+
+class MultipartIngest:
+    """
+    Incremental multipart/form-data parser feeding a BufferPool.
+
+    Feed body chunks as they arrive; file parts (those with a filename) land in
+    leased buffers, plain fields are collected as text.
+    """
+
+    MAX_FIELD_SIZE = 4096
+
+    def __init__(self, content_type: str, pool: BufferPool, leases: List[PooledBuffer],
+                 max_part_size: int = 20 << 20):
+        """
+        Args:
+            content_type: The request Content-Type header (must carry the boundary).
+            pool: Buffers for file parts.
+            leases: Receives every buffer leased; the caller releases them.
+            max_part_size: Largest accepted file part in bytes.
+        """
+        # Imported here: only the upload endpoint needs python-multipart
+        from multipart.multipart import MultipartParser, MultipartState, parse_options_header
+
+        mime, options = parse_options_header(content_type)
+        boundary = options.get(b'boundary')
+        if mime != b'multipart/form-data' or not boundary:
+            raise MultipartError("expected multipart/form-data with a boundary")
+
+        self.pool = pool
+        self.leases = leases
+        self.max_part_size = max_part_size
+        self.files: Dict[str, PooledBuffer] = {}
+        self.fields: Dict[str, str] = {}
+        self._parse_options_header = parse_options_header
+        self._end_state = MultipartState.END
+
+        self._header_field = b''
+        self._header_value = b''
+        self._headers: Dict[bytes, bytes] = {}
+        self._name: Optional[str] = None
+        self._target = None  # PooledBuffer or bytearray of the current part
+
+        self._parser = MultipartParser(boundary, callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def feed(self, chunk: bytes):
+        self._parser.write(chunk)
+
+    def finish(self):
+        """End of the body; raises MultipartError if it stopped before the closing boundary"""
+        self._parser.finalize()
+        # finalize() does not check this itself (python-multipart leaves it as a TODO)
+        if self._parser.state != self._end_state:
+            raise MultipartError("body ends before the closing boundary")
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._name = None
+        self._target = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, options = self._parse_options_header(self._headers.get(b'content-disposition', b''))
+        name = options.get(b'name')
+        if not name:
+            raise MultipartError("part without a name")
+        self._name = name.decode('utf-8', 'replace')
+        if b'filename' in options:
+            self._target = self.pool.acquire()
+            self.leases.append(self._target)
+        else:
+            self._target = bytearray()
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        target = self._target
+        if isinstance(target, PooledBuffer):
+            if target.length + (end - start) > self.max_part_size:
+                raise MultipartError(f"part '{self._name}' exceeds {self.max_part_size} bytes")
+            target.write(memoryview(data)[start:end])
+        else:
+            if len(target) + (end - start) > self.MAX_FIELD_SIZE:
+                raise MultipartError(f"field '{self._name}' is too long")
+            target += data[start:end]
+
+    def _on_part_end(self):
+        if isinstance(self._target, PooledBuffer):
+            self.files[self._name] = self._target
+        else:
+            self.fields[self._name] = self._target.decode('utf-8', 'replace')
+
+
+# ==================== SHARED MEMORY FRAMES ====================
+
+FrameHandle = Tuple[str, Tuple[int, ...], str]  # (shared memory name, shape, dtype)
+
+
+class SharedFrame:
+    """
+    A numpy frame in shared memory.
+
+    The producer creates it (one copy), passes .handle to a worker process and
+    unlinks it once the worker is done. The worker attaches to the handle, gets a
+    view of the same pages, and closes its mapping afterwards.
+
+    numpy views keep the mapping object alive but not pinned, so unmapping while a
+    view is still referenced would leave it dangling: close() refuses (returns
+    False) until every view handed out by .array is gone.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: str, owner: bool):
+        self._shm = shm
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.owner = owner
+        self._array = np.ndarray(self.shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        self._baseline = self._refcounts()
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "SharedFrame":
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        frame = cls(shm, array.shape, array.dtype.str, owner=True)
+        frame._array[...] = array
+        return frame
+
+    @classmethod
+    def attach(cls, handle: FrameHandle) -> "SharedFrame":
+        name, shape, dtype = handle
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    @property
+    def handle(self) -> FrameHandle:
+        return (self._shm.name, self.shape, self.dtype)
+
+    @property
+    def array(self) -> np.ndarray:
+        """The frame (a view of the shared pages, not a copy)"""
+        return self._array
+
+    def _refcounts(self) -> Tuple[int, int]:
+        # Views of the frame reference either the array or, for slices, its mmap base
+        return sys.getrefcount(self._array), sys.getrefcount(self._array.base)
+
+    def in_use(self) -> bool:
+        return any(now > base for now, base in zip(self._refcounts(), self._baseline))
+
+    def close(self) -> bool:
+        """Unmap the block; False while views of it are still alive (retry later)"""
+        if self._array is None:
+            return True
+        if self.in_use():
+            return False
+        self._array = None
+        self._shm.close()
+        return True
+
+    def unlink(self):
+        """Free the block (producer only; existing mappings stay valid until closed)"""
+        if self.owner:
+            self._shm.unlink()
@@ -0,0 +1,100 @@
+# kyc_logging.py
+"""
+Logging layer for the KYC verification service and the ID verifier.
+
+All modules log through the "kyc" logger hierarchy instead of print(), so that
+nothing is formatted or written on the request path unless it is enabled:
+
+- Levels: KYC_LOG_LEVEL (default WARNING - per-request INFO/DEBUG lines are dropped
+  before any formatting happens)
+- Sampling: KYC_LOG_SAMPLE_RATE keeps only a fraction of records below WARNING
+- Non-blocking output: records are handed to a queue and written to the stream by a
+  background QueueListener thread, so a slow or locked stdout never blocks a request
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Optional, TextIO
+
+ROOT_LOGGER_NAME = "kyc"
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a logger inside the kyc hierarchy (e.g. get_logger("verifier") -> "kyc.verifier")"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random fraction of records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+def configure_logging(level: Optional[str] = None, sample_rate: Optional[float] = None,
+                      stream: Optional[TextIO] = None) -> logging.Logger:
+    """
+    Configure the kyc logger hierarchy (safe to call more than once - last call wins).
+
+    Args:
+        level: Log level name. Defaults to KYC_LOG_LEVEL or WARNING (quiet).
+        sample_rate: Fraction of sub-WARNING records to keep. Defaults to KYC_LOG_SAMPLE_RATE or 1.0.
+        stream: Output stream for the background writer. Defaults to stderr.
+    """
+    global _listener
+
+    level = (level or os.getenv("KYC_LOG_LEVEL", "WARNING")).upper()
+    if sample_rate is None:
+        sample_rate = float(os.getenv("KYC_LOG_SAMPLE_RATE", 1.0))
+
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel(level)
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        stream_handler = logging.StreamHandler(stream or sys.stderr)
+        stream_handler.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+        root.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+
+    return root
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
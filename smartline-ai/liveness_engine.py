@@ -0,0 +1,521 @@
+# liveness_engine.py
+"""
+Resolution-normalized selfie liveness checks.
+
+Phone selfies arrive anywhere from VGA to 50 MP, and most of their pixels are
+background. LivenessEngine therefore:
+
+1. Resizes the frame so its longest side is FRAME_SIDE and detects faces there
+2. Rejects immediately unless exactly one face is found
+3. Cuts the face box, padded by FACE_PADDING on each side, and resizes it to
+   CROP_SIDE x CROP_SIDE
+
+Blur, brightness, edge, moire, skin and texture analyses run only on that face
+ROI, so per-selfie cost is constant, thresholds are resolution independent and
+background patterns (screens, tiles, fabric) no longer trigger the moire check.
+The scale from original pixels to the ROI is reported in the result.
+
+TemporalLivenessAnalyzer extends this to a selfie video or frame burst, decoded
+and analyzed one frame at a time (see its docstring).
+"""
+
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from face_detection import FaceDetector, create_face_detector, filter_face_sizes
+from image_ingest import decode_image
+from production_egyptian_id_verifier_enhanced import SpectralAnalyzer
+
+
+class LivenessEngine:
+    """Selfie liveness checks on a canonical face ROI"""
+
+    FRAME_SIDE = 640  # longest side of the normalized frame used for face detection
+    CROP_SIDE = 256  # side of the canonical face ROI all checks run on
+    FACE_PADDING = 0.2  # ROI padding on each side, relative to the face size
+    MIN_FACE_SIDE = 40  # smallest face on the normalized frame
+
+    # Thresholds, in canonical-crop units
+    BLUR_THRESHOLD = 100.0
+    DARK_THRESHOLD = 40
+    OVEREXPOSED_THRESHOLD = 220
+    MOIRE_THRESHOLD = 50
+    SKIN_RATIO_THRESHOLD = 0.05
+    TEXTURE_THRESHOLD = 20
+
+    def __init__(self, face_detector: Optional[FaceDetector] = None):
+        """
+        Args:
+            face_detector: Detector used on the normalized frame (default: create_face_detector()).
+        """
+        self.face_detector = face_detector or create_face_detector(scale_factor=1.1, min_neighbors=5)
+        # CascadeClassifier is not safe to share between threads
+        self._local = threading.local()
+
+    def _cascade(self, name: str) -> cv2.CascadeClassifier:
+        cascades = getattr(self._local, 'cascades', None)
+        if cascades is None:
+            cascades = self._local.cascades = {}
+        if name not in cascades:
+            cascades[name] = cv2.CascadeClassifier(cv2.data.haarcascades + name)
+        return cascades[name]
+
+    @classmethod
+    def normalize(cls, image: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Resize so the longest side is FRAME_SIDE; returns (frame, scale)"""
+        h, w = image.shape[:2]
+        scale = cls.FRAME_SIDE / float(max(h, w))
+        if scale == 1.0:
+            return image, scale
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        frame = cv2.resize(image, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                           interpolation=interpolation)
+        return frame, scale
+
+    def detect_faces(self, frame: np.ndarray) -> np.ndarray:
+        """Faces of a normalized frame (BGR or gray); smaller previews scale MIN_FACE_SIDE down"""
+        min_side = int(round(self.MIN_FACE_SIDE * max(frame.shape[:2]) / float(self.FRAME_SIDE)))
+        return self.face_detector.detect(frame, min_size=(min_side, min_side))
+
+    def _face_roi(self, frame_shape: Tuple[int, ...], face: np.ndarray) -> Tuple[int, int, int]:
+        """Square (x, y, side) in frame coordinates around the padded face, kept inside the frame"""
+        h, w = frame_shape[:2]
+        x, y, fw, fh = face
+        side = int(min(max(fw, fh) * (1 + 2 * self.FACE_PADDING), h, w))
+        cx, cy = x + fw / 2.0, y + fh / 2.0
+        x0 = int(round(min(max(cx - side / 2.0, 0), w - side)))
+        y0 = int(round(min(max(cy - side / 2.0, 0), h - side)))
+        return x0, y0, side
+
+    def check(self, image: np.ndarray) -> Dict[str, Any]:
+        """
+        Check if the selfie is a real human (liveness detection).
+        Detects signs of a photo-of-photo or screen capture.
+        """
+        frame, frame_scale = self.normalize(image)
+        return self.check_normalized(frame, frame_scale)
+
+    def check_normalized(self, frame: np.ndarray, frame_scale: float, faces: Optional[np.ndarray] = None,
+                         keep_face: bool = False) -> Dict[str, Any]:
+        """
+        check() for a frame already normalized; faces may come from an earlier (batched) detection.
+        keep_face=True adds 'face': (frame, face box) for later stages (face matching).
+        """
+        if faces is None:
+            faces = self.detect_faces(frame)
+        else:
+            faces = filter_face_sizes(faces, (self.MIN_FACE_SIDE, self.MIN_FACE_SIDE))
+        if len(faces) != 1:
+            return self._no_single_face(len(faces), frame_scale)
+        result = self.analyze_face(frame, frame_scale, faces[0])
+        if keep_face:
+            result["face"] = (frame, faces[0])
+        return result
+
+    def face_crop(self, frame: np.ndarray, face: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int, int], float]:
+        """Canonical CROP_SIDE ROI around a face of a normalized frame; returns (crop, (x, y, side), scale)"""
+        x0, y0, side = self._face_roi(frame.shape, face)
+        crop_scale = self.CROP_SIDE / float(side)
+        crop = cv2.resize(frame[y0:y0 + side, x0:x0 + side], (self.CROP_SIDE, self.CROP_SIDE),
+                          interpolation=cv2.INTER_AREA if crop_scale < 1.0 else cv2.INTER_LINEAR)
+        return crop, (x0, y0, side), crop_scale
+
+    @classmethod
+    def image_quality(cls, gray: np.ndarray) -> Dict[str, Any]:
+        """Blur and exposure of a grayscale canonical face crop"""
+        blur_score = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        brightness = float(np.mean(gray))
+        return {
+            "blur_score": blur_score,
+            "brightness_score": brightness,
+            "is_blurry": blur_score < cls.BLUR_THRESHOLD,
+            "is_dark": brightness < cls.DARK_THRESHOLD,
+            "is_overexposed": brightness > cls.OVEREXPOSED_THRESHOLD
+        }
+
+    def analyze_face(self, frame: np.ndarray, frame_scale: float, face: np.ndarray) -> Dict[str, Any]:
+        """Single-frame checks for one face (x, y, w, h) of a normalized frame"""
+        crop, (x0, y0, side), crop_scale = self.face_crop(frame, face)
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        face = np.asarray(face)
+
+        # 1. Image quality checks
+        quality = self.image_quality(gray)
+        blur_score, avg_brightness = quality["blur_score"], quality["brightness_score"]
+        is_blurry, is_dark, is_overexposed = quality["is_blurry"], quality["is_dark"], quality["is_overexposed"]
+
+        # 2. Screen/print detection - check for moire patterns and unnatural edges
+        edges = cv2.Canny(gray, 50, 150)
+        edge_density = np.sum(edges > 0) / edges.size
+
+        # Screens have peaks at specific frequencies
+        spectrum = SpectralAnalyzer.analyze(gray, max_side=None)
+        pattern_ratio = spectrum['peak_ratio']
+        has_moire = pattern_ratio > self.MOIRE_THRESHOLD
+
+        # 3. Skin tone detection - real faces have natural skin tones
+        hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+        skin_mask = cv2.inRange(hsv, np.array([0, 20, 70]), np.array([20, 255, 255]))
+        skin_ratio = np.sum(skin_mask > 0) / skin_mask.size
+        has_skin_tone = skin_ratio > self.SKIN_RATIO_THRESHOLD
+
+        # 4. Texture analysis - real faces have natural texture variation (face box, without padding)
+        fx, fy, fw, fh = ((face - [x0, y0, 0, 0]) * crop_scale).round().astype(int)
+        face_region = gray[max(fy, 0):fy + fh, max(fx, 0):fx + fw]
+        texture_score = np.std(face_region) if face_region.size > 0 else 0.0
+        has_natural_texture = texture_score > self.TEXTURE_THRESHOLD
+
+        # Decision
+        quality_passed = not (is_blurry or is_dark or is_overexposed)
+        liveness_passed = not has_moire and has_skin_tone and has_natural_texture and quality_passed
+
+        message = "Liveness check passed"
+        if has_moire:
+            message = "Possible screen/photo detected (moire pattern)"
+        elif not has_skin_tone:
+            message = "No natural skin tone detected"
+        elif not has_natural_texture:
+            message = "Unnatural face texture (possible print/screen)"
+        elif is_blurry:
+            message = "Image is too blurry"
+        elif is_dark:
+            message = "Image is too dark"
+        elif is_overexposed:
+            message = "Image is overexposed"
+
+        # ROI in original image coordinates
+        crop_box = [int(round(v / frame_scale)) for v in (x0, y0, side, side)]
+
+        return {
+            "passed": bool(liveness_passed),
+            "face_detected": True,
+            "face_count": 1,
+            "blur_score": float(blur_score),
+            "brightness_score": float(avg_brightness),
+            "edge_density": float(edge_density),
+            "skin_tone_ratio": float(skin_ratio),
+            "texture_score": float(texture_score),
+            "moire_detected": bool(has_moire),
+            "moire_ratio": float(pattern_ratio),
+            "scale": float(frame_scale * crop_scale),
+            "canonical_crop": crop_box,
+            "canonical_size": self.CROP_SIDE,
+            "message": message
+        }
+
+    def _no_single_face(self, face_count: int, frame_scale: float) -> Dict[str, Any]:
+        """Early rejection: nothing beyond face detection is computed"""
+        return {
+            "passed": False,
+            "face_detected": False,
+            "face_count": face_count,
+            "blur_score": 0.0,
+            "brightness_score": 0.0,
+            "edge_density": 0.0,
+            "skin_tone_ratio": 0.0,
+            "texture_score": 0.0,
+            "moire_detected": False,
+            "moire_ratio": 0.0,
+            "scale": float(frame_scale),
+            "canonical_crop": None,
+            "canonical_size": self.CROP_SIDE,
+            "message": f"Face detection failed (found {face_count} faces, need exactly 1)"
+        }
+
+
+# ==================== VIDEO / BURST FRAMES ====================
+
+def iter_video_frames(data, max_fps: float = 15.0) -> Iterator[np.ndarray]:
+    """
+    Decode a short video (mp4/webm/...) one frame at a time.
+
+    Frames beyond max_fps are grabbed but not decoded. OpenCV can only open
+    containers from a path, so the bytes are spooled to a temporary file that is
+    removed when the generator finishes or is closed.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.video') as spool:
+        spool.write(data)
+        spool.flush()
+        capture = cv2.VideoCapture(spool.name)
+        try:
+            fps = capture.get(cv2.CAP_PROP_FPS) or max_fps
+            step = max(1, int(round(fps / max_fps)))
+            while True:
+                for _ in range(step - 1):
+                    if not capture.grab():
+                        return
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame
+        finally:
+            capture.release()
+
+
+def iter_burst_frames(buffers: List[Any]) -> Iterator[np.ndarray]:
+    """Decode a burst of encoded stills lazily, in order (undecodable stills are skipped)"""
+    for data in buffers:
+        frame = decode_image(data)
+        if frame is not None:
+            yield frame
+
+
+# ==================== TEMPORAL LIVENESS ====================
+
+class TemporalLivenessAnalyzer:
+    """
+    Liveness from a selfie video or burst, one frame at a time.
+
+    Faces are detected every DETECT_EVERY frames; in between the face box follows
+    Lucas-Kanade optical flow of corner points inside it. Only the previous gray
+    frame, the tracked points and the sharpest frame so far are kept in memory.
+
+    Temporal signals:
+    - blink: both eyes detected for BLINK_MIN_OPEN_FRAMES, neither for at most
+      BLINK_MAX_FRAMES, then both again for BLINK_MIN_OPEN_FRAMES. A frame with
+      one eye breaks the pattern, so cascade misses on a photo do not add up to blinks
+    - parallax: residual of the tracked face points after fitting one homography
+      from the anchor (last detection) frame; a flat photo or screen moves as a
+      plane and leaves almost no residual, a real head does not
+    - texture consistency: coefficient of variation of the face texture over frames
+
+    Passing needs both a blink and parallax. The single-frame LivenessEngine
+    checks run once, on the sharpest frame. Analysis (and decoding, when the
+    frames come from a generator) stops as soon as blink and parallax are both
+    established, as soon as the face is lost or a second face appears, or at the
+    deadline.
+    """
+
+    DETECT_EVERY = 5  # frames between face detections
+    MAX_FRAMES = 90  # analyzed frames before deciding with what was seen
+    MIN_FRAMES = 8  # analyzed frames before an early pass
+    MAX_MISSED_DETECTIONS = 2  # consecutive detections without a face before rejecting
+    MIN_TRACK_POINTS = 8
+    BLINK_MIN_OPEN_FRAMES = 2  # eyes-open frames needed before and after the closed run
+    BLINK_MAX_FRAMES = 4  # longest eyes-closed run counted as a blink
+    MIN_MOTION = 0.02  # median point motion (fraction of face size) before parallax is measured
+    PARALLAX_THRESHOLD = 0.01  # homography residual, upper quartile (fraction of face size)
+    MIN_PARALLAX_PAIRS = 3
+    TEXTURE_CV_MAX = 0.25
+
+    _LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                      criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    def __init__(self, engine: LivenessEngine):
+        self.engine = engine
+
+    def _track_points(self, gray: np.ndarray, face: np.ndarray) -> Optional[np.ndarray]:
+        x, y, w, h = face
+        mask = np.zeros_like(gray)
+        mask[y:y + h, x:x + w] = 255
+        return cv2.goodFeaturesToTrack(gray, maxCorners=60, qualityLevel=0.01, minDistance=5, mask=mask)
+
+    def _eye_state(self, gray: np.ndarray, face: np.ndarray) -> Optional[bool]:
+        """True: an eye found in each half of the eye band; False: none; None: one side only"""
+        x, y, w, h = face
+        eye_band = gray[max(y + h // 5, 0):y + h // 2, max(x, 0):x + w]
+        if eye_band.size == 0:
+            return None
+        eye_band = cv2.resize(eye_band, (128, max(1, 128 * eye_band.shape[0] // eye_band.shape[1])))
+        eyes = self.engine._cascade('haarcascade_eye.xml').detectMultiScale(
+            eye_band, scaleFactor=1.1, minNeighbors=4, minSize=(12, 12))
+        sides = {bool(ex + ew / 2.0 >= 64) for ex, _, ew, _ in eyes}
+        if len(sides) == 2:
+            return True
+        return False if not sides else None
+
+    def analyze(self, frames: Iterable[np.ndarray], keep_face: bool = False,
+                deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run the temporal checks over frames (any iterable; generators are closed on early stop).
+        keep_face=True adds 'face': (sharpest frame, face box) for later stages.
+        deadline (time.monotonic()) ends the analysis; the decision uses the frames seen so far.
+        """
+        engine = self.engine
+        frames_analyzed = 0
+        detections = missed = 0
+        face = None
+        prev_gray = anchor_points = points = None
+        frame_scale = 1.0
+
+        blink_count = 0
+        open_run = closed_run = 0
+        opened_before = reopening = False  # long enough open run before / after the closed run
+        parallax_residuals: List[float] = []
+        texture_scores: List[float] = []
+        best_frame, best_face, best_sharpness = None, None, -1.0
+        rejection = None
+        stopped_early = deadline_reached = False
+
+        frame_iter = iter(frames)
+        try:
+            for image in frame_iter:
+                if deadline is not None and time.monotonic() >= deadline:
+                    deadline_reached = True
+                    break
+                frame, frame_scale = engine.normalize(image)
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+                # Face: periodic detection, optical flow in between
+                if face is None or frames_analyzed % self.DETECT_EVERY == 0 or points is None \
+                        or len(points) < self.MIN_TRACK_POINTS:
+                    faces = engine.detect_faces(frame)
+                    detections += 1
+                    if len(faces) > 1:
+                        rejection = f"Multiple faces in the selfie video (found {len(faces)})"
+                        break
+                    if len(faces) == 0:
+                        missed += 1
+                        if missed >= self.MAX_MISSED_DETECTIONS:
+                            rejection = "Face lost during the selfie video"
+                            break
+                        prev_gray = None
+                        open_run = closed_run = 0
+                        opened_before = reopening = False
+                        continue
+                    missed = 0
+                    face = faces[0]
+                    anchor_points = points = self._track_points(gray, face)
+                elif prev_gray is not None:
+                    new_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None, **self._LK_PARAMS)
+                    keep = status.ravel() == 1
+                    moved, old = new_points[keep], points[keep]
+                    anchor_points = anchor_points[keep]
+                    points = moved
+                    if len(points) >= self.MIN_TRACK_POINTS:
+                        # Follow the face box with the median shift and spread change
+                        shift = np.median(moved - old, axis=0).ravel()
+                        spread_old = np.median(np.linalg.norm(old - old.mean(axis=0), axis=2))
+                        spread_new = np.median(np.linalg.norm(moved - moved.mean(axis=0), axis=2))
+                        zoom = spread_new / spread_old if spread_old > 0 else 1.0
+                        x, y, w, h = face
+                        cx, cy = x + w / 2.0 + shift[0], y + h / 2.0 + shift[1]
+                        w, h = w * zoom, h * zoom
+                        face = np.array([cx - w / 2.0, cy - h / 2.0, w, h]).round().astype(np.int32)
+                        residual = self._parallax_residual(anchor_points, points, face[2])
+                        if residual is not None:
+                            parallax_residuals.append(residual)
+
+                prev_gray = gray
+                frames_analyzed += 1
+
+                # Blink: open -> closed for a few frames -> open
+                eyes_open = self._eye_state(gray, face)
+                if eyes_open is None:
+                    open_run = closed_run = 0
+                    opened_before = reopening = False
+                elif eyes_open:
+                    if closed_run:
+                        reopening = opened_before and closed_run <= self.BLINK_MAX_FRAMES
+                        open_run = closed_run = 0
+                    open_run += 1
+                    if reopening and open_run >= self.BLINK_MIN_OPEN_FRAMES:
+                        blink_count += 1
+                        reopening = False
+                else:
+                    if open_run:
+                        opened_before = open_run >= self.BLINK_MIN_OPEN_FRAMES
+                        open_run = 0
+                        reopening = False
+                    closed_run += 1
+
+                # Texture and sharpest frame
+                crop, _, _ = engine.face_crop(frame, face)
+                crop_gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+                texture_scores.append(float(np.std(crop_gray)))
+                sharpness = cv2.Laplacian(crop_gray, cv2.CV_64F).var()
+                if sharpness > best_sharpness:
+                    best_frame, best_face, best_sharpness = frame.copy(), face.copy(), sharpness
+
+                if frames_analyzed >= self.MAX_FRAMES:
+                    break
+                if (frames_analyzed >= self.MIN_FRAMES and blink_count > 0
+                        and len(parallax_residuals) >= self.MIN_PARALLAX_PAIRS
+                        and float(np.median(parallax_residuals)) > self.PARALLAX_THRESHOLD):
+                    stopped_early = True
+                    break
+        finally:
+            # Stop decoding right away
+            close = getattr(frame_iter, 'close', None)
+            if close is not None:
+                close()
+
+        result = self._decide(frames_analyzed, detections, rejection, stopped_early, deadline_reached,
+                              blink_count, parallax_residuals, texture_scores, best_frame, best_face,
+                              frame_scale)
+        if keep_face and best_frame is not None:
+            result["face"] = (best_frame, best_face)
+        return result
+
+    @classmethod
+    def _parallax_residual(cls, anchor: np.ndarray, current: np.ndarray, face_side: float) -> Optional[float]:
+        """Residual (fraction of face size) of the points after one homography, None without enough motion"""
+        if len(current) < cls.MIN_TRACK_POINTS or face_side <= 0:
+            return None
+        motion = np.median(np.linalg.norm(current - anchor, axis=2)) / face_side
+        if motion < cls.MIN_MOTION:
+            return None
+        homography, _ = cv2.findHomography(anchor, current, cv2.RANSAC, 3.0)
+        if homography is None:
+            return None
+        projected = cv2.perspectiveTransform(anchor.astype(np.float32), homography)
+        # Upper quartile: parallax shows on the parts of the face off the dominant plane
+        return float(np.percentile(np.linalg.norm(projected - current, axis=2), 75) / face_side)
+
+    def _decide(self, frames_analyzed: int, detections: int, rejection: Optional[str], stopped_early: bool,
+                deadline_reached: bool, blink_count: int, parallax_residuals: List[float], texture_scores: List[float],
+                best_frame: Optional[np.ndarray], best_face: Optional[np.ndarray],
+                frame_scale: float) -> Dict[str, Any]:
+        if best_frame is not None:
+            still = self.engine.analyze_face(best_frame, frame_scale, best_face)
+        else:
+            still = self.engine._no_single_face(0, frame_scale)
+
+        parallax_score = float(np.median(parallax_residuals)) if parallax_residuals else 0.0
+        has_parallax = len(parallax_residuals) >= self.MIN_PARALLAX_PAIRS and parallax_score > self.PARALLAX_THRESHOLD
+        texture_cv = float(np.std(texture_scores) / np.mean(texture_scores)) \
+            if texture_scores and np.mean(texture_scores) > 0 else 0.0
+        texture_consistent = texture_cv <= self.TEXTURE_CV_MAX
+
+        passed = (rejection is None and still["passed"] and texture_consistent
+                  and blink_count > 0 and has_parallax)
+
+        # Cut off by the deadline before anything failed: inconclusive rather than failed
+        timed_out = (deadline_reached and not passed and rejection is None
+                     and (best_frame is None or (still["passed"] and texture_consistent)))
+        message = "Liveness check passed"
+        if rejection is not None:
+            message = rejection
+        elif timed_out:
+            message = "Selfie video not fully analyzed within the time budget"
+        elif not still["passed"]:
+            message = still["message"]
+        elif not texture_consistent:
+            message = "Face texture changes between frames (possible replay)"
+        elif blink_count == 0 and not has_parallax:
+            message = "No blink or head movement detected"
+        elif blink_count == 0:
+            message = "No blink detected"
+        elif not has_parallax:
+            message = "No head movement detected (possible photo or screen)"
+
+        details = dict(still)
+        details.update({
+            "passed": bool(passed),
+            "mode": "temporal",
+            "frames_analyzed": frames_analyzed,
+            "face_detections": detections,
+            "stopped_early": stopped_early,
+            "timed_out": timed_out,
+            "blink_count": blink_count,
+            "parallax_score": parallax_score,
+            "parallax_detected": has_parallax,
+            "texture_consistency": texture_cv,
+            "message": message
+        })
+        return details
@@ -14,22 +14,37 @@ import numpy as np
 from datetime import datetime
 import os
 import re
-from typing import Dict, Optional, Tuple, List
-import glob
+import json
+import hashlib
+from typing import Dict, Optional, Tuple, List, Any, Callable
 from dataclasses import dataclass, field
 from enum import Enum
 import threading
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+from kyc_logging import get_logger, configure_logging
+from artifact_writer import ArtifactWriter
+from face_detection import create_face_detector, filter_face_sizes
+
+logger = get_logger("verifier")
 
 # ==================== ENHANCED CONFIGURATION ====================
 class EnhancedConfig:
     """Enhanced system configuration based on actual ID analysis"""
     
+    # Bump when detection/scoring code changes in a way that alters results
+    PIPELINE_VERSION = '2.0'
+    
     # Tesseract path
     TESSERACT_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
     
     # ===== PHYSICAL SPECIFICATIONS =====
     ASPECT_RATIO_TARGET = 1.586
     ASPECT_RATIO_TOLERANCE = 0.18
+    ASPECT_RATIO_MIN_SCORE = 0.40  # aspect_ratio_score() needed to pass
     
     # ===== LAYOUT SPECIFICATIONS =====
     LAYOUT = {
@@ -59,6 +74,18 @@ class EnhancedConfig:
         }
     }
     
+    # Back of the card (id_back), same normalized coordinates on the rectified card
+    BACK_LAYOUT = {
+        'expiry_region': {
+            'x_start': 0.25, 'x_end': 1.0,
+            'y_start': 0.45, 'y_end': 0.72
+        },
+        'barcode_region': {
+            'x_start': 0.0, 'x_end': 1.0,
+            'y_start': 0.65, 'y_end': 1.0
+        }
+    }
+    
     # ===== ADAPTIVE COLOR ANALYSIS (FIX FOR ISSUE 3) =====
     # Base reference colors - will be adapted based on lighting
     COLOR_REFERENCES = {
@@ -103,6 +130,17 @@ class EnhancedConfig:
         'value_normalization': True
     }
     
+    # ===== GLARE =====
+    # Specular highlights on the laminate: near-white (high value, low saturation)
+    # blobs of at least min_blob_area pixels, grown by dilate pixels to cover the halo
+    GLARE = {
+        'value_min': 245,
+        'saturation_max': 30,
+        'min_blob_area': 40,
+        'dilate': 7,
+        'ocr_skip_ratio': 0.40  # OCR regions with more glare than this are not read
+    }
+    
     # ===== TEXT KEYWORDS =====
     ARABIC_KEYWORDS = {
         'header': ['جمهورية', 'مصر', 'العربية', 'بطاقة', 'تحقيق', 'الشخصية'],
@@ -139,6 +177,57 @@ class EnhancedConfig:
     CONFIDENCE_THRESHOLD_NO_ID = 0.65 
     ID_NUMBER_OVERRIDE = 0.92
     HIGH_CONFIDENCE = 0.70
+    # Confidence bands callers act on (the service approves from HIGH_CONFIDENCE,
+    # sends REVIEW_CONFIDENCE and above to manual review, rejects below)
+    REVIEW_CONFIDENCE = 0.50
+    
+    # ===== EVALUATION SCHEDULE =====
+    # Relative cost of each feature check (OCR checks dominate)
+    FEATURE_COSTS = {
+        'aspect_ratio': 1,
+        'layout_structure': 8,
+        'photo_left_side': 20,
+        'pyramids_sphinx': 10,
+        'eagle_emblem': 15,
+        'arabic_header': 60,
+        'color_scheme': 25,
+        'security_pattern': 8,
+        'id_number_valid': 150
+    }
+    # Score given to checks skipped once the decision was fixed
+    NEUTRAL_SCORE = 0.5
+    
+    # ===== PARALLEL EXECUTION =====
+    # Feature checks are independent and run on a shared thread pool of
+    # max_workers * concurrent_verifications + straggler_workers threads
+    PARALLEL_EXECUTION = {
+        'max_workers': 4,  # checks in flight per verification; 1 = run inline, one after another
+        'concurrent_verifications': 4,  # verifications expected to run at once
+        'straggler_workers': 8,  # room for abandoned checks that are still running
+        'time_budget_seconds': 20.0  # per verification
+    }
+    
+    # ===== DEADLINES =====
+    # Per-check budgets in seconds, counted from when the check starts. A check over
+    # budget is abandoned and scored NEUTRAL_SCORE with timed_out set
+    FEATURE_DEADLINES = {
+        'aspect_ratio': 0.5,
+        'layout_structure': 2.0,
+        'photo_left_side': 3.0,
+        'pyramids_sphinx': 3.0,
+        'eagle_emblem': 3.0,
+        'arabic_header': 8.0,
+        'color_scheme': 3.0,
+        'security_pattern': 2.0,
+        'id_number_valid': 12.0
+    }
+    
+    @classmethod
+    def fingerprint(cls) -> str:
+        """Hash of every setting (thresholds, weights, layout, ...) and the pipeline version"""
+        settings = {name: getattr(cls, name) for name in dir(cls) if name.isupper()}
+        encoded = json.dumps(settings, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.blake2b(encoded, digest_size=8).hexdigest()
     
     # ===== OCR SETTINGS =====
     USE_EASYOCR = True
@@ -150,7 +239,8 @@ class EnhancedConfig:
         'scaleFactor': 1.05,
         'minNeighbors': 3,
         'minSize': (20, 20),
-        'maxSize': (180, 180)
+        'maxSize': (180, 180),
+        'dnn_confidence': 0.5  # DNN backend only (KYC_FACE_DETECTOR=dnn)
     }
     
     CIRCLE_DETECTION = {
@@ -179,6 +269,25 @@ class FeatureResult:
     score: float
     message: str
     details: Dict = field(default_factory=dict)
+    timed_out: bool = False
+
+
+def aspect_ratio_score(aspect: float, config=EnhancedConfig) -> Tuple[float, float]:
+    """(score, relative error) of a card aspect ratio against the ID-1 target"""
+    target = config.ASPECT_RATIO_TARGET
+    distance = abs(aspect - target) / target
+    
+    if distance < 0.03:
+        score = 1.0
+    elif distance < 0.07:
+        score = 0.85
+    elif distance < 0.12:
+        score = 0.65
+    elif distance < config.ASPECT_RATIO_TOLERANCE:
+        score = 0.45
+    else:
+        score = 0.20
+    return score, distance
 
 
 # ==================== LIGHTING CONDITION ESTIMATOR (FIX FOR ISSUE 3) ====================
@@ -336,6 +445,118 @@ class LightingConditionEstimator:
         return normalized
 
 
+# ==================== SPECTRAL ANALYSIS ====================
+class SpectralAnalyzer:
+    """
+    Shared FFT helper for moire and pattern-regularity checks.
+
+    Works on a downscaled, DFT-size padded copy of the input and uses a real FFT,
+    so only the non-redundant half of the spectrum is computed. Peaks are read
+    directly from the unshifted layout (DC at [0, 0]) - no fftshift copies.
+    """
+
+    # Longest side of the analysed image; keeps cost and ratios independent of upload size
+    MAX_SIDE = 512
+
+    @staticmethod
+    def _prepare(gray: np.ndarray, max_side: Optional[int]) -> Tuple[np.ndarray, float]:
+        """Downscale, remove the mean and zero-pad to an optimal DFT size"""
+        h, w = gray.shape[:2]
+        scale = 1.0
+        if max_side and max(h, w) > max_side:
+            scale = max_side / float(max(h, w))
+            gray = cv2.resize(gray, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                              interpolation=cv2.INTER_AREA)
+            h, w = gray.shape[:2]
+
+        # Mean removal keeps the zero padding from adding a step edge to the spectrum
+        data = gray.astype(np.float32)
+        data -= data.mean()
+
+        padded_h, padded_w = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+        if (padded_h, padded_w) != (h, w):
+            data = cv2.copyMakeBorder(data, 0, padded_h - h, 0, padded_w - w,
+                                      cv2.BORDER_CONSTANT, value=0)
+        return data, scale
+
+    @staticmethod
+    def analyze(gray: np.ndarray, max_side: Optional[int] = MAX_SIDE,
+                dc_radius: int = 5, peak_threshold: float = 0.3) -> Dict:
+        """
+        Compute spectral peak statistics of a grayscale image.
+
+        Returns:
+            peak_ratio: max / mean magnitude outside the DC neighbourhood
+            peak_count: number of bins above peak_threshold * max, counted over
+                        the full (two-sided) spectrum
+        """
+        data, scale = SpectralAnalyzer._prepare(gray, max_side)
+        magnitude = np.abs(np.fft.rfft2(data))
+
+        # Exclude the DC neighbourhood: low frequencies sit in the first rows,
+        # the last rows (negative vertical frequencies) and the first columns
+        r = dc_radius
+        magnitude[:r, :r] = 0
+        magnitude[-r:, :r] = 0
+
+        max_mag = float(magnitude.max())
+        avg_mag = float(magnitude.mean())
+        peak_ratio = max_mag / avg_mag if avg_mag > 0 else 0.0
+
+        peak_count = 0
+        if max_mag > 0:
+            above = magnitude > peak_threshold * max_mag
+            # Every column except DC (and Nyquist for even widths) has a mirrored twin
+            peak_count = 2 * int(np.count_nonzero(above)) - int(np.count_nonzero(above[:, 0]))
+            if data.shape[1] % 2 == 0:
+                peak_count -= int(np.count_nonzero(above[:, -1]))
+
+        return {
+            'peak_ratio': peak_ratio,
+            'peak_count': peak_count,
+            'scale': scale,
+            'analysis_shape': data.shape
+        }
+
+
+# ==================== GLARE MAP ====================
+@dataclass
+class GlareMap:
+    """Specular glare on a rectified card, computed once and shared by the feature checks"""
+    mask: np.ndarray  # uint8, 255 = glare, same size as the card
+    ratio: float  # share of the card under glare
+    
+    @classmethod
+    def compute(cls, image: np.ndarray, config=EnhancedConfig) -> "GlareMap":
+        settings = config.GLARE
+        if len(image.shape) == 3:
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            mask = cv2.inRange(hsv, np.array([0, 0, settings['value_min']]),
+                               np.array([179, settings['saturation_max'], 255]))
+        else:
+            mask = cv2.inRange(image, settings['value_min'], 255)
+        
+        # Highlights are blobs; isolated bright pixels are print or noise
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        keep = stats[:, cv2.CC_STAT_AREA] >= settings['min_blob_area']
+        keep[0] = False
+        if not keep.any():
+            return cls(np.zeros_like(mask), 0.0)
+        if not keep[1:].all():
+            mask = (keep * 255).astype(np.uint8)[labels]
+        if settings['dilate'] > 0:
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (settings['dilate'], settings['dilate']))
+            mask = cv2.dilate(mask, kernel)
+        return cls(mask, float(np.count_nonzero(mask)) / mask.size)
+    
+    @staticmethod
+    def coverage(mask: Optional[np.ndarray]) -> float:
+        """Share of a (region of the) glare mask under glare"""
+        if mask is None or mask.size == 0:
+            return 0.0
+        return float(np.count_nonzero(mask)) / mask.size
+
+
 # ==================== ADAPTIVE COLOR DETECTOR (FIX FOR ISSUE 3) ====================
 class AdaptiveColorDetector:
     """Adaptive color detection that handles various lighting conditions"""
@@ -397,8 +618,13 @@ class AdaptiveColorDetector:
         
         return adapted_ranges
     
-    def analyze_colors(self, image: np.ndarray, use_normalization: bool = True) -> Dict:
-        """Analyze colors with adaptive detection"""
+    def analyze_colors(self, image: np.ndarray, use_normalization: bool = True,
+                       exclude_mask: Optional[np.ndarray] = None) -> Dict:
+        """
+        Analyze colors with adaptive detection.
+        
+        Pixels set in exclude_mask (glare) count neither as color nor in the coverage denominator.
+        """
         if len(image.shape) != 3:
             return {'error': 'Grayscale image', 'colors_detected': [], 'total_score': 0}
         
@@ -417,11 +643,19 @@ class AdaptiveColorDetector:
         color_scores = {}
         colors_detected = []
         
+        valid = None
+        valid_count = hsv.shape[0] * hsv.shape[1]
+        if exclude_mask is not None and np.any(exclude_mask):
+            valid = cv2.bitwise_not(exclude_mask)
+            valid_count = int(np.count_nonzero(valid))
+        
         for color_name, color_spec in adaptive_ranges.items():
             mask = cv2.inRange(hsv,
                                np.array(color_spec['hsv_lower']),
                                np.array(color_spec['hsv_upper']))
-            coverage = np.sum(mask > 0) / mask.size
+            if valid is not None:
+                mask = cv2.bitwise_and(mask, valid)
+            coverage = np.count_nonzero(mask) / valid_count if valid_count else 0.0
             
             color_scores[color_name] = {
                 'coverage': float(coverage),
@@ -452,8 +686,8 @@ class AdaptiveColorDetector:
             'adaptive_ranges': adaptive_ranges
         }
     
-    def detect_color_relationships(self, image: np.ndarray) -> Dict:
-        """Detect relative color relationships rather than absolute values"""
+    def detect_color_relationships(self, image: np.ndarray, exclude_mask: Optional[np.ndarray] = None) -> Dict:
+        """Detect relative color relationships rather than absolute values (exclude_mask: glare)"""
         if len(image.shape) != 3:
             return {'valid': False, 'reason': 'Grayscale image'}
         
@@ -461,7 +695,8 @@ class AdaptiveColorDetector:
         h, s, v = cv2.split(hsv)
         
         # Analyze hue histogram
-        hue_hist = cv2.calcHist([h], [0], None, [180], [0, 180]).flatten()
+        valid = cv2.bitwise_not(exclude_mask) if exclude_mask is not None and np.any(exclude_mask) else None
+        hue_hist = cv2.calcHist([h], [0], valid, [180], [0, 180]).flatten()
         hist_sum = hue_hist.sum()
         if hist_sum > 0:
             hue_hist = hue_hist / hist_sum  # Normalize
@@ -524,12 +759,13 @@ class OCREngineSingleton:
             self.engines = []
             self.reader = None  # EasyOCR reader
             self._tesseract_available = False
+            self._easyocr_seconds = 0.0  # running average of a readtext() call
             
             self._init_tesseract()
             self._init_easyocr()
             
             if not self.engines:
-                print("[WARN] WARNING: No OCR engines available!")
+                logger.warning("No OCR engines available!")
             
             OCREngineSingleton._initialized = True
     
@@ -546,9 +782,9 @@ class OCREngineSingleton:
             version = pytesseract.get_tesseract_version()
             self.engines.append('tesseract')
             self._tesseract_available = True
-            print(f"[OK] Tesseract OCR v{version}")
+            logger.info("Tesseract OCR v%s", version)
         except Exception as e:
-            print(f"[WARN] Tesseract not available: {str(e)[:50]}")
+            logger.warning("Tesseract not available: %s", str(e)[:50])
     
     def _init_easyocr(self):
         if not EnhancedConfig.USE_EASYOCR:
@@ -556,39 +792,48 @@ class OCREngineSingleton:
         
         try:
             import easyocr
-            print("[OK] Loading EasyOCR (Arabic + English)... This may take a moment on first load.")
+            logger.info("Loading EasyOCR (Arabic + English)... This may take a moment on first load.")
             self.reader = easyocr.Reader(['ar', 'en'], gpu=False, verbose=False)
             self.engines.append('easyocr')
-            print("[OK] EasyOCR ready")
+            logger.info("EasyOCR ready")
         except Exception as e:
-            print(f"[WARN] EasyOCR not available: {str(e)[:50]}")
+            logger.warning("EasyOCR not available: %s", str(e)[:50])
     
     def is_available(self) -> bool:
         """Check if any OCR engine is available"""
         return len(self.engines) > 0
     
     def extract_text(self, image: np.ndarray) -> str:
-        """Extract text using all available engines"""
+        """Extract text using all available engines (stops early past the check's deadline)"""
         all_text = []
         
-        if 'easyocr' in self.engines and self.reader is not None:
+        if 'easyocr' in self.engines and self.reader is not None and self._easyocr_fits():
             text = self._extract_easyocr(image)
             all_text.append(text)
         
-        if 'tesseract' in self.engines:
+        if 'tesseract' in self.engines and not deadline_passed():
             text = self._extract_tesseract(image)
             all_text.append(text)
         
         return '\n'.join(filter(None, all_text))
     
+    def _easyocr_fits(self) -> bool:
+        """readtext() cannot be interrupted: only start it if a typical call ends before the deadline"""
+        remaining = remaining_time()
+        return remaining is None or remaining > self._easyocr_seconds
+    
     def _extract_easyocr(self, image: np.ndarray) -> str:
+        start = time.perf_counter()
         try:
             results = self.reader.readtext(image, detail=1)
             texts = [text for (bbox, text, conf) in results if conf > 0.25]
             return '\n'.join(texts)
         except Exception as e:
-            print(f"EasyOCR error: {e}")
+            logger.warning("EasyOCR error: %s", e)
             return ""
+        finally:
+            elapsed = time.perf_counter() - start
+            self._easyocr_seconds = elapsed if not self._easyocr_seconds else 0.8 * self._easyocr_seconds + 0.2 * elapsed
     
     def _extract_tesseract(self, image: np.ndarray) -> str:
         try:
@@ -598,22 +843,32 @@ class OCREngineSingleton:
             all_text = []
             
             for name, img in preprocessed[:4]:
+                # Each pass is a subprocess; past the deadline it is killed (timeout)
+                # and the remaining passes are skipped
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    break
                 try:
-                    text = pytesseract.image_to_string(img, lang='ara+eng', config='--oem 3 --psm 6')
+                    text = pytesseract.image_to_string(img, lang='ara+eng', config='--oem 3 --psm 6',
+                                                       timeout=remaining or 0)
                     all_text.append(text)
                 except:
                     pass
                 
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    break
                 try:
                     text = pytesseract.image_to_string(img, lang='eng', 
-                                                      config='--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789')
+                                                      config='--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789',
+                                                      timeout=remaining or 0)
                     all_text.append(text)
                 except:
                     pass
             
             return '\n'.join(filter(None, all_text))
         except Exception as e:
-            print(f"Tesseract error: {e}")
+            logger.warning("Tesseract error: %s", e)
             return ""
     
     def _preprocess_for_ocr(self, image: np.ndarray) -> List[Tuple[str, np.ndarray]]:
@@ -660,11 +915,8 @@ def initialize_ocr_engine():
     """Explicitly initialize the OCR engine (call once at startup)"""
     global _global_ocr_engine
     if _global_ocr_engine is None:
-        print("\n" + "="*50)
-        print("Initializing OCR Engine (one-time load)...")
-        print("="*50)
+        logger.info("Initializing OCR Engine (one-time load)...")
         _global_ocr_engine = get_ocr_engine()
-        print("="*50 + "\n")
     return _global_ocr_engine
 
 
@@ -757,12 +1009,390 @@ class EgyptianIDValidator:
         }
         
         return result
+    
+    # ---- Bulk (columnar) validation ----
+    BULK_YEARS = (1900, 2100)  # centuries covered by the first digit (2 -> 19xx, 3 -> 20xx)
+    _DIGIT_LUT = None
+    
+    @classmethod
+    def _bulk_tables(cls):
+        """Character and calendar lookup tables shared by validate_bulk (built once)"""
+        if cls._DIGIT_LUT is None:
+            lut = np.full(128, 255, dtype=np.uint8)  # 255 = character dropped by cleaning
+            lut[ord('0'):ord('9') + 1] = np.arange(10)
+            for ch in 'Oo':
+                lut[ord(ch)] = 0
+            for ch in 'Il|':
+                lut[ord(ch)] = 1
+            
+            years = np.arange(*cls.BULK_YEARS)
+            leap = ((years % 4 == 0) & (years % 100 != 0)) | (years % 400 == 0)
+            month_days = np.array([[31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+                                   [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]], dtype=np.int32)
+            
+            gov_names = np.full(100, '', dtype='U16')
+            for code, name in cls.GOVERNORATES.items():
+                gov_names[int(code)] = name
+            
+            cls._CALENDAR = {
+                'leap': leap.astype(np.int64),
+                # days from 1970-01-01 to Jan 1st of each year
+                'year_start': (years - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64),
+                'month_days': month_days,
+                'days_before_month': np.concatenate([np.zeros((2, 1), np.int32),
+                                                     np.cumsum(month_days, axis=1)[:, :-1]], axis=1)
+            }
+            cls._GOVERNORATE_NAMES = gov_names
+            cls._DIGIT_LUT = lut
+        return cls._DIGIT_LUT, cls._CALENDAR, cls._GOVERNORATE_NAMES
+    
+    def validate_bulk(self, id_numbers) -> Dict[str, np.ndarray]:
+        """
+        Vectorized validate() over a column of ID strings.
+        
+        Args:
+            id_numbers: Sequence, NumPy array, pandas Series or Arrow array of strings
+                (None/NaN are treated as empty).
+        
+        Returns:
+            Columnar arrays, one row per input: 'valid' (bool), 'id_number' (cleaned
+            14 digits, '' if not 14 digits), 'birth_date' (datetime64[D], NaT if
+            invalid), 'age' (int16, -1 if invalid), 'governorate_code' ('' if invalid),
+            'governorate', 'gender' ('Male'/'Female', '' if invalid).
+            Rows agree with validate(); the rare rows with non-ASCII characters are
+            delegated to it.
+        """
+        if hasattr(id_numbers, 'to_numpy'):
+            try:
+                id_numbers = id_numbers.to_numpy(zero_copy_only=False)  # Arrow
+            except TypeError:
+                id_numbers = id_numbers.to_numpy()  # pandas
+        values = np.asarray(id_numbers, dtype=object) if not isinstance(id_numbers, np.ndarray) else id_numbers
+        if values.dtype.kind != 'U':
+            values = np.array(['' if v is None or v != v else str(v) for v in values.tolist()], dtype='U')
+        if values.dtype.itemsize < 4 * 14:
+            values = values.astype('U14')
+        n = len(values)
+        lut, calendar, gov_names = self._bulk_tables()
+        
+        # (n, width) code point matrix -> digit values, 255 for dropped characters
+        width = values.dtype.itemsize // 4
+        codes = np.ascontiguousarray(values).view(np.uint32).reshape(n, width)
+        non_ascii = (codes >= 128).any(axis=1)
+        digits = lut[np.minimum(codes, 127)]
+        keep = digits != 255
+        
+        has_14 = (keep.sum(axis=1) == 14) & ~non_ascii
+        order = np.argsort(~keep, axis=1, kind='stable')[:, :14]
+        d = np.take_along_axis(digits, order, axis=1).astype(np.int64)
+        d[~has_14] = 0
+        
+        year = np.where(d[:, 0] == 2, 1900, 2000) + d[:, 1] * 10 + d[:, 2]
+        month = d[:, 3] * 10 + d[:, 4]
+        day = d[:, 5] * 10 + d[:, 6]
+        gov_code = d[:, 7] * 10 + d[:, 8]
+        
+        leap = calendar['leap'][year - self.BULK_YEARS[0]]
+        month_index = np.clip(month - 1, 0, 11)
+        valid = (has_14 & ((d[:, 0] == 2) | (d[:, 0] == 3))
+                 & (month >= 1) & (month <= 12) & (day >= 1)
+                 & (day <= calendar['month_days'][leap, month_index]))
+        
+        birth_days = (calendar['year_start'][year - self.BULK_YEARS[0]]
+                      + calendar['days_before_month'][leap, month_index] + day - 1)
+        today = np.datetime64(datetime.now().date(), 'D').astype(np.int64)
+        age = (today - birth_days) // 365
+        valid &= (birth_days <= today) & (age <= 120) & (gov_names[gov_code] != '')
+        
+        # Strings are built straight from the digit matrix (code points viewed as U<k>)
+        chars = (d + ord('0')).astype(np.uint32)
+        chars[~has_14] = 0
+        no_chars = np.zeros((n, 2), np.uint32)
+        result = {
+            'valid': valid,
+            'id_number': np.ascontiguousarray(chars).view('U14').ravel(),
+            'birth_date': np.where(valid, birth_days, np.datetime64('NaT').astype(np.int64)).astype('datetime64[D]'),
+            'age': np.where(valid, age, -1).astype(np.int16),
+            'governorate_code': np.ascontiguousarray(np.where(valid[:, None], chars[:, 7:9], no_chars)).view('U2').ravel(),
+            'governorate': gov_names[np.where(valid, gov_code, 0)],
+            'gender': np.array(['', '', 'Female', 'Male'])[valid * 2 + d[:, 13] % 2]
+        }
+        
+        for i in np.flatnonzero(non_ascii):
+            self._fill_bulk_row(result, i, self.validate(values[i]))
+        return result
+    
+    @staticmethod
+    def _fill_bulk_row(result: Dict[str, np.ndarray], i: int, row: Dict):
+        """Write one validate() result into the validate_bulk columns"""
+        info = row['info']
+        result['valid'][i] = row['valid']
+        result['id_number'][i] = row['id_number'] if len(row['id_number']) == 14 else ''
+        result['birth_date'][i] = np.datetime64(info['birth_date']) if row['valid'] else np.datetime64('NaT')
+        result['age'][i] = info.get('age', -1)
+        result['governorate_code'][i] = info.get('governorate_code', '')
+        result['governorate'][i] = info.get('governorate', '')
+        result['gender'][i] = info.get('gender', '')
+
+
+# ==================== DEADLINES ====================
+# Wall-clock deadline of the feature check running on the current thread.
+# Long-running steps poll it and stop early: the Tesseract cascade (each pass is
+# killed at the deadline), EasyOCR (not started unless a typical call fits) and
+# card localization (no further strategies or corner refinement). A single
+# OpenCV or readtext() call in flight is not interrupted, so deadlines are a
+# bound up to the length of one such step.
+_deadline_state = threading.local()
+
+
+def current_deadline() -> Optional[float]:
+    """time.monotonic() deadline of the running check, or None"""
+    return getattr(_deadline_state, 'deadline', None)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the running check's deadline (None = unbounded)"""
+    deadline = current_deadline()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_passed() -> bool:
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """Run a block under a deadline (the tighter of it and any enclosing one)"""
+    previous = current_deadline()
+    if previous is not None and (deadline is None or previous < deadline):
+        deadline = previous
+    _deadline_state.deadline = deadline
+    try:
+        yield
+    finally:
+        _deadline_state.deadline = previous
+
+
+# ==================== FEATURE CHECK EXECUTOR ====================
+@dataclass
+class FeatureNode:
+    """One node of the feature-check DAG"""
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]  # receives the results of depends_on
+    depends_on: Tuple[str, ...] = ()
+    deadline_seconds: Optional[float] = None  # per-node budget, counted from when it starts
+
+
+class FeatureCheckExecutor:
+    """
+    Runs a DAG of feature checks on a bounded, process-wide thread pool.
+    
+    OpenCV and the OCR engines release the GIL, so independent checks overlap and a
+    card costs roughly its slowest check. Nodes are submitted in priority order as
+    soon as their dependencies are done, at most max_workers of a run at a time so
+    concurrent verifications share the pool; a should_stop predicate (the
+    short-circuit scheduler) and a wall-clock budget can end the run early, in which
+    case queued checks are cancelled and running ones are abandoned. A node that
+    outlives its own deadline_seconds is abandoned while the others carry on.
+    
+    Abandoned checks keep their thread until they return, so the pool has
+    straggler_workers threads on top of max_workers per concurrent verification;
+    the ones still running are counted in stats().
+    """
+    _pool: Optional[ThreadPoolExecutor] = None
+    _pool_size = 0
+    _pool_lock = threading.Lock()
+    _abandoned: set = set()  # futures of abandoned checks that are still running
+    _abandoned_total = 0
+    _straggler_workers = 0
+    
+    def __init__(self, max_workers: int = 4, concurrent_runs: int = 1, straggler_workers: int = 0):
+        """
+        Args:
+            max_workers: Checks of one run in flight at a time (1 = inline execution).
+            concurrent_runs: Runs expected at once; sizes the shared pool with straggler_workers.
+            straggler_workers: Extra threads for abandoned checks that are still running.
+        """
+        self.max_workers = max_workers
+        self.pool_size = max_workers * concurrent_runs + straggler_workers
+        self.straggler_workers = straggler_workers
+    
+    @classmethod
+    def _get_pool(cls, pool_size: int, straggler_workers: int) -> ThreadPoolExecutor:
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='feature-check')
+                    cls._pool_size = pool_size
+                    cls._straggler_workers = straggler_workers
+        return cls._pool
+    
+    @classmethod
+    def _abandon(cls, future: Future):
+        """Cancel a check, or count it as a straggler until it returns"""
+        if future.cancel():
+            return
+        with cls._pool_lock:
+            cls._abandoned.add(future)
+            cls._abandoned_total += 1
+            running = len(cls._abandoned)
+        future.add_done_callback(cls._straggler_done)
+        if running > cls._straggler_workers:
+            logger.warning("%d abandoned feature checks still running - verifications are queueing "
+                           "behind them (pool of %d)", running, cls._pool_size)
+    
+    @classmethod
+    def _straggler_done(cls, future: Future):
+        with cls._pool_lock:
+            cls._abandoned.discard(future)
+    
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """Shared pool size and abandoned checks (still running / since start)"""
+        with cls._pool_lock:
+            return {'pool_workers': cls._pool_size, 'abandoned_running': len(cls._abandoned),
+                    'abandoned_total': cls._abandoned_total}
+    
+    @staticmethod
+    def _invoke(node: FeatureNode, inputs: Dict[str, Any], run_deadline: Optional[float],
+                node_deadlines: Dict[str, float]) -> Any:
+        """Run a node under the tighter of its own and the run's deadline"""
+        deadline = run_deadline
+        if node.deadline_seconds is not None:
+            node_deadline = time.monotonic() + node.deadline_seconds
+            deadline = node_deadline if deadline is None else min(deadline, node_deadline)
+        if deadline is not None:
+            node_deadlines[node.name] = deadline
+        with deadline_scope(deadline):
+            return node.fn(inputs)
+    
+    def run(self, nodes: List[FeatureNode],
+            should_stop: Optional[Callable[[Dict[str, Any]], bool]] = None,
+            budget_seconds: Optional[float] = None) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Execute the nodes (given in priority order).
+        
+        Returns:
+            (results by node name, names of nodes that timed out).
+            Nodes left out because should_stop fired are in neither.
+        """
+        deadline = time.monotonic() + budget_seconds if budget_seconds is not None else None
+        if self.max_workers <= 1:
+            return self._run_serial(nodes, should_stop, deadline)
+        
+        pool = self._get_pool(self.pool_size, self.straggler_workers)
+        pending = list(nodes)
+        results: Dict[str, Any] = {}
+        running: Dict[Future, str] = {}
+        node_deadlines: Dict[str, float] = {}  # filled in by the worker when a node starts
+        budgets = {node.name: node.deadline_seconds for node in nodes}
+        timed_out: List[str] = []
+        stopped = False
+        
+        while pending or running:
+            # Submit nodes whose dependencies are satisfied, in priority order
+            for node in list(pending):
+                if len(running) >= self.max_workers:
+                    break
+                if all(dep in results for dep in node.depends_on):
+                    inputs = {dep: results[dep] for dep in node.depends_on}
+                    future = pool.submit(self._invoke, node, inputs, deadline, node_deadlines)
+                    running[future] = node.name
+                    pending.remove(node)
+            
+            if not running:
+                # Remaining nodes depend on a node that timed out
+                break
+            
+            # Wake up for the first completion or the earliest deadline; a node whose
+            # worker has not registered its deadline yet starts no earlier than now
+            now = time.monotonic()
+            wake_at = [node_deadlines[name] if name in node_deadlines else now + budgets[name]
+                       for name in running.values() if name in node_deadlines or budgets[name] is not None]
+            if deadline is not None:
+                wake_at.append(deadline)
+            timeout = max(0.0, min(wake_at) - time.monotonic()) if wake_at else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                results[running.pop(future)] = future.result()
+            
+            if should_stop is not None and should_stop(results):
+                stopped = True
+                break
+            
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                logger.warning("Verification budget of %.1fs exhausted (%s still running)",
+                               budget_seconds, ', '.join(running.values()) or 'none')
+                break
+            
+            # Abandon nodes that outlived their own deadline
+            for future, name in list(running.items()):
+                if name in node_deadlines and now >= node_deadlines[name] and not future.done():
+                    logger.warning("Feature check %s exceeded its deadline - abandoned", name)
+                    self._abandon(future)
+                    del running[future]
+                    timed_out.append(name)
+        
+        # Queued checks are cancelled; ones already running are abandoned
+        for future in running:
+            self._abandon(future)
+        if stopped:
+            return results, timed_out
+        
+        return results, timed_out + list(running.values()) + [node.name for node in pending]
+    
+    def _run_serial(self, nodes: List[FeatureNode],
+                    should_stop: Optional[Callable[[Dict[str, Any]], bool]],
+                    deadline: Optional[float]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Inline execution in priority order (single worker).
+        
+        Checks cannot be abandoned here; deadlines only stop cooperative steps and
+        keep later checks from starting. A check that returns after its deadline
+        still counts (its time is spent either way).
+        """
+        results: Dict[str, Any] = {}
+        timed_out: List[str] = []
+        remaining = list(nodes)
+        node_deadlines: Dict[str, float] = {}
+        
+        while remaining:
+            node = next((n for n in remaining if all(dep in results for dep in n.depends_on)), None)
+            if node is None:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning("Verification budget exhausted")
+                break
+            
+            remaining.remove(node)
+            result = self._invoke(node, {dep: results[dep] for dep in node.depends_on},
+                                  deadline, node_deadlines)
+            if node.name in node_deadlines and time.monotonic() > node_deadlines[node.name]:
+                logger.warning("Feature check %s finished after its deadline", node.name)
+            results[node.name] = result
+            if should_stop is not None and should_stop(results):
+                return results, timed_out
+        
+        return results, timed_out + [n.name for n in remaining]
 
 
 # ==================== ENHANCED FEATURE DETECTOR ====================
 class EnhancedEgyptianIDFeatureDetector:
     """Enhanced detector with precise layout verification and adaptive color detection"""
     
+    # The glare map is the first node of the check DAG; these checks depend on it
+    GLARE_NODE = 'glare_map'
+    GLARE_AWARE_FEATURES = ('layout_structure', 'arabic_header', 'color_scheme',
+                            'security_pattern', 'id_number_valid')
+    # Checks never taken from a near-duplicate card (known_results): their details describe
+    # this card - the ID number read from it, the face boxes face matching crops its photo with
+    PER_CARD_FEATURES = ('id_number_valid', 'photo_left_side')
+    
     def __init__(self, ocr_engine: Optional[OCREngineSingleton] = None):
         """
         Initialize detector with optional shared OCR engine.
@@ -779,45 +1409,117 @@ class EnhancedEgyptianIDFeatureDetector:
         # Initialize adaptive color detector
         self.color_detector = AdaptiveColorDetector(self.config)
         self.lighting_estimator = LightingConditionEstimator()
-    
-    def verify_all_features(self, image: np.ndarray) -> Dict:
-        """Run all enhanced feature checks"""
         
-        print("\n" + "="*70)
-        print("[SEARCH] ENHANCED EGYPTIAN NATIONAL ID FEATURE VERIFICATION")
-        print("="*70)
+        # Runs the independent feature checks concurrently
+        parallel = self.config.PARALLEL_EXECUTION
+        self.executor = FeatureCheckExecutor(parallel['max_workers'], parallel['concurrent_verifications'],
+                                             parallel['straggler_workers'])
+        
+        # Photo-region face detector (Haar or DNN backend, see face_detection)
+        self.face_detector = create_face_detector(
+            scale_factor=self.config.FACE_DETECTION['scaleFactor'],
+            min_neighbors=self.config.FACE_DETECTION['minNeighbors'],
+            confidence=self.config.FACE_DETECTION['dnn_confidence']
+        )
+        
+        # Optional duplicate_detection.IDNumberIndex; when set, a valid ID number
+        # reports the sessions that submitted it before
+        self.id_number_index = None
+    
+    def verify_all_features(self, image: np.ndarray, full_report: bool = False,
+                            budget_seconds: Optional[float] = None,
+                            photo_faces: Optional[np.ndarray] = None,
+                            id_number_hint: Optional[Callable[[], Optional[str]]] = None,
+                            known_results: Optional[Dict[str, FeatureResult]] = None) -> Dict:
+        """
+        Run the enhanced feature checks.
+        
+        Checks are submitted to the FeatureCheckExecutor in evaluation order (the ID
+        number first, then by weight per unit of cost) and run in parallel.
+        As each check completes the reachable confidence range is recomputed from
+        WEIGHTS and evaluation stops once neither the decision nor the confidence
+        band can change (see _decision_fixed); the remaining checks are reported as
+        skipped with NEUTRAL_SCORE.
+        
+        The glare map (GlareMap) is computed once, as the first node, and handed to
+        the GLARE_AWARE_FEATURES: color coverage leaves glared pixels out and OCR
+        skips or inpaints glared regions. It is reported under 'glare'.
+        
+        Each check runs under its FEATURE_DEADLINES budget and the whole run under
+        budget_seconds (capped by PARALLEL_EXECUTION['time_budget_seconds']). Checks
+        over budget are scored NEUTRAL_SCORE with timed_out set; if that leaves the
+        decision open, the result is flagged 'timed_out' (callers send it to manual review).
+        Pass full_report=True to run every check (audit cases).
+        photo_faces are detections of the photo region made beforehand (see photo_faces_batch).
+        id_number_hint returns an ID number read elsewhere (the id_back barcode) if it
+        is known yet, without blocking. It is only a cross-check: the number is still
+        read from the front's ID region, and when that reading agrees the full-card OCR
+        pass is skipped. It never scores the check.
+        known_results are taken as given instead of running those checks (visual checks
+        of a near-duplicate card, see verify_image_array); they are reported under
+        'reused_features'. id_number_valid and photo_left_side are always run on this card.
+        """
         
         # Estimate and report lighting conditions
         lighting_type, lighting_info = self.lighting_estimator.estimate_lighting(image)
-        print(f"[INFO] Detected lighting: {lighting_type.value}")
-        print(f"   Color temperature shift: {lighting_info.get('color_temp_shift', 0):.1f}")
-        
-        results = {}
-        
-        results['aspect_ratio'] = self._check_aspect_ratio(image)
-        results['layout_structure'] = self._verify_layout_structure(image)
-        results['photo_left_side'] = self._detect_photo_left(image)
-        results['pyramids_sphinx'] = self._detect_pyramids_sphinx(image)
-        results['eagle_emblem'] = self._detect_eagle_emblem(image)
-        results['arabic_header'] = self._detect_arabic_header(image)
-        results['color_scheme'] = self._verify_color_scheme_adaptive(image)
-        results['security_pattern'] = self._detect_security_pattern_adaptive(image)
-        results['arabic_header'] = self._detect_arabic_header(image)
-        results['color_scheme'] = self._verify_color_scheme_adaptive(image)
-        results['security_pattern'] = self._detect_security_pattern_adaptive(image)
-        results['id_number_valid'] = self._extract_and_validate_id(image)
-        
-        # Check for Driving License specific keywords to explicitly reject
-        is_driving_license = self._detect_driving_license(image)
-        if is_driving_license['detected']:
-            print(f"[WARN] Detected Driving License keywords: {is_driving_license['keywords']}")
-        
-        # Print results
-        for feature_name, feature_result in results.items():
-            icon = "[OK]" if feature_result.passed else "[X]"
-            weight = self.config.WEIGHTS[feature_name]
-            print(f"{icon} {feature_name.replace('_', ' ').title():25} "
-                  f"[{feature_result.score:.2f}] (weight: {weight:.2f}) - {feature_result.message}")
+        logger.debug("Detected lighting: %s (color temperature shift: %.1f)",
+                     lighting_type.value, lighting_info.get('color_temp_shift', 0))
+        
+        checks = self._feature_checks()
+        if photo_faces is not None:
+            checks['photo_left_side'] = lambda img: self._detect_photo_left(img, faces=photo_faces)
+        if id_number_hint is not None:
+            checks['id_number_valid'] = lambda img, glare=None: self._extract_and_validate_id(
+                img, glare=glare, id_number_hint=id_number_hint)
+        known_results = {name: result for name, result in (known_results or {}).items()
+                         if name not in self.PER_CARD_FEATURES}
+        nodes = [FeatureNode(self.GLARE_NODE, lambda _: GlareMap.compute(image, self.config))]
+        for name in self._evaluation_order():
+            if name in known_results:
+                continue
+            if name in self.GLARE_AWARE_FEATURES:
+                nodes.append(FeatureNode(name, lambda inputs, check=checks[name]: check(image, glare=inputs[self.GLARE_NODE]),
+                                         depends_on=(self.GLARE_NODE,),
+                                         deadline_seconds=self.config.FEATURE_DEADLINES.get(name)))
+            else:
+                nodes.append(FeatureNode(name, lambda _, check=checks[name]: check(image),
+                                         deadline_seconds=self.config.FEATURE_DEADLINES.get(name)))
+        budget = self.config.PARALLEL_EXECUTION['time_budget_seconds']
+        if budget_seconds is not None:
+            budget = min(budget, max(0.0, budget_seconds))
+        results, timed_out = self.executor.run(
+            nodes,
+            should_stop=None if full_report else lambda done: self._decision_fixed({**known_results, **done}),
+            budget_seconds=budget
+        )
+        results.update(known_results)
+        
+        glare = results.pop(self.GLARE_NODE, None)
+        if glare is None:
+            # Cut off by the budget; still needed for the driving license check and the report
+            glare = GlareMap.compute(image, self.config)
+        timed_out = [name for name in timed_out if name != self.GLARE_NODE]
+        
+        evaluated = list(results.keys())
+        bounds = self._confidence_bounds(results)
+        # Timeouts only matter when the missing checks could still change the decision
+        decision_open = bool(timed_out) and not self._decision_fixed(results)
+        for feature_name in timed_out:
+            results[feature_name] = FeatureResult(False, self.config.NEUTRAL_SCORE,
+                                                  "Timed out", {'timed_out': True}, timed_out=True)
+        skipped = [name for name in self.config.WEIGHTS if name not in results]
+        for feature_name in skipped:
+            results[feature_name] = FeatureResult(False, self.config.NEUTRAL_SCORE,
+                                                  "Skipped - decision already fixed", {'skipped': True})
+        results = {name: results[name] for name in self.config.WEIGHTS}
+        
+        # Per-feature results (only formatted when DEBUG is enabled)
+        if logger.isEnabledFor(logging.DEBUG):
+            for feature_name, feature_result in results.items():
+                logger.debug("%s %-25s [%.2f] (weight: %.2f) - %s",
+                             "[OK]" if feature_result.passed else "[X]",
+                             feature_name.replace('_', ' ').title(), feature_result.score,
+                             self.config.WEIGHTS[feature_name], feature_result.message)
         
         # Calculate confidence
         confidence = sum(
@@ -826,18 +1528,18 @@ class EnhancedEgyptianIDFeatureDetector:
         )
         
         # Decision logic
-        print("\n" + "="*70)
-        
         # Determine which threshold to use
-        if results['id_number_valid'].score >= 0.8:
-            # If we have a valid ID number, use standard threshold
-            active_threshold = self.config.CONFIDENCE_THRESHOLD
-            threshold_name = "Standard"
-        else:
-            # If NO valid ID number, require much higher visual confidence
-            active_threshold = self.config.CONFIDENCE_THRESHOLD_NO_ID
-            threshold_name = "Strict (No ID Number)"
-            
+        active_threshold, threshold_name = self._active_threshold(results['id_number_valid'].score)
+        
+        # Driving license keywords only matter when the card would otherwise be accepted
+        is_driving_license = {'detected': False, 'keywords': [], 'checked': False}
+        if full_report or (results['id_number_valid'].score < self.config.ID_NUMBER_OVERRIDE
+                           and confidence >= active_threshold):
+            is_driving_license = self._detect_driving_license(image, glare)
+            is_driving_license['checked'] = True
+            if is_driving_license['detected']:
+                logger.info("Detected Driving License keywords: %s", is_driving_license['keywords'])
+        
         if results['id_number_valid'].score >= self.config.ID_NUMBER_OVERRIDE:
             is_egyptian_id = True
             reason = "[PASS] Valid Egyptian ID number verified"
@@ -853,17 +1555,18 @@ class EnhancedEgyptianIDFeatureDetector:
         else:
             is_egyptian_id = False
             reason = f"[X] Low confidence ({confidence*100:.1f}% < {active_threshold*100:.0f}% {threshold_name})"
-            failed = [name for name, res in results.items() if not res.passed]
+            failed = [name for name, res in results.items()
+                      if not res.passed and name not in skipped and name not in timed_out]
             if failed:
                 reason += f"\n   Failed: {', '.join(failed[:4])}"
         
-        print(reason)
-        print(f"Overall Confidence: {confidence*100:.1f}%")
-        print("="*70 + "\n")
+        logger.info("%s (overall confidence: %.1f%%, %d/%d checks evaluated)",
+                    reason, confidence * 100, len(evaluated), len(results))
         
         return {
             'is_egyptian_national_id': is_egyptian_id,
             'confidence': confidence,
+            'confidence_bounds': bounds,
             'reason': reason,
             'lighting_conditions': {
                 'type': lighting_type.value,
@@ -873,15 +1576,93 @@ class EnhancedEgyptianIDFeatureDetector:
                 'passed': res.passed,
                 'score': res.score,
                 'message': res.message,
-                'details': res.details
+                'details': res.details,
+                'timed_out': res.timed_out
             } for name, res in results.items()},
+            'evaluated_features': evaluated,
+            'reused_features': list(known_results),
+            'skipped_features': skipped,
+            'timed_out_features': timed_out,
+            'timed_out': decision_open,
+            'short_circuited': bool(skipped),
+            'driving_license_check': is_driving_license,
+            'glare': {
+                'ratio': glare.ratio,
+                'regions': {name: GlareMap.coverage(self._get_region(glare.mask, name))
+                            for name in self.config.LAYOUT}
+            },
             'extracted_data': results['id_number_valid'].details if results['id_number_valid'].details else {}
         }
     
-    def _get_region(self, image: np.ndarray, region_name: str) -> np.ndarray:
-        """Extract region based on layout specification"""
+    def _feature_checks(self) -> Dict:
+        """Feature name -> check method"""
+        return {
+            'aspect_ratio': self._check_aspect_ratio,
+            'layout_structure': self._verify_layout_structure,
+            'photo_left_side': self._detect_photo_left,
+            'pyramids_sphinx': self._detect_pyramids_sphinx,
+            'eagle_emblem': self._detect_eagle_emblem,
+            'arabic_header': self._detect_arabic_header,
+            'color_scheme': self._verify_color_scheme_adaptive,
+            'security_pattern': self._detect_security_pattern_adaptive,
+            'id_number_valid': self._extract_and_validate_id,
+        }
+    
+    def _evaluation_order(self) -> List[str]:
+        """
+        The ID number check, then the visual checks by weight per unit of cost.
+        
+        The ID number goes first although it is the most expensive check: a valid
+        number (ID_NUMBER_OVERRIDE) fixes the verdict, which is what lets a clear
+        accept stop early. Clear rejects still settle on the visual checks alone.
+        """
+        visual = sorted(
+            (name for name in self.config.WEIGHTS if name != 'id_number_valid'),
+            key=lambda name: self.config.WEIGHTS[name] / self.config.FEATURE_COSTS.get(name, 1),
+            reverse=True
+        )
+        return ['id_number_valid'] + visual
+    
+    def _active_threshold(self, id_score: float) -> Tuple[float, str]:
+        if id_score >= 0.8:
+            # If we have a valid ID number, use standard threshold
+            return self.config.CONFIDENCE_THRESHOLD, "Standard"
+        # If NO valid ID number, require much higher visual confidence
+        return self.config.CONFIDENCE_THRESHOLD_NO_ID, "Strict (No ID Number)"
+    
+    def _confidence_bounds(self, results: Dict) -> Dict:
+        """Lowest and highest weighted confidence still reachable given the evaluated checks"""
+        lower = sum(res.score * self.config.WEIGHTS[name]
+                    for name, res in results.items() if name in self.config.WEIGHTS)
+        remaining = sum(weight for name, weight in self.config.WEIGHTS.items() if name not in results)
+        return {'lower': lower, 'upper': lower + remaining}
+    
+    def _decision_fixed(self, results: Dict) -> bool:
+        """
+        True once no outcome of the remaining checks can change the decision.
+        
+        Both the verdict (the active threshold, or the ID number override) and the
+        confidence band (REVIEW_CONFIDENCE, HIGH_CONFIDENCE) must be settled - the
+        final confidence, with skipped checks at NEUTRAL_SCORE, lies within the
+        bounds. Until the ID number is read only a card that cannot reach any of
+        them, even with a valid number, is settled (a clear reject).
+        """
+        bounds = self._confidence_bounds(results)
+        id_result = results.get('id_number_valid')
+        if id_result is None:
+            return bounds['upper'] < min(self.config.REVIEW_CONFIDENCE, self.config.CONFIDENCE_THRESHOLD,
+                                         self.config.CONFIDENCE_THRESHOLD_NO_ID)
+        
+        cuts = [self.config.REVIEW_CONFIDENCE, self.config.HIGH_CONFIDENCE]
+        if id_result.score < self.config.ID_NUMBER_OVERRIDE:
+            # Accepted above the threshold unless the driving license check (run afterwards) vetoes it
+            cuts.append(self._active_threshold(id_result.score)[0])
+        return all(bounds['upper'] < cut or bounds['lower'] >= cut for cut in cuts)
+    
+    def _get_region(self, image: np.ndarray, region_name: str, layout: Optional[Dict] = None) -> np.ndarray:
+        """Extract region based on layout specification (default: the front LAYOUT)"""
         h, w = image.shape[:2]
-        region = self.config.LAYOUT[region_name]
+        region = (layout if layout is not None else self.config.LAYOUT)[region_name]
         
         y1 = int(h * region['y_start'])
         y2 = int(h * region['y_end'])
@@ -890,29 +1671,31 @@ class EnhancedEgyptianIDFeatureDetector:
         
         return image[y1:y2, x1:x2]
     
+    def _ocr_ready(self, region: np.ndarray, glare_region: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """
+        Region to hand to OCR given its glare mask.
+        
+        None when more than GLARE['ocr_skip_ratio'] of it is glared (the pass would
+        read nothing); glared pixels are inpainted when there are some.
+        """
+        coverage = GlareMap.coverage(glare_region)
+        if coverage == 0.0:
+            return region
+        if coverage >= self.config.GLARE['ocr_skip_ratio']:
+            return None
+        return cv2.inpaint(region, glare_region, 3, cv2.INPAINT_TELEA)
+    
     def _check_aspect_ratio(self, image: np.ndarray) -> FeatureResult:
         h, w = image.shape[:2]
         aspect = w / h
-        target = self.config.ASPECT_RATIO_TARGET
-        distance = abs(aspect - target) / target
+        score, distance = aspect_ratio_score(aspect, self.config)
         
-        if distance < 0.03:
-            score = 1.0
-        elif distance < 0.07:
-            score = 0.85
-        elif distance < 0.12:
-            score = 0.65
-        elif distance < self.config.ASPECT_RATIO_TOLERANCE:
-            score = 0.45
-        else:
-            score = 0.20
-        
-        passed = score >= 0.40
-        message = f"{aspect:.3f} (target: {target:.3f}, error: {distance*100:.1f}%)"
+        passed = score >= self.config.ASPECT_RATIO_MIN_SCORE
+        message = f"{aspect:.3f} (target: {self.config.ASPECT_RATIO_TARGET:.3f}, error: {distance*100:.1f}%)"
         
         return FeatureResult(passed, score, message, {'aspect': aspect})
     
-    def _verify_layout_structure(self, image: np.ndarray) -> FeatureResult:
+    def _verify_layout_structure(self, image: np.ndarray, glare: Optional[GlareMap] = None) -> FeatureResult:
         h, w = image.shape[:2]
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
         
@@ -936,9 +1719,10 @@ class EnhancedEgyptianIDFeatureDetector:
         
         # Security at BOTTOM - using adaptive color detection
         bottom_region = self._get_region(image, 'security_strip')
+        bottom_glare = self._get_region(glare.mask, 'security_strip') if glare is not None else None
         if len(bottom_region.shape) == 3:
             # Use adaptive detection instead of fixed ranges
-            color_analysis = self.color_detector.analyze_colors(bottom_region)
+            color_analysis = self.color_detector.analyze_colors(bottom_region, exclude_mask=bottom_glare)
             blue_detected = 'security blue' in color_analysis.get('colors_detected', [])
             
             # Fallback to simple check
@@ -948,7 +1732,7 @@ class EnhancedEgyptianIDFeatureDetector:
                 blue_mask = cv2.inRange(hsv_bottom, 
                                        np.array([85, 20, 40]),  # Wider range
                                        np.array([135, 255, 255]))
-                blue_ratio = np.sum(blue_mask > 0) / blue_mask.size
+                blue_ratio = self._unglared_ratio(blue_mask, bottom_glare)
                 checks['security_bottom'] = blue_ratio > 0.04
             else:
                 checks['security_bottom'] = True
@@ -972,7 +1756,20 @@ class EnhancedEgyptianIDFeatureDetector:
         
         return FeatureResult(passed, score, message, checks)
     
-    def _detect_photo_left(self, image: np.ndarray) -> FeatureResult:
+    def photo_faces_batch(self, image: np.ndarray, others: List[np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Detect faces in the card's photo region and in other images (e.g. the selfie)
+        with a single detector call - one forward pass on a batching (DNN) backend.
+        
+        Returns:
+            (photo region faces for _detect_photo_left, unfiltered faces of each other image)
+        """
+        detections = self.face_detector.detect_batch([self._get_region(image, 'photo_region')] + list(others))
+        photo_faces = filter_face_sizes(detections[0], self.config.FACE_DETECTION['minSize'],
+                                        self.config.FACE_DETECTION['maxSize'])
+        return photo_faces, detections[1:]
+    
+    def _detect_photo_left(self, image: np.ndarray, faces: Optional[np.ndarray] = None) -> FeatureResult:
         photo_region = self._get_region(image, 'photo_region')
         
         if len(photo_region.shape) == 3:
@@ -980,15 +1777,13 @@ class EnhancedEgyptianIDFeatureDetector:
         else:
             gray_photo = photo_region
         
-        # Face detection
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(
-            gray_photo, 
-            scaleFactor=self.config.FACE_DETECTION['scaleFactor'],
-            minNeighbors=self.config.FACE_DETECTION['minNeighbors'],
-            minSize=self.config.FACE_DETECTION['minSize'],
-            maxSize=self.config.FACE_DETECTION['maxSize']
-        )
+        # Face detection (unless done beforehand by photo_faces_batch)
+        if faces is None:
+            faces = self.face_detector.detect(
+                gray_photo,
+                min_size=self.config.FACE_DETECTION['minSize'],
+                max_size=self.config.FACE_DETECTION['maxSize']
+            )
         
         variance = np.var(gray_photo)
         
@@ -1013,7 +1808,8 @@ class EnhancedEgyptianIDFeatureDetector:
             passed = False
         
         return FeatureResult(passed, score, message,
-                            {'faces': len(faces), 'variance': float(variance), 'edge_density': float(edge_density)})
+                            {'faces': len(faces), 'face_boxes': np.asarray(faces).reshape(-1, 4).tolist(),
+                             'variance': float(variance), 'edge_density': float(edge_density)})
     
     def _detect_pyramids_sphinx(self, image: np.ndarray) -> FeatureResult:
         watermark_region = self._get_region(image, 'watermark_region')
@@ -1143,8 +1939,13 @@ class EnhancedEgyptianIDFeatureDetector:
         return FeatureResult(passed, score, message,
                             {'circle': has_circle, 'gold_ratio': gold_ratio, 'symmetry': is_symmetrical})
     
-    def _detect_arabic_header(self, image: np.ndarray) -> FeatureResult:
+    def _detect_arabic_header(self, image: np.ndarray, glare: Optional[GlareMap] = None) -> FeatureResult:
         header_region = self._get_region(image, 'header_region')
+        header_region = self._ocr_ready(header_region,
+                                        self._get_region(glare.mask, 'header_region') if glare is not None else None)
+        if header_region is None:
+            return FeatureResult(False, self.config.NEUTRAL_SCORE, "Header under glare - not read",
+                                 {'glare_skipped': True})
         
         text = self.ocr.extract_text(header_region)
         text_lower = text.lower()
@@ -1180,16 +1981,19 @@ class EnhancedEgyptianIDFeatureDetector:
         return FeatureResult(passed, score, message,
                             {'arabic_chars': arabic_chars, 'keywords': total_keywords})
     
-    def _verify_color_scheme_adaptive(self, image: np.ndarray) -> FeatureResult:
-        """Adaptive color scheme verification"""
+    def _verify_color_scheme_adaptive(self, image: np.ndarray, glare: Optional[GlareMap] = None) -> FeatureResult:
+        """Adaptive color scheme verification (glared pixels are left out of the coverages)"""
         if len(image.shape) != 3:
             return FeatureResult(False, 0.0, "Grayscale image", {})
         
+        glare_mask = glare.mask if glare is not None else None
+        
         # Use adaptive color detection
-        color_analysis = self.color_detector.analyze_colors(image, use_normalization=True)
+        color_analysis = self.color_detector.analyze_colors(image, use_normalization=True,
+                                                            exclude_mask=glare_mask)
         
         # Also check color relationships
-        color_relationships = self.color_detector.detect_color_relationships(image)
+        color_relationships = self.color_detector.detect_color_relationships(image, exclude_mask=glare_mask)
         
         colors_detected = color_analysis['colors_detected']
         normalized_score = color_analysis['normalized_score']
@@ -1209,9 +2013,10 @@ class EnhancedEgyptianIDFeatureDetector:
         
         return FeatureResult(passed, normalized_score, message, details)
     
-    def _detect_security_pattern_adaptive(self, image: np.ndarray) -> FeatureResult:
+    def _detect_security_pattern_adaptive(self, image: np.ndarray, glare: Optional[GlareMap] = None) -> FeatureResult:
         """Adaptive security pattern detection"""
         security_region = self._get_region(image, 'security_strip')
+        security_glare = self._get_region(glare.mask, 'security_strip') if glare is not None else None
         
         if len(security_region.shape) != 3:
             return FeatureResult(False, 0.0, "Grayscale image", {})
@@ -1231,7 +2036,7 @@ class EnhancedEgyptianIDFeatureDetector:
         max_blue_ratio = 0.0
         for lower, upper in blue_ranges:
             blue_mask = cv2.inRange(hsv_security, np.array(lower), np.array(upper))
-            ratio = np.sum(blue_mask > 0) / blue_mask.size
+            ratio = self._unglared_ratio(blue_mask, security_glare)
             max_blue_ratio = max(max_blue_ratio, ratio)
         
         gray_security = cv2.cvtColor(security_region, cv2.COLOR_BGR2GRAY)
@@ -1262,43 +2067,27 @@ class EnhancedEgyptianIDFeatureDetector:
                             {'blue_ratio': float(max_blue_ratio), 'edge_density': edge_density,
                              'pattern_score': float(pattern_score)})
     
+    @staticmethod
+    def _unglared_ratio(mask: np.ndarray, glare_region: Optional[np.ndarray]) -> float:
+        """Share of the pixels set in mask, among the pixels not under glare"""
+        if glare_region is None or not np.any(glare_region):
+            return float(np.count_nonzero(mask)) / mask.size
+        valid = glare_region == 0
+        valid_count = np.count_nonzero(valid)
+        return float(np.count_nonzero((mask > 0) & valid)) / valid_count if valid_count else 0.0
+    
     def _check_pattern_regularity(self, gray_image: np.ndarray) -> float:
         """Check for regular patterns in security features"""
         if gray_image.size < 100:
             return 0.0
         
         try:
-            # Use FFT to detect regular patterns
-            f_transform = np.fft.fft2(gray_image.astype(np.float32))
-            f_shift = np.fft.fftshift(f_transform)
-            magnitude = np.abs(f_shift)
-            
-            # Normalize
-            max_val = magnitude.max()
-            if max_val > 0:
-                magnitude = magnitude / max_val
-            
-            # Create mask as uint8 (FIXED: was float64 which caused cv2.circle error)
-            mask = np.ones(magnitude.shape, dtype=np.uint8)
-            
-            # Calculate center coordinates as integers
-            center_y = int(magnitude.shape[0] // 2)
-            center_x = int(magnitude.shape[1] // 2)
-            
-            # Exclude center region (DC component)
-            cv2.circle(mask, (center_x, center_y), 5, 0, -1)
-            
-            # Apply mask to magnitude
-            masked_magnitude = magnitude * mask.astype(np.float32)
-            
-            # Count significant peaks
-            max_masked = masked_magnitude.max()
-            if max_masked > 0:
-                threshold = 0.3 * max_masked
-                peaks = int(np.sum(masked_magnitude > threshold))
-            else:
-                peaks = 0
-            
+            # Real FFT of the strip; peaks above 30% of the strongest non-DC bin
+            # The strip of a rectified card is already small, so no downscaling
+            spectrum = SpectralAnalyzer.analyze(gray_image, max_side=None,
+                                                dc_radius=5, peak_threshold=0.3)
+            peaks = spectrum['peak_count']
+
             # Normalize score (more peaks = more regular pattern)
             score = min(peaks / 50.0, 1.0)
             
@@ -1306,53 +2095,73 @@ class EnhancedEgyptianIDFeatureDetector:
         
         except Exception as e:
             # If FFT analysis fails, return neutral score
-            print(f"Pattern analysis warning: {e}")
+            logger.warning("Pattern analysis warning: %s", e)
             return 0.3
     
-    def _extract_and_validate_id(self, image: np.ndarray) -> FeatureResult:
-        # Extract from ID region
-        id_region = self._get_region(image, 'id_number_region')
-        region_text = self.ocr.extract_text(id_region)
+    def _extract_and_validate_id(self, image: np.ndarray, glare: Optional[GlareMap] = None,
+                                 id_number_hint: Optional[Callable[[], Optional[str]]] = None) -> FeatureResult:
+        glare_mask = glare.mask if glare is not None else None
         
-        # Also full image
-        full_text = self.ocr.extract_text(image)
+        # Extract from ID region
+        id_region = self._ocr_ready(self._get_region(image, 'id_number_region'),
+                                    self._get_region(glare_mask, 'id_number_region') if glare_mask is not None else None)
+        region_text = self.ocr.extract_text(id_region) if id_region is not None else ''
         
-        all_text = region_text + '\n' + full_text
+        # A region reading that agrees with the back's barcode needs no full-card pass
+        hinted = id_number_hint() if id_number_hint is not None else None
+        if hinted and hinted in self._id_candidates(region_text):
+            validation = self.validator.validate(hinted)
+            if validation['valid']:
+                return self._valid_id_result(validation)
         
-        # Clean and find 14-digit sequences
-        cleaned = re.sub(r'[^0-9]', '', all_text)
-        cleaned = cleaned.replace('O', '0').replace('o', '0').replace('I', '1').replace('l', '1')
+        # Also full image
+        full_image = self._ocr_ready(image, glare_mask)
+        full_text = self.ocr.extract_text(full_image) if full_image is not None else ''
         
-        potential_ids = re.findall(r'\d{14}', cleaned)
-        potential_ids = list(set(potential_ids))
+        potential_ids = self._id_candidates(region_text + '\n' + full_text)
         
         for pid in potential_ids:
             if pid[0] in ['2', '3']:
                 validation = self.validator.validate(pid)
                 
                 if validation['valid']:
-                    return FeatureResult(
-                        True, 1.0,
-                        f"[OK] Valid ID: {pid}",
-                        validation
-                    )
+                    return self._valid_id_result(validation)
         
         if potential_ids:
             return FeatureResult(False, 0.35, f"{len(potential_ids)} numbers, none valid", {})
         else:
             return FeatureResult(False, 0.0, "No 14-digit number", {})
+    
+    @staticmethod
+    def _id_candidates(text: str) -> List[str]:
+        """Distinct 14-digit sequences in OCR text"""
+        # Clean and find 14-digit sequences
+        cleaned = re.sub(r'[^0-9]', '', text)
+        cleaned = cleaned.replace('O', '0').replace('o', '0').replace('I', '1').replace('l', '1')
+        return list(set(re.findall(r'\d{14}', cleaned)))
 
-    def _detect_driving_license(self, image: np.ndarray) -> Dict:
+    def _valid_id_result(self, validation: Dict) -> FeatureResult:
+        """Passing id_number_valid result"""
+        id_number = validation['id_number']
+        if self.id_number_index is not None:
+            validation['registered_sessions'] = self.id_number_index.sessions_for(id_number)
+        return FeatureResult(True, 1.0, f"[OK] Valid ID: {id_number}", validation)
+    
+    def _detect_driving_license(self, image: np.ndarray, glare: Optional[GlareMap] = None) -> Dict:
         """Explicitly check for driving license keywords"""
         # Check header region and full image
         regions_to_check = [
-            self._get_region(image, 'header_region'),
-            image
+            (self._get_region(image, 'header_region'),
+             self._get_region(glare.mask, 'header_region') if glare is not None else None),
+            (image, glare.mask if glare is not None else None)
         ]
         
         found_keywords = []
         
-        for roi in regions_to_check:
+        for roi, roi_glare in regions_to_check:
+            roi = self._ocr_ready(roi, roi_glare)
+            if roi is None:
+                continue
             text = self.ocr.extract_text(roi)
             # Remove spaces for better keyword matching in Arabic
             text_cleaned = text.replace(' ', '')
@@ -1369,34 +2178,164 @@ class EnhancedEgyptianIDFeatureDetector:
 
 
 # ==================== DOCUMENT DETECTOR ====================
+@dataclass
+class DocumentLocalization:
+    """Card quadrilateral found by DocumentDetector.localize"""
+    corners: Optional[np.ndarray]  # (4, 2) float32, full-resolution coordinates
+    strategy: str  # 'contour', 'enhanced', 'precropped' or 'none'
+    proxy_scale: float = 1.0
+    refined: bool = False
+
+    @property
+    def found(self) -> bool:
+        return self.strategy != 'none'
+
+
 class DocumentDetector:
     """Detect and extract document from image"""
     
+    # Longest side of the proxy image used to find the card quadrilateral
+    PROXY_SIDE = 640
+    STRATEGIES = ('contour', 'enhanced', 'precropped', 'none')
+    
     def __init__(self):
         self.min_area = 4000
         self.aspect_ratio_range = (1.2, 2.1)
         self.target_width = 850
         self.target_height = 536
+        
+        # How often each localization strategy succeeded (fallback tracking)
+        self.strategy_counts = {name: 0 for name in self.STRATEGIES}
+        self._stats_lock = threading.Lock()
     
-    def detect_and_extract(self, image: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
-        result = self._try_contour_detection(image)
-        if result is not None:
-            return result
+    def detect_and_extract(self, image: np.ndarray,
+                           annotate: bool = False) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Localize and warp the card.
         
-        result = self._try_enhanced_detection(image)
-        if result is not None:
-            return result
+        The annotated copy of the input is a debug artifact: it is only rendered when
+        annotate=True, otherwise None is returned in its place.
+        """
+        localization = self.localize(image)
+        if not localization.found:
+            return None, None
+        
+        warped = self.extract(image, localization)
+        annotated = self.annotate(image, localization) if annotate else None
+        return warped, annotated
+    
+    def localize(self, image: np.ndarray) -> DocumentLocalization:
+        """
+        Coarse-to-fine card localization.
         
+        The quadrilateral is searched on a ~640px proxy (plain contours first, then
+        the LAB+CLAHE enhanced variant), scaled back and refined with cornerSubPix
+        on small full-resolution crops around each corner. Past the current
+        deadline (deadline_scope) no further strategy or refinement is started.
+        """
         h, w = image.shape[:2]
-        aspect = w / h
-        if 1.35 < aspect < 1.85 and w > 350:
-            print("   ℹ Image appears pre-cropped")
-            resized = cv2.resize(image, (self.target_width, self.target_height))
-            return resized, image
+        scale = min(1.0, self.PROXY_SIDE / float(max(h, w)))
+        if scale < 1.0:
+            proxy = cv2.resize(image, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            proxy = image
+        min_area = self.min_area * scale * scale
+        
+        localization = None
+        for strategy, detect in (('contour', self._try_contour_detection),
+                                 ('enhanced', self._try_enhanced_detection)):
+            if strategy != 'contour' and deadline_passed():
+                logger.warning("Deadline passed during card localization - %s detection skipped", strategy)
+                break
+            found = detect(proxy, min_area)
+            if found is not None:
+                corners, is_quad = found
+                corners = corners.reshape(4, 2).astype(np.float32) / scale
+                refined = False
+                if is_quad and not deadline_passed():
+                    corners, refined = self._refine_corners(image, corners, scale)
+                localization = DocumentLocalization(corners, strategy, scale, refined)
+                break
+        
+        if localization is None:
+            aspect = w / h
+            if 1.35 < aspect < 1.85 and w > 350:
+                logger.debug("Image appears pre-cropped")
+                corners = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype=np.float32)
+                localization = DocumentLocalization(corners, 'precropped', scale)
+            else:
+                localization = DocumentLocalization(None, 'none', scale)
+        
+        with self._stats_lock:
+            self.strategy_counts[localization.strategy] += 1
+        
+        return localization
+    
+    def locate_card(self, thumbnail: np.ndarray, scale: float) -> Optional[np.ndarray]:
+        """
+        Rough card corners (4, 2) on a small preview (scale = preview / original size),
+        None if no card: the same contour strategies and pre-cropped rule as
+        localize(), without corner refinement or strategy stats.
+        """
+        min_area = self.min_area * scale * scale
+        for detect in (self._try_contour_detection, self._try_enhanced_detection):
+            found = detect(thumbnail, min_area)
+            if found is not None:
+                return found[0].reshape(4, 2).astype(np.float32)
+        h, w = thumbnail.shape[:2]
+        if 1.35 < w / h < 1.85 and w / scale > 350:
+            return np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype=np.float32)
+        return None
+    
+    @staticmethod
+    def order_corners(corners: np.ndarray) -> np.ndarray:
+        """Corners as top-left, top-right, bottom-right, bottom-left"""
+        pts = corners.reshape(4, 2).astype('float32')
+        rect = np.zeros((4, 2), dtype='float32')
+        
+        s = pts.sum(axis=1)
+        rect[0] = pts[np.argmin(s)]
+        rect[2] = pts[np.argmax(s)]
+        
+        diff = np.diff(pts, axis=1)
+        rect[1] = pts[np.argmin(diff)]
+        rect[3] = pts[np.argmax(diff)]
+        return rect
+
+    def extract(self, image: np.ndarray, localization: DocumentLocalization) -> Optional[np.ndarray]:
+        """Warp the localized card to the canonical target size"""
+        if not localization.found:
+            return None
+        if localization.strategy == 'precropped':
+            return cv2.resize(image, (self.target_width, self.target_height))
+        return self._perspective_transform(image, localization.corners)
+    
+    def annotate(self, image: np.ndarray, localization: DocumentLocalization) -> Optional[np.ndarray]:
+        """Draw the localized card outline on a copy of the input image"""
+        if not localization.found:
+            return None
+        if localization.strategy == 'precropped':
+            return image
         
-        return None, None
+        annotated = image.copy()
+        cv2.drawContours(annotated, [localization.corners.astype(np.int32).reshape(-1, 1, 2)],
+                         -1, (0, 255, 0), 3)
+        return annotated
+    
+    def get_strategy_stats(self) -> Dict:
+        """Localization strategy counts and the share of images that needed a fallback"""
+        with self._stats_lock:
+            counts = dict(self.strategy_counts)
+        total = sum(counts.values())
+        fallbacks = total - counts['contour']
+        return {
+            'counts': counts,
+            'total': total,
+            'fallback_rate': fallbacks / total if total else 0.0
+        }
     
-    def _try_contour_detection(self, image: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    def _try_contour_detection(self, image: np.ndarray, min_area: float) -> Optional[Tuple[np.ndarray, bool]]:
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
         edges = cv2.Canny(blurred, 25, 150)
@@ -1407,9 +2346,9 @@ class DocumentDetector:
         contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         contours = sorted(contours, key=cv2.contourArea, reverse=True)
         
-        return self._find_best_contour(contours, image)
+        return self._find_best_contour(contours, min_area)
     
-    def _try_enhanced_detection(self, image: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    def _try_enhanced_detection(self, image: np.ndarray, min_area: float) -> Optional[Tuple[np.ndarray, bool]]:
         lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
         l, a, b = cv2.split(lab)
         clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
@@ -1417,13 +2356,14 @@ class DocumentDetector:
         enhanced = cv2.merge([l, a, b])
         enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
         
-        return self._try_contour_detection(enhanced)
+        return self._try_contour_detection(enhanced, min_area)
     
-    def _find_best_contour(self, contours: list, image: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    def _find_best_contour(self, contours: list, min_area: float) -> Optional[Tuple[np.ndarray, bool]]:
+        """Return the corners of the best card-shaped contour and whether they are a true quad"""
         for contour in contours[:25]:
             area = cv2.contourArea(contour)
             
-            if area < self.min_area:
+            if area < min_area:
                 continue
             
             peri = cv2.arcLength(contour, True)
@@ -1435,32 +2375,58 @@ class DocumentDetector:
                 
                 if self.aspect_ratio_range[0] <= aspect_ratio <= self.aspect_ratio_range[1]:
                     if len(approx) == 4:
-                        corners = approx
-                    else:
-                        corners = np.array([
-                            [x, y], [x + w, y],
-                            [x + w, y + h], [x, y + h]
-                        ], dtype=np.float32).reshape(-1, 1, 2).astype(np.int32)
-                    
-                    warped = self._perspective_transform(image, corners)
-                    annotated = image.copy()
-                    cv2.drawContours(annotated, [corners], -1, (0, 255, 0), 3)
+                        return approx, True
                     
-                    return warped, annotated
+                    corners = np.array([
+                        [x, y], [x + w, y],
+                        [x + w, y + h], [x, y + h]
+                    ], dtype=np.float32).reshape(-1, 1, 2).astype(np.int32)
+                    return corners, False
         
         return None
     
-    def _perspective_transform(self, image: np.ndarray, corners: np.ndarray) -> np.ndarray:
-        pts = corners.reshape(4, 2).astype('float32')
-        rect = np.zeros((4, 2), dtype='float32')
+    def _refine_corners(self, image: np.ndarray, corners: np.ndarray, scale: float) -> Tuple[np.ndarray, bool]:
+        """
+        Refine proxy-derived corners with cornerSubPix on full-resolution crops.
         
-        s = pts.sum(axis=1)
-        rect[0] = pts[np.argmin(s)]
-        rect[2] = pts[np.argmax(s)]
+        Returns (corners, refined); refined is True only if at least one corner moved.
+        """
+        if scale >= 1.0:
+            return corners, False
         
-        diff = np.diff(pts, axis=1)
-        rect[1] = pts[np.argmin(diff)]
-        rect[3] = pts[np.argmax(diff)]
+        h, w = image.shape[:2]
+        # Proxy contours sit a few pixels outside the card (blur + 2x dilation);
+        # one proxy pixel spans 1/scale full-resolution pixels
+        half_win = max(5, int(np.ceil(6.0 / scale)))
+        pad = half_win * 2
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+        
+        refined = corners.copy()
+        moved = False
+        for i, (cx, cy) in enumerate(corners):
+            x1, y1 = max(0, int(cx) - pad), max(0, int(cy) - pad)
+            x2, y2 = min(w, int(cx) + pad + 1), min(h, int(cy) + pad + 1)
+            if x2 - x1 <= 2 * half_win + 5 or y2 - y1 <= 2 * half_win + 5:
+                continue
+            
+            crop = image[y1:y2, x1:x2]
+            gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if len(crop.shape) == 3 else crop
+            point = np.array([[[cx - x1, cy - y1]]], dtype=np.float32)
+            try:
+                cv2.cornerSubPix(gray, point, (half_win, half_win), (-1, -1), criteria)
+            except cv2.error:
+                continue
+            
+            px, py = point[0, 0]
+            # Keep the coarse corner if refinement wandered off (e.g. rounded card corners)
+            if abs(px + x1 - cx) <= half_win and abs(py + y1 - cy) <= half_win:
+                refined[i] = (px + x1, py + y1)
+                moved = moved or not np.allclose(refined[i], (cx, cy), atol=1e-3)
+        
+        return refined, moved
+    
+    def _perspective_transform(self, image: np.ndarray, corners: np.ndarray) -> np.ndarray:
+        rect = self.order_corners(corners)
         
         dst = np.array([
             [0, 0],
@@ -1475,18 +2441,68 @@ class DocumentDetector:
         return warped
 
 
+# ==================== PERCEPTUAL HASHING ====================
+class PerceptualHasher:
+    """64-bit perceptual hashes of a rectified card, robust to recompression and small crops"""
+    
+    @staticmethod
+    def _to_gray(image: np.ndarray) -> np.ndarray:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    
+    @staticmethod
+    def _bits_to_hex(bits: np.ndarray) -> str:
+        return np.packbits(bits.astype(np.uint8).flatten()).tobytes().hex()
+    
+    @staticmethod
+    def phash(image: np.ndarray) -> str:
+        """DCT hash: low 8x8 frequencies of a 32x32 thumbnail against their median"""
+        small = cv2.resize(PerceptualHasher._to_gray(image), (32, 32),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8]
+        median = np.median(low.flatten()[1:])  # DC term excluded
+        return PerceptualHasher._bits_to_hex(low > median)
+    
+    @staticmethod
+    def dhash(image: np.ndarray) -> str:
+        """Gradient hash: horizontal brightness differences of a 9x8 thumbnail"""
+        small = cv2.resize(PerceptualHasher._to_gray(image), (9, 8), interpolation=cv2.INTER_AREA)
+        return PerceptualHasher._bits_to_hex(small[:, 1:] > small[:, :-1])
+    
+    @staticmethod
+    def compute(card: np.ndarray, layout: Dict) -> Dict[str, str]:
+        """Hashes of the warped card and of its photo region (hex strings)"""
+        h, w = card.shape[:2]
+        region = layout['photo_region']
+        photo = card[int(h * region['y_start']):int(h * region['y_end']),
+                     int(w * region['x_start']):int(w * region['x_end'])]
+        return {
+            'card_phash': PerceptualHasher.phash(card),
+            'card_dhash': PerceptualHasher.dhash(card),
+            'photo_phash': PerceptualHasher.phash(photo)
+        }
+
+
 # ==================== PIPELINE ====================
 class EgyptianIDVerificationPipeline:
     """Complete production pipeline with shared OCR engine"""
     
-    def __init__(self, ocr_engine: Optional[OCREngineSingleton] = None):
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    
+    def __init__(self, ocr_engine: Optional[OCREngineSingleton] = None, output_dir: Optional[str] = None,
+                 artifact_writer: Optional[ArtifactWriter] = None):
         """
         Initialize pipeline with optional pre-loaded OCR engine.
         
         Args:
             ocr_engine: Pre-initialized OCR engine. If None, will initialize globally.
+            output_dir: Where save_output writes images. If None, an 'output' folder
+                next to each input image.
+            artifact_writer: Background writer for save_output images (sampling, format).
+                If None, every artifact is saved as JPEG.
         """
         self.detector = DocumentDetector()
+        self.output_dir = output_dir
+        self.artifacts = artifact_writer if artifact_writer is not None else ArtifactWriter(output_dir)
         
         # Get or create OCR engine ONCE
         self.ocr_engine = ocr_engine if ocr_engine is not None else initialize_ocr_engine()
@@ -1494,55 +2510,63 @@ class EgyptianIDVerificationPipeline:
         # Pass shared OCR engine to verifier
         self.verifier = EnhancedEgyptianIDFeatureDetector(ocr_engine=self.ocr_engine)
     
-    def process_image(self, image_path: str, save_output: bool = True) -> Dict:
-        print(f"\n{'='*70}")
-        print(f"[FILE] Processing: {os.path.basename(image_path)}")
-        print(f"{'='*70}\n")
+    def process_image(self, image_path: str, save_output: bool = True, full_report: bool = False) -> Dict:
+        logger.info("Processing: %s", os.path.basename(image_path))
         
         image = cv2.imread(image_path)
         if image is None:
-            print("[X] Cannot read image\n")
-            return {'success': False, 'error': 'Cannot read image', 'is_egyptian_id': False}
+            logger.warning("Cannot read image: %s", image_path)
+            return {'success': False, 'error': 'Cannot read image', 'is_egyptian_id': False,
+                    'file': os.path.basename(image_path)}
         
-        print(f"[OK] Image loaded: {image.shape[1]}x{image.shape[0]} pixels\n")
+        return self.process_array(image, image_path, save_output=save_output, full_report=full_report)
+    
+    def process_array(self, image: np.ndarray, image_path: str, save_output: bool = True,
+                      full_report: bool = False) -> Dict:
+        """process_image for an already decoded image (image_path names the outputs)"""
+        logger.debug("Image loaded: %dx%d pixels", image.shape[1], image.shape[0])
         
-        print("Step 1: Document Detection")
-        print("-" * 70)
-        extracted, annotated = self.detector.detect_and_extract(image)
+        localization = self.detector.localize(image)
         
-        if extracted is None:
-            print("[X] No document detected\n")
-            return {'success': False, 'error': 'No document detected', 'is_egyptian_id': False}
+        if not localization.found:
+            logger.info("No document detected")
+            return {'success': False, 'error': 'No document detected', 'is_egyptian_id': False,
+                    'detection_strategy': localization.strategy, 'file': os.path.basename(image_path)}
         
-        print(f"[OK] Document extracted: {extracted.shape[1]}x{extracted.shape[0]} pixels\n")
+        extracted = self.detector.extract(image, localization)
+        logger.debug("Document extracted: %dx%d pixels (strategy: %s)",
+                     extracted.shape[1], extracted.shape[0], localization.strategy)
         
-        print("Step 2: Egyptian National ID Verification")
-        print("-" * 70)
-        verification = self.verifier.verify_all_features(extracted)
+        verification = self.verifier.verify_all_features(extracted, full_report=full_report)
         
         if save_output:
-            self._save_results(image_path, extracted, annotated, verification)
+            # Annotation is only rendered for saved (sampled) debug output, on the writer thread
+            self._save_results(image_path, extracted, lambda: self.detector.annotate(image, localization),
+                               verification)
         
         return {
             'success': True,
             'is_egyptian_id': verification['is_egyptian_national_id'],
             'confidence': verification['confidence'],
             'verification': verification,
+            'detection_strategy': localization.strategy,
             'file': os.path.basename(image_path)
         }
     
     def _save_results(self, image_path: str, extracted: np.ndarray,
-                     annotated: Optional[np.ndarray], verification: Dict):
-        output_dir = r'C:\Users\asus\Downloads\id_checker\output'
-        os.makedirs(output_dir, exist_ok=True)
-        
+                     annotated: Optional[Callable[[], Optional[np.ndarray]]], verification: Dict):
+        """Queue the extracted/annotated/result images on the artifact writer (rendered off-thread)"""
+        output_dir = self.output_dir or os.path.join(os.path.dirname(os.path.abspath(image_path)), 'output')
         base_name = os.path.splitext(os.path.basename(image_path))[0]
         
-        cv2.imwrite(os.path.join(output_dir, f'{base_name}_extracted.jpg'), extracted)
-        
-        if annotated is not None:
-            cv2.imwrite(os.path.join(output_dir, f'{base_name}_annotated.jpg'), annotated)
-        
+        self.artifacts.submit(base_name, {
+            'extracted': extracted,
+            'annotated': annotated,
+            'result': lambda: self._render_result_image(extracted, verification)
+        }, passed=verification['is_egyptian_national_id'], output_dir=output_dir)
+    
+    @staticmethod
+    def _render_result_image(extracted: np.ndarray, verification: Dict) -> np.ndarray:
         result_img = extracted.copy()
         
         is_valid = verification['is_egyptian_national_id']
@@ -1569,30 +2593,24 @@ class EgyptianIDVerificationPipeline:
                            f"{info['age']}y | {info['gender']} | {info['governorate']}",
                            (15, 140), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
         
-        cv2.imwrite(os.path.join(output_dir, f'{base_name}_result.jpg'), result_img)
+        return result_img
+    
+    def iter_folder_images(self, folder_path: str):
+        """Image files directly inside folder_path, in name order (yielded lazily)"""
+        with os.scandir(folder_path) as entries:
+            names = sorted(entry.name for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(self.IMAGE_EXTENSIONS))
+        for name in names:
+            yield os.path.join(folder_path, name)
     
     def process_folder(self, folder_path: str) -> List[Dict]:
-        extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.tiff']
-        image_files = []
-        
-        for ext in extensions:
-            image_files.extend(glob.glob(os.path.join(folder_path, ext)))
-            image_files.extend(glob.glob(os.path.join(folder_path, ext.upper())))
-        
-        image_files = sorted(list(set(image_files)))
+        """Process every image of a folder in this process (see batch_runner.py for large archives)"""
+        results = [self.process_image(img_path, save_output=True, full_report=True)
+                   for img_path in self.iter_folder_images(folder_path)]
+        self.artifacts.flush()
         
-        if not image_files:
-            print(f"[X] No images found in {folder_path}")
-            return []
-        
-        print(f"\n{'='*70}")
-        print(f"[SEARCH] Found {len(image_files)} unique images")
-        print(f"{'='*70}")
-        
-        results = []
-        for img_path in image_files:
-            result = self.process_image(img_path, save_output=True)
-            results.append(result)
+        if not results:
+            logger.warning("No images found in %s", folder_path)
         
         return results
 
@@ -1622,40 +2640,113 @@ class IDVerificationService:
             if self._initialized:
                 return
             
-            print("Initializing ID Verification Service...")
+            logger.info("Initializing ID Verification Service...")
             # Initialize OCR once
             self.ocr_engine = initialize_ocr_engine()
             # Create pipeline with shared OCR
             self.pipeline = EgyptianIDVerificationPipeline(ocr_engine=self.ocr_engine)
             self._initialized = True
-            print("ID Verification Service ready!")
+            logger.info("ID Verification Service ready!")
     
     def verify_image(self, image_path: str) -> Dict:
         """Thread-safe image verification"""
         return self.pipeline.process_image(image_path, save_output=False)
     
-    def verify_image_array(self, image: np.ndarray) -> Dict:
-        """Verify image from numpy array (useful for web uploads)"""
+    def verify_image_array(self, image: np.ndarray, annotate: bool = False, full_report: bool = False,
+                           budget_seconds: Optional[float] = None,
+                           reuse_result: Optional[Callable[[Dict[str, str]], Optional[Dict]]] = None,
+                           face_images: Optional[List[np.ndarray]] = None,
+                           keep_photo_region: bool = False,
+                           id_number_hint: Optional[Callable[[], Optional[str]]] = None) -> Dict:
+        """
+        Verify image from numpy array (useful for web uploads).
+        
+        With annotate=True the result also carries an 'annotated' image with the
+        detected card outline (debug only - costs a full copy of the input).
+        full_report=True disables the short-circuit evaluation and runs every check.
+        budget_seconds bounds card localization and the feature checks (see
+        verify_all_features).
+        
+        The result carries perceptual hashes of the warped card. reuse_result is
+        called with them before any feature check runs; if it returns a stored
+        result (a trusted near-duplicate), its visual checks are reused and only
+        the rest - at least the ID number, so no field of the other session's
+        card is ever returned - is run on this card.
+        
+        face_images (e.g. the normalized selfie) are searched for faces in the same
+        detector call as the card's photo region; their detections are returned
+        under 'face_detections' (absent when the card was not verified).
+        keep_photo_region=True adds the card's 'photo_region' image (for face matching).
+        id_number_hint is passed on to verify_all_features (the id_back barcode number, a cross-check only).
+        """
         # Detect document
-        extracted, _ = self.pipeline.detector.detect_and_extract(image)
+        deadline = time.monotonic() + budget_seconds if budget_seconds is not None else None
+        with deadline_scope(deadline):
+            localization = self.pipeline.detector.localize(image)
         
-        if extracted is None:
-            return {'success': False, 'error': 'No document detected', 'is_egyptian_id': False}
+        if not localization.found:
+            return {'success': False, 'error': 'No document detected', 'is_egyptian_id': False,
+                    'detection_strategy': localization.strategy}
+        
+        extracted = self.pipeline.detector.extract(image, localization)
+        hashes = PerceptualHasher.compute(extracted, self.pipeline.verifier.config.LAYOUT)
+        
+        verifier = self.pipeline.verifier
+        known_results = None
+        if reuse_result is not None:
+            reused = reuse_result(hashes)
+            if reused is not None and reused.get('success'):
+                known_results = self._reusable_results(reused['verification'])
+        
+        photo_faces = face_detections = None
+        if face_images:
+            photo_faces, face_detections = verifier.photo_faces_batch(extracted, face_images)
         
         # Verify features
-        verification = self.pipeline.verifier.verify_all_features(extracted)
+        if deadline is not None:
+            budget_seconds = deadline - time.monotonic()
+        verification = verifier.verify_all_features(extracted, full_report=full_report,
+                                                    budget_seconds=budget_seconds, photo_faces=photo_faces,
+                                                    id_number_hint=id_number_hint,
+                                                    known_results=known_results)
         
-        return {
+        result = {
             'success': True,
             'is_egyptian_id': verification['is_egyptian_national_id'],
             'confidence': verification['confidence'],
-            'verification': verification
+            'timed_out': verification['timed_out'],
+            'verification': verification,
+            'detection_strategy': localization.strategy,
+            'perceptual_hashes': hashes
         }
+        if known_results:
+            result['reused_near_duplicate'] = True
+        if face_detections is not None:
+            result['face_detections'] = face_detections
+        if keep_photo_region:
+            result['photo_region'] = verifier._get_region(extracted, 'photo_region')
+        if annotate:
+            result['annotated'] = self.pipeline.detector.annotate(image, localization)
+        
+        return result
+    
+    @staticmethod
+    def _reusable_results(verification: Dict) -> Dict[str, FeatureResult]:
+        """
+        Visual check results of a stored verification (evaluated, not timed out).
+        Only passed/score/message carry over; details belong to the other card.
+        """
+        return {name: FeatureResult(feature['passed'], feature['score'], feature['message'],
+                                    {'reused_from_near_duplicate': True})
+                for name, feature in verification['features'].items()
+                if name in verification['evaluated_features'] and not feature['timed_out']
+                and name not in EnhancedEgyptianIDFeatureDetector.PER_CARD_FEATURES}
 
 
 # ==================== MAIN ====================
 def main():
     folder_path = r'C:\Users\asus\Downloads\id_checker'
+    configure_logging(level='INFO')
     
     print("\n" + "="*70)
     print("EGYPTIAN ID VERIFIER - ENHANCED VERSION")
@@ -1716,7 +2807,7 @@ def main():
             print(f"[X] {name:30} - NOT Egyptian ID ({conf:.1f}%)")
     
     print(f"\n{'='*70}")
-    print(f"[Saved] Saved to: {folder_path}\\output")
+    print(f"[Saved] Saved to: {os.path.join(folder_path, 'output')}")
     print(f"{'='*70}\n")
 
 
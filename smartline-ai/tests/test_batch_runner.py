@@ -0,0 +1,95 @@
+# test_batch_runner.py
+"""
+BatchRunner checkpointing: a path is checkpointed only once its result can be
+read back, and resuming skips exactly the checkpointed paths.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from batch_runner import BatchRunner, Checkpoint, JSONLResultWriter, ParquetResultWriter  # noqa: E402
+
+
+def record(path):
+    return {'path': path, 'file': os.path.basename(path), 'success': True, 'is_egyptian_id': True,
+            'confidence': 0.9, 'verification': {'extracted_data': {}}}
+
+
+class CrashingRunner(BatchRunner):
+    """Verifies nothing: yields a record per path and crashes after crash_after of them"""
+
+    def __init__(self, output_dir, crash_after=None, **kwargs):
+        super().__init__(output_dir, workers=0, **kwargs)
+        self.crash_after = crash_after
+
+    def _results(self, paths):
+        for count, path in enumerate(paths):
+            if count == self.crash_after:
+                raise RuntimeError("worker crashed")
+            yield record(path)
+
+
+def read_parquet_paths(output_dir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    return [path for part in sorted(glob.glob(os.path.join(output_dir, 'results-*.parquet')))
+            for path in pq.read_table(part).column('path').to_pylist()]
+
+
+def test_parquet_paths_are_reported_only_once_readable(tmp_path):
+    pytest.importorskip('pyarrow')
+    writer = ParquetResultWriter(str(tmp_path), rows_per_part=4)
+    reported = []
+    for i in range(10):
+        reported += writer.write(record(f"img{i}.jpg"))
+        # Killed here, without close(): everything reported so far must be on disk
+        assert read_parquet_paths(str(tmp_path)) == reported
+    assert reported == [f"img{i}.jpg" for i in range(8)]
+    assert writer.close() == ["img8.jpg", "img9.jpg"]
+    assert read_parquet_paths(str(tmp_path)) == [f"img{i}.jpg" for i in range(10)]
+
+
+def test_parquet_unfinished_part_is_ignored(tmp_path):
+    pytest.importorskip('pyarrow')
+    (tmp_path / 'results-00000.parquet.tmp').write_bytes(b'PAR1 no footer')
+    writer = ParquetResultWriter(str(tmp_path), rows_per_part=2)
+    writer.write(record("a.jpg"))
+    writer.write(record("b.jpg"))
+    assert read_parquet_paths(str(tmp_path)) == ["a.jpg", "b.jpg"]
+
+
+@pytest.mark.parametrize('output_format', ['jsonl', 'parquet'])
+def test_resume_skips_only_checkpointed_paths(tmp_path, output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    paths = [f"img{i}.jpg" for i in range(25)]
+    with pytest.raises(RuntimeError):
+        CrashingRunner(str(tmp_path), crash_after=13, output_format=output_format).run(iter(paths))
+    done = Checkpoint(str(tmp_path / 'checkpoint.txt')).done
+    assert done == set(paths[:13])
+
+    stats = CrashingRunner(str(tmp_path), output_format=output_format).run(iter(paths))
+    assert stats['skipped'] == 13 and stats['processed'] == 12
+
+    if output_format == 'jsonl':
+        with open(tmp_path / 'results.jsonl', encoding='utf-8') as f:
+            written = [json.loads(line)['path'] for line in f]
+    else:
+        written = read_parquet_paths(str(tmp_path))
+    assert sorted(written) == sorted(paths)
+
+
+def test_jsonl_reports_each_record_once_written(tmp_path):
+    writer = JSONLResultWriter(str(tmp_path))
+    assert writer.write(record("a.jpg")) == ["a.jpg"]
+    with open(writer.path, encoding='utf-8') as f:
+        assert json.loads(f.readline())['path'] == "a.jpg"
+    assert writer.close() == []
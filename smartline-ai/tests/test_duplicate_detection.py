@@ -0,0 +1,142 @@
+# test_duplicate_detection.py
+"""
+HammingIndex pigeonhole search against a brute-force scan, and the card/photo
+matching rules of NearDuplicateIndex.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from duplicate_detection import HammingIndex, NearDuplicateIndex, popcount64  # noqa: E402
+
+
+def flip_bits(value, bits):
+    for bit in bits:
+        value ^= 1 << int(bit)
+    return value
+
+
+def brute_force(hashes, query, radius):
+    distances = [bin(h ^ query).count('1') for h in hashes]
+    return {position for position, distance in enumerate(distances) if distance <= radius}
+
+
+def populated_index(max_distance, tail_merge_size, seed=0):
+    """Random hashes plus near neighbours of a few of them, split between sorted chunks and tail"""
+    rng = np.random.default_rng(seed)
+    index = HammingIndex(max_distance)
+    index.TAIL_MERGE_SIZE = tail_merge_size
+    hashes = [int(h) for h in rng.integers(0, 2 ** 63, size=300, dtype=np.uint64) * 2 + rng.integers(0, 2, 300)]
+    for base in hashes[:40]:
+        for flips in range(max_distance + 3):
+            hashes.append(flip_bits(base, rng.choice(64, size=flips, replace=False)))
+    for h in hashes:
+        index.add(h)
+    return index, hashes, rng
+
+
+def test_popcount64():
+    values = np.array([0, 1, 0xFFFFFFFFFFFFFFFF, 0x8000000000000001], dtype=np.uint64)
+    assert popcount64(values).tolist() == [0, 1, 64, 2]
+
+
+@pytest.mark.parametrize('tail_merge_size', [64, 4096])  # mostly sorted chunks / tail only
+@pytest.mark.parametrize('max_distance', [3, 4, 8])
+def test_query_matches_brute_force(max_distance, tail_merge_size):
+    index, hashes, rng = populated_index(max_distance, tail_merge_size)
+    queries = [flip_bits(h, rng.choice(64, size=int(rng.integers(0, max_distance + 2)), replace=False))
+               for h in hashes[:40]] + [int(h) for h in rng.integers(0, 2 ** 63, size=20, dtype=np.uint64)]
+    for query in queries:
+        for radius in range(max_distance + 1):
+            positions, distances = index.query(query, radius)
+            assert set(positions.tolist()) == brute_force(hashes, query, radius)
+            assert distances.tolist() == sorted(distances.tolist())
+            for position, distance in zip(positions, distances):
+                assert distance == bin(hashes[position] ^ query).count('1')
+
+
+def test_worst_case_spread_is_found():
+    """Differences spread evenly over the chunks, max_distance // 4 bits each"""
+    index = HammingIndex(max_distance=8)
+    index.TAIL_MERGE_SIZE = 1
+    base = 0x0123456789ABCDEF
+    spread = flip_bits(base, [0, 1, 16, 17, 32, 33, 48, 49])
+    index.add(spread)
+    positions, distances = index.query(base, 8)
+    assert positions.tolist() == [0] and distances.tolist() == [8]
+    assert len(index.query(base, 7)[0]) == 0
+
+
+def test_radius_above_max_distance_is_rejected():
+    with pytest.raises(ValueError):
+        HammingIndex(max_distance=4).query(0, 5)
+
+
+def hashes_of(card_phash, card_dhash, photo_phash):
+    return {'card_phash': f"{card_phash:016x}", 'card_dhash': f"{card_dhash:016x}",
+            'photo_phash': f"{photo_phash:016x}"}
+
+
+def test_card_match_needs_the_photo_too():
+    index = NearDuplicateIndex(max_distance=4, reuse_max_distance=2)
+    card, dhash, photo = 0x0F0F0F0F0F0F0F0F, 0x3333333333333333, 0x5555555555555555
+    index.add('same-template', hashes_of(card, dhash, photo ^ 0xFFFF), result_key='a', trusted=True)
+    index.add('same-card', hashes_of(card ^ 0b1, dhash ^ 0b10, photo ^ 0b100), result_key='b', trusted=True)
+
+    matches = index.lookup(hashes_of(card, dhash, photo))
+    assert [m['session_id'] for m in matches['card']] == ['same-card']
+    assert matches['card'][0]['distance'] == 1
+    assert matches['photo'] == []
+    assert index.trusted_result_key(matches) == 'b'
+
+
+def test_photo_only_match_is_not_reused():
+    index = NearDuplicateIndex(max_distance=4, reuse_max_distance=2)
+    photo = 0x5555555555555555
+    index.add('pasted-portrait', hashes_of(0, 0, photo ^ 0b1), result_key='a', trusted=True)
+
+    matches = index.lookup(hashes_of(0xFFFFFFFF00000000, 0xFFFFFFFF00000000, photo), exclude_session='other')
+    assert matches['card'] == []
+    assert [m['session_id'] for m in matches['photo']] == ['pasted-portrait']
+    assert index.trusted_result_key(matches) is None
+
+
+def test_same_template_cluster_matches_brute_force():
+    """Card hashes a few bits from one template, photos telling the cards apart"""
+    rng = np.random.default_rng(1)
+    base_card, base_dhash = 0x0F0F0F0F0F0F0F0F, 0x3333333333333333
+    index = NearDuplicateIndex(max_distance=4)
+    entries = []
+    for i in range(2000):
+        if i % 4 == 3:  # a resubmission of the previous card
+            photo = flip_bits(entries[-1][2], rng.choice(64, 3, replace=False))
+        else:
+            photo = int(rng.integers(0, 2 ** 63))
+        entry = (flip_bits(base_card, rng.choice(64, int(rng.integers(0, 4)), replace=False)),
+                 flip_bits(base_dhash, rng.choice(64, int(rng.integers(0, 4)), replace=False)), photo)
+        entries.append(entry)
+        index.add(f"s{i}", hashes_of(*entry))
+
+    for query in entries[::50]:
+        matches = index.lookup(hashes_of(*query))
+        distances = [[bin(a ^ b).count('1') for a, b in zip(entry, query)] for entry in entries]
+        assert {m['session_id'] for m in matches['card']} == {
+            f"s{i}" for i, d in enumerate(distances) if max(d) <= 4}
+        assert {m['session_id'] for m in matches['photo']} == {
+            f"s{i}" for i, d in enumerate(distances) if d[2] <= 4 < max(d)}
+
+
+def test_reuse_radius_applies_to_the_photo():
+    index = NearDuplicateIndex(max_distance=4, reuse_max_distance=2)
+    index.add('s1', hashes_of(0, 0, 0b111), result_key='a', trusted=True)
+    matches = index.lookup(hashes_of(0, 0, 0))
+    assert matches['card'][0]['distance'] == 3
+    assert index.trusted_result_key(matches) is None
@@ -0,0 +1,109 @@
+# test_face_index.py
+"""
+FaceEmbeddingIndex exclusions: a search leaves out the session's own entry and
+the captain's own entries (same driver_id or same verified ID number), before
+and after compaction, even when those are the nearest; indexes created before
+ID numbers were recorded are migrated.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from face_index import DIM, FaceEmbeddingIndex  # noqa: E402
+
+
+def person(seed):
+    rng = np.random.default_rng(seed)
+    identity = rng.normal(size=DIM).astype(np.float32)
+    return identity / np.linalg.norm(identity)
+
+
+def selfie(identity, seed, jitter=0.01):
+    return identity + np.random.default_rng(seed).normal(scale=jitter, size=DIM).astype(np.float32)
+
+
+def new_index(directory=None):
+    return FaceEmbeddingIndex(directory, nlist=8, nprobe=8, compact_threshold=10 ** 9)
+
+
+def sessions(matches):
+    return {match['session_id'] for match in matches}
+
+
+def populated(directory=None):
+    """One face behind four accounts: driver a (two sessions), driver b on the same ID number, driver c"""
+    index = new_index(directory)
+    face = person(0)
+    index.add('a', 'a1', selfie(face, 1), id_number='29001011234567')
+    index.add('a', 'a2', selfie(face, 2), id_number='29001011234567')
+    index.add('b', 'b1', selfie(face, 3), id_number='29001011234567')
+    index.add('c', 'c1', selfie(face, 4), id_number='28505051234567')
+    index.add('d', 'd1', selfie(person(9), 5))
+    return index, face
+
+
+def test_exclusions():
+    index, face = populated()
+    query = selfie(face, 10)
+    assert sessions(index.search(query)) == {'a1', 'a2', 'b1', 'c1'}
+    assert sessions(index.search(query, exclude_session='a2')) == {'a1', 'b1', 'c1'}
+    assert sessions(index.search(query, exclude_driver='a')) == {'b1', 'c1'}
+    assert sessions(index.search(query, exclude_driver='a', exclude_id_number='29001011234567')) == {'c1'}
+
+
+def test_missing_driver_or_id_number_excludes_nothing():
+    index = new_index()
+    face = person(0)
+    index.add(None, 'anonymous', selfie(face, 1))
+    query = selfie(face, 2)
+    assert sessions(index.search(query, exclude_driver=None, exclude_id_number=None)) == {'anonymous'}
+    assert sessions(index.search(query, exclude_driver='a', exclude_id_number='29001011234567')) == {'anonymous'}
+
+
+def test_exclusions_after_compaction_and_restart(tmp_path):
+    index, face = populated(str(tmp_path))
+    index.compact()
+    index.add('e', 'e1', selfie(face, 6), id_number='29001011234567')  # in the delta
+
+    restarted = new_index(str(tmp_path))
+    assert len(restarted) == 6
+    assert sessions(restarted.search(selfie(face, 10), exclude_driver='c',
+                                     exclude_id_number='29001011234567')) == set()
+    assert sessions(restarted.search(selfie(face, 10), exclude_driver='a')) == {'b1', 'c1', 'e1'}
+
+
+def test_own_sessions_nearest_do_not_hide_other_captains():
+    index = new_index()
+    face = person(0)
+    # More of the captain's own sessions than one metadata batch, all nearer than the other account
+    for i in range(index.max_matches * 4 + 5):
+        index.add('own', f"own{i}", selfie(face, 100 + i, jitter=0.001))
+    index.add('other', 'other1', selfie(face, 1, jitter=0.02))
+
+    matches = index.search(selfie(face, 2, jitter=0.001), exclude_driver='own')
+    assert sessions(matches) == {'other1'}
+
+
+def test_index_without_id_numbers_is_migrated(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'faces.sqlite'))
+    db.execute("CREATE TABLE face_entries (entry_id INTEGER PRIMARY KEY, driver_id TEXT,"
+               " session_id TEXT NOT NULL, created_at REAL NOT NULL, embedding BLOB)")
+    face = person(0)
+    db.execute("INSERT INTO face_entries (driver_id, session_id, created_at, embedding) VALUES (?, ?, 0, ?)",
+               ('a', 'old1', selfie(face, 1).astype(np.float16).tobytes()))
+    db.commit()
+    db.close()
+
+    index = new_index(str(tmp_path))
+    index.add('b', 'new1', selfie(face, 2), id_number='29001011234567')
+    query = selfie(face, 3)
+    assert sessions(index.search(query)) == {'old1', 'new1'}
+    assert sessions(index.search(query, exclude_id_number='29001011234567')) == {'old1'}
@@ -0,0 +1,125 @@
+# test_feature_executor.py
+"""
+FeatureCheckExecutor deadlines: a check over its own deadline is abandoned while
+the others finish, the run budget ends the run, abandoned checks are counted
+until they return, and a run never has more than max_workers checks in flight.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from production_egyptian_id_verifier_enhanced import (  # noqa: E402
+    FeatureCheckExecutor, FeatureNode, current_deadline, deadline_passed
+)
+
+
+@pytest.fixture
+def release():
+    """Event that blocked checks wait on; set at teardown so no thread outlives the test"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def value(result):
+    return FeatureNode(f"fast{result}", lambda _: result)
+
+
+def blocked(name, release, deadline_seconds=None):
+    return FeatureNode(name, lambda _: release.wait(5) and name, deadline_seconds=deadline_seconds)
+
+
+def test_check_over_its_deadline_is_abandoned(release):
+    executor = FeatureCheckExecutor(max_workers=4, straggler_workers=4)
+    start = time.monotonic()
+    results, timed_out = executor.run([blocked('slow', release, deadline_seconds=0.1), value(1), value(2)])
+
+    assert time.monotonic() - start < 2.0
+    assert timed_out == ['slow']
+    assert results == {'fast1': 1, 'fast2': 2}
+
+
+def test_run_budget_ends_the_run(release):
+    executor = FeatureCheckExecutor(max_workers=2, straggler_workers=4)
+    start = time.monotonic()
+    results, timed_out = executor.run([blocked('a', release), blocked('b', release), value(1)],
+                                      budget_seconds=0.1)
+
+    assert time.monotonic() - start < 2.0
+    assert results == {}
+    assert sorted(timed_out) == ['a', 'b', 'fast1']  # running ones abandoned, queued one never started
+
+
+def test_checks_see_their_deadline():
+    seen = {}
+
+    def record(_):
+        seen['deadline'] = current_deadline()
+        return deadline_passed()
+
+    executor = FeatureCheckExecutor(max_workers=2)
+    before = time.monotonic()
+    results, _ = executor.run([FeatureNode('check', record, deadline_seconds=5.0)], budget_seconds=10.0)
+    assert results == {'check': False}
+    assert before + 4.0 < seen['deadline'] <= time.monotonic() + 5.0
+
+
+def test_abandoned_checks_are_counted_until_they_return(release):
+    executor = FeatureCheckExecutor(max_workers=2, straggler_workers=4)
+    before = FeatureCheckExecutor.stats()
+    executor.run([blocked('slow', release, deadline_seconds=0.05)])
+
+    stats = FeatureCheckExecutor.stats()
+    assert stats['abandoned_running'] == before['abandoned_running'] + 1
+    assert stats['abandoned_total'] == before['abandoned_total'] + 1
+
+    release.set()
+    for _ in range(100):
+        if FeatureCheckExecutor.stats()['abandoned_running'] == before['abandoned_running']:
+            break
+        time.sleep(0.01)
+    assert FeatureCheckExecutor.stats()['abandoned_running'] == before['abandoned_running']
+
+
+def test_run_keeps_at_most_max_workers_in_flight():
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def check(_):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(0.02)
+        with lock:
+            state['running'] -= 1
+        return True
+
+    executor = FeatureCheckExecutor(max_workers=2, straggler_workers=4)
+    results, timed_out = executor.run([FeatureNode(f"c{i}", check) for i in range(8)])
+    assert len(results) == 8 and not timed_out
+    assert state['peak'] <= 2
+
+
+def test_should_stop_leaves_remaining_checks_out():
+    executor = FeatureCheckExecutor(max_workers=1)  # inline: one check at a time, in order
+    results, timed_out = executor.run([value(i) for i in range(5)],
+                                      should_stop=lambda done: len(done) >= 2)
+    assert list(results) == ['fast0', 'fast1']
+    assert timed_out == []
+
+
+def test_serial_deadline_keeps_later_checks_from_starting():
+    executor = FeatureCheckExecutor(max_workers=1)
+    results, timed_out = executor.run([FeatureNode('slow', lambda _: time.sleep(0.15) or 'done'), value(1)],
+                                      budget_seconds=0.1)
+    assert results == {'slow': 'done'}  # inline checks cannot be abandoned
+    assert timed_out == ['fast1']
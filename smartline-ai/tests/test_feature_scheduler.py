@@ -0,0 +1,99 @@
+# test_feature_scheduler.py
+"""
+Short-circuit scheduling of EnhancedEgyptianIDFeatureDetector.verify_all_features:
+a clear accept and a clear reject stop before every check has run. The checks
+are stubbed with fixed scores and run inline (single-worker executor) so the
+evaluation order is deterministic.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from production_egyptian_id_verifier_enhanced import (  # noqa: E402
+    EnhancedEgyptianIDFeatureDetector, FeatureCheckExecutor, FeatureResult
+)
+
+
+@pytest.fixture(scope='module')
+def detector():
+    detector = EnhancedEgyptianIDFeatureDetector()
+    detector.executor = FeatureCheckExecutor(max_workers=1)
+    return detector
+
+
+def stub_checks(detector, monkeypatch, visual_score, id_score):
+    """Replace every check with one returning a fixed score; returns the names called, in order"""
+    called = []
+
+    def check(name, score):
+        def run(image, glare=None):
+            called.append(name)
+            details = {'id_number': '29001011234567'} if name == 'id_number_valid' and score else {}
+            return FeatureResult(score >= 0.5, score, "stub", details)
+        return run
+
+    checks = {name: check(name, id_score if name == 'id_number_valid' else visual_score)
+              for name in detector.config.WEIGHTS}
+    monkeypatch.setattr(detector, '_feature_checks', lambda: checks)
+    return called
+
+
+def card():
+    return np.full((300, 480, 3), 128, dtype=np.uint8)
+
+
+def test_id_number_is_evaluated_first(detector):
+    order = detector._evaluation_order()
+    assert order[0] == 'id_number_valid'
+    assert sorted(order) == sorted(detector.config.WEIGHTS)
+
+
+def test_clear_accept_stops_early(detector, monkeypatch):
+    called = stub_checks(detector, monkeypatch, visual_score=0.95, id_score=1.0)
+    result = detector.verify_all_features(card())
+
+    assert result['is_egyptian_national_id']
+    assert result['short_circuited'] and result['skipped_features']
+    assert called[0] == 'id_number_valid'
+    assert len(called) < len(detector.config.WEIGHTS)
+    assert result['confidence'] >= detector.config.HIGH_CONFIDENCE
+    assert result['extracted_data']['id_number'] == '29001011234567'
+
+
+def test_clear_reject_stops_early(detector, monkeypatch):
+    called = stub_checks(detector, monkeypatch, visual_score=0.0, id_score=0.0)
+    result = detector.verify_all_features(card())
+
+    assert not result['is_egyptian_national_id']
+    assert result['short_circuited']
+    assert len(called) < len(detector.config.WEIGHTS)
+    assert result['confidence_bounds']['upper'] < detector.config.REVIEW_CONFIDENCE
+
+
+def test_borderline_card_runs_every_check(detector, monkeypatch):
+    # Confidence 0.74: above the strict threshold only once the last check is in
+    called = stub_checks(detector, monkeypatch, visual_score=0.8, id_score=0.5)
+    monkeypatch.setattr(detector, '_detect_driving_license',
+                        lambda image, glare: {'detected': False, 'keywords': []})
+    result = detector.verify_all_features(card())
+
+    assert not result['short_circuited']
+    assert sorted(called) == sorted(detector.config.WEIGHTS)
+
+
+def test_full_report_never_stops_early(detector, monkeypatch):
+    called = stub_checks(detector, monkeypatch, visual_score=0.95, id_score=1.0)
+    monkeypatch.setattr(detector, '_detect_driving_license',
+                        lambda image, glare: {'detected': False, 'keywords': []})
+    result = detector.verify_all_features(card(), full_report=True)
+
+    assert not result['short_circuited']
+    assert sorted(called) == sorted(detector.config.WEIGHTS)
@@ -0,0 +1,72 @@
+# test_image_ingest.py
+"""
+MultipartIngest: file parts land in pooled buffers, fields as text, and a body
+that is cut short or malformed raises MultipartError.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('multipart')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from image_ingest import BufferPool, MultipartError, MultipartIngest  # noqa: E402
+
+BOUNDARY = 'kyc-test-boundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def body(*parts, closed=True):
+    """multipart/form-data body of (name, filename or None, content) parts"""
+    out = b''
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        out += f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + content + b'\r\n'
+    return out + (f'--{BOUNDARY}--\r\n'.encode() if closed else b'')
+
+
+def ingest(data, chunk_size=7, **kwargs):
+    leases = []
+    parser = MultipartIngest(CONTENT_TYPE, BufferPool(), leases, **kwargs)
+    for start in range(0, len(data), chunk_size):
+        parser.feed(data[start:start + chunk_size])
+    parser.finish()
+    return parser
+
+
+def test_fields_and_files():
+    parser = ingest(body(('session_id', None, b's-1'), ('selfie', 'selfie.jpg', b'\xff\xd8' + b'x' * 100)))
+    assert parser.fields == {'session_id': 's-1'}
+    assert bytes(parser.files['selfie'].view()) == b'\xff\xd8' + b'x' * 100
+
+
+@pytest.mark.parametrize('cut', [
+    lambda data: data[:-len(f'--{BOUNDARY}--\r\n')],  # closing boundary missing
+    lambda data: data[:len(data) // 2],  # stopped inside a file part
+    lambda data: data[:20],  # stopped inside the first headers
+])
+def test_truncated_body_is_rejected(cut):
+    data = body(('session_id', None, b's-1'), ('selfie', 'selfie.jpg', b'x' * 100))
+    with pytest.raises(MultipartError):
+        ingest(cut(data))
+
+
+def test_empty_body_is_rejected():
+    with pytest.raises(MultipartError):
+        ingest(b'')
+
+
+def test_oversized_part_is_rejected():
+    with pytest.raises(MultipartError):
+        ingest(body(('selfie', 'selfie.jpg', b'x' * 2000)), max_part_size=1000)
+
+
+def test_content_type_without_boundary_is_rejected():
+    with pytest.raises(MultipartError):
+        MultipartIngest('multipart/form-data', BufferPool(), [])
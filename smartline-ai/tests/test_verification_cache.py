@@ -0,0 +1,102 @@
+# test_verification_cache.py
+"""
+VerificationResultCache: hits for the same bytes under the same configuration,
+misses once EnhancedConfig's fingerprint changes (memory and SQLite tiers), TTL
+and LRU eviction.
+
+Usage:
+    python -m pytest smartline-ai/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from production_egyptian_id_verifier_enhanced import EnhancedConfig  # noqa: E402
+from verification_cache import VerificationResultCache  # noqa: E402
+
+RESULT = {'success': True, 'confidence': np.float64(0.9), 'boxes': np.array([[1, 2, 3, 4]])}
+
+
+def test_same_bytes_hit():
+    cache = VerificationResultCache(EnhancedConfig.fingerprint)
+    key = cache.make_key(b'jpeg bytes')
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(cache.make_key(bytearray(b'jpeg bytes'))) == {
+        'success': True, 'confidence': 0.9, 'boxes': [[1, 2, 3, 4]]}
+    assert cache.get(cache.make_key(b'other bytes')) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_config_change_changes_the_fingerprint(monkeypatch):
+    fingerprint = EnhancedConfig.fingerprint()
+    monkeypatch.setattr(EnhancedConfig, 'CONFIDENCE_THRESHOLD', EnhancedConfig.CONFIDENCE_THRESHOLD + 0.01)
+    assert EnhancedConfig.fingerprint() != fingerprint
+    monkeypatch.undo()
+    assert EnhancedConfig.fingerprint() == fingerprint
+
+    monkeypatch.setattr(EnhancedConfig, 'WEIGHTS', {**EnhancedConfig.WEIGHTS, 'aspect_ratio': 0.07})
+    assert EnhancedConfig.fingerprint() != fingerprint
+
+
+def test_config_change_is_a_miss(monkeypatch):
+    cache = VerificationResultCache(EnhancedConfig.fingerprint)
+    key = cache.make_key(b'jpeg bytes')
+    cache.put(key, RESULT)
+    assert cache.get(key) is not None
+
+    monkeypatch.setattr(EnhancedConfig, 'ID_NUMBER_OVERRIDE', 0.95)
+    assert cache.get(key) is None
+    assert cache.stats()['entries'] == 0
+
+    # Switching back does not resurrect results dropped under the other configuration
+    monkeypatch.undo()
+    assert cache.get(key) is None
+
+
+def test_disk_tier_survives_restarts_but_not_config_changes(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'cache.sqlite')
+    cache = VerificationResultCache(EnhancedConfig.fingerprint, db_path=db_path)
+    key = cache.make_key(b'jpeg bytes')
+    cache.put(key, RESULT)
+
+    restarted = VerificationResultCache(EnhancedConfig.fingerprint, db_path=db_path)
+    assert restarted.get(key)['success']
+
+    # A config change seen by a running cache drops the stored rows
+    monkeypatch.setattr(EnhancedConfig, 'HIGH_CONFIDENCE', 0.75)
+    assert restarted.get(key) is None
+    monkeypatch.undo()
+    assert VerificationResultCache(EnhancedConfig.fingerprint, db_path=db_path).get(key) is None
+
+
+def test_restart_under_a_new_config_is_a_miss(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'cache.sqlite')
+    cache = VerificationResultCache(EnhancedConfig.fingerprint, db_path=db_path)
+    key = cache.make_key(b'jpeg bytes')
+    cache.put(key, RESULT)
+
+    monkeypatch.setattr(EnhancedConfig, 'CONFIDENCE_THRESHOLD_NO_ID', 0.70)
+    assert VerificationResultCache(EnhancedConfig.fingerprint, db_path=db_path).get(key) is None
+
+
+def test_expired_entries_are_misses():
+    cache = VerificationResultCache(EnhancedConfig.fingerprint, ttl_seconds=-1)
+    key = cache.make_key(b'jpeg bytes')
+    cache.put(key, RESULT)
+    assert cache.get(key) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = VerificationResultCache(EnhancedConfig.fingerprint, max_entries=2)
+    keys = [cache.make_key(bytes([i])) for i in range(3)]
+    cache.put(keys[0], RESULT)
+    cache.put(keys[1], RESULT)
+    cache.get(keys[0])
+    cache.put(keys[2], RESULT)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
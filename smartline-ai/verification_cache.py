@@ -0,0 +1,153 @@
+# verification_cache.py
+"""
+Content-hash result cache for ID document verification.
+
+Captains often resubmit the exact same id_front photo (e.g. after a failed
+selfie). Results are keyed by a BLAKE2b hash of the uploaded bytes plus the
+verifier's configuration fingerprint, so a resubmission is answered without
+decoding or running OCR, and any change to EnhancedConfig thresholds, weights
+or the pipeline version invalidates everything cached before it.
+
+Tiers:
+- In memory: LRU with TTL
+- On disk (optional): SQLite file shared across restarts/workers
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from kyc_logging import get_logger
+
+logger = get_logger("cache")
+
+
+def content_hash(data) -> str:
+    """Fast content hash of image bytes (any buffer: bytes, bytearray, memoryview)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _to_json_value(value: Any):
+    """json.dumps fallback for numpy scalars/arrays and other stray types"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class VerificationResultCache:
+    """LRU+TTL result cache with an optional SQLite tier"""
+
+    def __init__(self, fingerprint_fn: Callable[[], str], max_entries: int = 1024,
+                 ttl_seconds: float = 86400, db_path: Optional[str] = None):
+        """
+        Args:
+            fingerprint_fn: Returns the current configuration fingerprint; checked on
+                every access so runtime config changes invalidate the cache.
+            max_entries: In-memory LRU capacity.
+            ttl_seconds: Entry lifetime in both tiers.
+            db_path: SQLite file for the on-disk tier (None = memory only).
+        """
+        self.fingerprint_fn = fingerprint_fn
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._fingerprint = fingerprint_fn()
+        self.hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verification_results ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._db.execute("DELETE FROM verification_results WHERE fingerprint != ? OR expires_at < ?",
+                             (self._fingerprint, time.time()))
+            self._db.commit()
+
+    def make_key(self, data) -> str:
+        """Cache key for the raw image bytes"""
+        return content_hash(data)
+
+    def _check_fingerprint(self):
+        """Drop everything cached under a previous configuration (caller holds the lock)"""
+        fingerprint = self.fingerprint_fn()
+        if fingerprint == self._fingerprint:
+            return
+        logger.info("Verifier configuration changed - invalidating result cache")
+        self._fingerprint = fingerprint
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM verification_results WHERE fingerprint != ?", (fingerprint,))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached result for key, or None"""
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint()
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, payload FROM verification_results WHERE key = ? AND fingerprint = ?",
+                    (key, self._fingerprint)
+                ).fetchone()
+                if row is not None and row[0] >= now:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return json.loads(row[1])
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Dict):
+        """Store a verification result (must be JSON-serializable apart from numpy values)"""
+        payload = json.dumps(result, default=_to_json_value)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._check_fingerprint()
+            self._remember(key, expires_at, payload)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verification_results (key, fingerprint, expires_at, payload)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, self._fingerprint, expires_at, payload)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, payload: str):
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'disk_tier': self.db_path is not None
+            }
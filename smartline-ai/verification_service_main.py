@@ -1,24 +1,57 @@
 
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+import hashlib
 import httpx
 import os
 import asyncio
 import threading
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
-import cv2
 import numpy as np
-from production_egyptian_id_verifier_enhanced import IDVerificationService
+from production_egyptian_id_verifier_enhanced import IDVerificationService, EnhancedConfig, FeatureCheckExecutor
+from verification_cache import VerificationResultCache
+from liveness_engine import LivenessEngine, TemporalLivenessAnalyzer, iter_burst_frames, iter_video_frames
+from artifact_writer import ArtifactWriter
+from image_ingest import BufferPool, PooledBuffer, MultipartIngest, decode_image, stream_into
+from duplicate_detection import NearDuplicateIndex, IDNumberIndex
+from face_matching import FaceEmbedder, EmbeddingCache, CaptainFaceHistory, face_distances
+from face_index import FaceEmbeddingIndex
+from quality_gate import PreflightGate
+from id_back import IDBackPipeline, BarcodeHint
+from kyc_logging import configure_logging, get_logger
 
 # Load environment variables
 load_dotenv()
 
+# Logging - quiet (WARNING) by default; set KYC_LOG_LEVEL=INFO/DEBUG to trace requests
+configure_logging()
+logger = get_logger("service")
+
 # Configuration
 API_KEY = os.getenv("FASTAPI_VERIFICATION_KEY", "your-secret-key")
 IDLE_TIMEOUT_SECONDS = int(os.getenv("KYC_IDLE_TIMEOUT", 1800))  # 30 minutes default
+# Budget of /internal/verify; stages stop at it cooperatively (one OpenCV / OCR call in flight can overrun it)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("KYC_REQUEST_DEADLINE", 25))
+RESULT_CACHE_SIZE = int(os.getenv("KYC_RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_TTL = float(os.getenv("KYC_RESULT_CACHE_TTL", 86400))  # 24 hours default
+RESULT_CACHE_DB = os.getenv("KYC_RESULT_CACHE_DB")  # optional SQLite file for the on-disk tier
+DUPLICATE_INDEX_DB = os.getenv("KYC_DUPLICATE_INDEX_DB")  # optional SQLite file for the near-duplicate index
+DUPLICATE_MAX_DISTANCE = int(os.getenv("KYC_DUPLICATE_MAX_DISTANCE", 4))  # Hamming bits of 64
+DUPLICATE_REUSE_DISTANCE = int(os.getenv("KYC_DUPLICATE_REUSE_DISTANCE", 2))  # reuse of a trusted near-duplicate's checks
+ID_NUMBER_INDEX_DB = os.getenv("KYC_ID_NUMBER_INDEX_DB")  # optional SQLite file for the ID number index
+FACE_HISTORY_DB = os.getenv("KYC_FACE_HISTORY_DB")  # optional SQLite file for captains' previous selfie embeddings
+FACE_MATCH_TOLERANCE = float(os.getenv("KYC_FACE_MATCH_TOLERANCE", 0.6))  # max embedding distance, same person
+EMBEDDING_CACHE_SIZE = int(os.getenv("KYC_EMBEDDING_CACHE_SIZE", 4096))
+FACE_INDEX_DIR = os.getenv("KYC_FACE_INDEX_DIR")  # optional directory for the cross-captain face index
+FACE_DUPLICATE_DISTANCE = float(os.getenv("KYC_FACE_DUPLICATE_DISTANCE", 0.45))  # stricter than 1:1 matching
+ID_BACK_WORKERS = int(os.getenv("KYC_ID_BACK_WORKERS", 4))  # back sides processed concurrently
+MAX_UPLOAD_PART_BYTES = int(os.getenv("KYC_MAX_UPLOAD_PART_BYTES", 20 * 1024 * 1024))  # per uploaded image
+MEDIA_BUFFER_POOL_SIZE = int(os.getenv("KYC_MEDIA_BUFFER_POOL_SIZE", 32))  # idle download buffers kept
+DEBUG_OUTPUT_DIR = os.getenv("KYC_DEBUG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "debug"))
 
 # ==================== Auto-Shutdown Manager ====================
 
@@ -35,7 +68,7 @@ class IdleShutdownManager:
         """Reset the idle timer - call this on each request."""
         with self._lock:
             self.last_activity = time.time()
-            print(f"[KYC] Activity ping - shutdown timer reset to {self.timeout_seconds}s")
+            logger.debug("Activity ping - shutdown timer reset to %ss", self.timeout_seconds)
     
     def get_remaining_seconds(self) -> int:
         """Get seconds remaining before auto-shutdown."""
@@ -45,16 +78,16 @@ class IdleShutdownManager:
     
     async def start_shutdown_watcher(self):
         """Background task that monitors for idle timeout."""
-        print(f"[KYC] Auto-shutdown enabled - will shutdown after {self.timeout_seconds}s of inactivity")
+        logger.info("Auto-shutdown enabled - will shutdown after %ss of inactivity", self.timeout_seconds)
         while True:
             await asyncio.sleep(60)  # Check every minute
             remaining = self.get_remaining_seconds()
             
             if remaining <= 0:
-                print("[KYC] Idle timeout reached - shutting down...")
+                logger.warning("Idle timeout reached - shutting down...")
                 os._exit(0)  # Force exit
             elif remaining <= 300:  # Less than 5 minutes
-                print(f"[KYC] Warning: Auto-shutdown in {remaining}s (no activity)")
+                logger.warning("Auto-shutdown in %ss (no activity)", remaining)
 
 shutdown_manager = IdleShutdownManager(IDLE_TIMEOUT_SECONDS)
 
@@ -66,7 +99,8 @@ class ReasonCode(BaseModel):
 
 class VerifyRequest(BaseModel):
     session_id: str
-    media: Dict[str, str]  # {kind: signed_url}
+    driver_id: Optional[str] = None  # enables comparison with the captain's previous selfies
+    media: Dict[str, str]  # {kind: signed_url}, kind: selfie / selfie_video / selfie_frame_<n> / id_front / id_back
 
 class VerifyResponse(BaseModel):
     session_id: str
@@ -76,13 +110,17 @@ class VerifyResponse(BaseModel):
     doc_extracted_fields: Dict[str, Any]
     suggested_decision: str
     reason_codes: List[ReasonCode]
+    face_match: Dict[str, Any] = {}
+    image_quality: Dict[str, Any] = {}  # pre-flight measurements per media kind
+    id_back: Dict[str, Any] = {}  # barcode and expiry date read from the back of the card
+    risk_signals: Dict[str, Any] = {}
 
-# ==================== Helper Functions ====================
+class PrecheckResponse(BaseModel):
+    passed: bool
+    hints: List[ReasonCode]  # retake prompts, e.g. ID_GLARE, SELFIE_MULTIPLE_FACES
+    checks: Dict[str, Dict[str, Any]]  # measurements per media kind
 
-def _bytes_to_numpy(data: bytes) -> np.ndarray:
-    """Convert image bytes to numpy array (opencv format)."""
-    nparr = np.frombuffer(data, np.uint8)
-    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+# ==================== Helper Functions ====================
 
 def _parse_dob_from_id(id_number: str) -> Optional[str]:
     """Parse DOB from Egyptian ID (14 digits)."""
@@ -102,119 +140,223 @@ def _parse_dob_from_id(id_number: str) -> Optional[str]:
     except:
         return None
 
+liveness_engine = LivenessEngine()
+
 def check_liveness(image: np.ndarray) -> Dict[str, Any]:
     """
     Check if the selfie is a real human (liveness detection).
-    Detects signs of a photo-of-photo or screen capture.
+    Runs on a canonical face-centered crop (see LivenessEngine); the crop and its
+    scale relative to the upload are included in the result.
+    """
+    return liveness_engine.check(image)
+
+temporal_liveness = TemporalLivenessAnalyzer(liveness_engine)
+
+def _selfie_burst(media: Dict[str, Any]) -> List[Any]:
+    """Encoded selfie_frame_<n> stills of a burst, in frame order."""
+    frames = [(kind[len("selfie_frame_"):], data) for kind, data in media.items()
+              if kind.startswith("selfie_frame_")]
+    return [data for index, data in sorted(frames, key=lambda f: int(f[0]) if f[0].isdigit() else 0)]
+
+def _selfie_mode(media: Dict[str, Any]) -> Optional[str]:
+    """Richest selfie media available: 'video', 'burst', 'still' or None."""
+    if "selfie_video" in media:
+        return "video"
+    if any(kind.startswith("selfie_frame_") for kind in media):
+        return "burst"
+    if "selfie" in media:
+        return "still"
+    return None
+
+def check_selfie_liveness(media: Dict[str, Any], selfie_frame: Optional[Tuple[np.ndarray, float]] = None,
+                          selfie_faces: Optional[np.ndarray] = None,
+                          keep_face: bool = False, deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # 1. Image quality checks
-    blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-    is_blurry = blur_score < 100.0
-    
-    avg_brightness = np.mean(gray)
-    is_dark = avg_brightness < 40
-    is_overexposed = avg_brightness > 220
-    
-    # 2. Face detection - must have exactly one face
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80))
-    face_count = len(faces)
-    has_face = face_count == 1
-    
-    # 3. Screen/print detection - check for moire patterns and unnatural edges
-    # High frequency noise detection (screens have regular pixel patterns)
-    edges = cv2.Canny(gray, 50, 150)
-    edge_density = np.sum(edges > 0) / edges.size
-    
-    # FFT analysis for moire pattern detection
-    f_transform = np.fft.fft2(gray.astype(np.float32))
-    f_shift = np.fft.fftshift(f_transform)
-    magnitude = np.abs(f_shift)
-    
-    # Check for regular patterns (screens have peaks at specific frequencies)
-    center_y, center_x = magnitude.shape[0] // 2, magnitude.shape[1] // 2
-    # Exclude DC component
-    magnitude[center_y-5:center_y+5, center_x-5:center_x+5] = 0
-    max_mag = magnitude.max()
-    avg_mag = magnitude.mean()
-    pattern_ratio = max_mag / avg_mag if avg_mag > 0 else 0
-    
-    # High pattern ratio indicates regular patterns (possibly a screen)
-    has_moire = pattern_ratio > 50
-    
-    # 4. Skin tone detection - real faces have natural skin tones
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    # Skin tone range in HSV
-    skin_mask = cv2.inRange(hsv, np.array([0, 20, 70]), np.array([20, 255, 255]))
-    skin_ratio = np.sum(skin_mask > 0) / skin_mask.size
-    has_skin_tone = skin_ratio > 0.05  # At least 5% skin pixels
-    
-    # 5. Texture analysis - real faces have natural texture variation
-    texture_score = 0.0
-    if face_count > 0:
-        x, y, w, h = faces[0]
-        face_region = gray[y:y+h, x:x+w]
-        if face_region.size > 0:
-            # LBP-like texture measure
-            texture_score = np.std(face_region)
-    has_natural_texture = texture_score > 20
-    
-    # Decision
-    quality_passed = not (is_blurry or is_dark or is_overexposed)
-    liveness_passed = has_face and not has_moire and has_skin_tone and has_natural_texture and quality_passed
-    
-    message = "Liveness check passed"
-    if not has_face:
-        message = f"Face detection failed (found {face_count} faces, need exactly 1)"
-    elif has_moire:
-        message = "Possible screen/photo detected (moire pattern)"
-    elif not has_skin_tone:
-        message = "No natural skin tone detected"
-    elif not has_natural_texture:
-        message = "Unnatural face texture (possible print/screen)"
-    elif is_blurry:
-        message = "Image is too blurry"
-    elif is_dark:
-        message = "Image is too dark"
-    elif is_overexposed:
-        message = "Image is overexposed"
+    Liveness from the richest selfie media available: a `selfie_video`, a burst of
+    `selfie_frame_<n>` stills, or a single `selfie`. None when there is no selfie.
     
-    return {
-        "passed": liveness_passed,
-        "face_detected": has_face,
-        "face_count": face_count,
-        "blur_score": float(blur_score),
-        "brightness_score": float(avg_brightness),
-        "skin_tone_ratio": float(skin_ratio),
-        "texture_score": float(texture_score),
-        "moire_detected": has_moire,
-        "message": message
-    }
+    Videos and bursts are decoded frame by frame and analysis stops as soon as the
+    decision is clear, or at deadline (see TemporalLivenessAnalyzer). selfie_frame
+    is the still selfie already normalized (frame, scale), with selfie_faces
+    detected on it when that happened in a batched detector pass. keep_face=True
+    adds the selfie 'face': (frame, box) used by face matching.
+    """
+    mode = _selfie_mode(media)
+    if mode == "video":
+        return temporal_liveness.analyze(iter_video_frames(media["selfie_video"]), keep_face, deadline)
+    if mode == "burst":
+        return temporal_liveness.analyze(iter_burst_frames(_selfie_burst(media)), keep_face, deadline)
+    if mode == "still":
+        if selfie_frame is None:
+            selfie_frame = liveness_engine.normalize(decode_image(media["selfie"]))
+        return liveness_engine.check_normalized(selfie_frame[0], selfie_frame[1], selfie_faces, keep_face)
+    return None
 
-async def download_media(media_urls: Dict[str, str]) -> Dict[str, bytes]:
-    """Download media files from signed URLs."""
+async def download_media(media_urls: Dict[str, str], leases: List[PooledBuffer]) -> Dict[str, memoryview]:
+    """
+    Stream media files from signed URLs into pooled buffers.
+    
+    Returns zero-copy views of the downloaded bytes; the buffers are appended to
+    leases and must be released (see _release_media) once the request is done.
+    """
     downloaded = {}
     async with httpx.AsyncClient(timeout=30.0) as client:
         for kind, url in media_urls.items():
             if url:
+                buffer = media_buffers.acquire()
                 try:
-                    response = await client.get(url)
-                    if response.status_code == 200:
-                        downloaded[kind] = response.content
+                    async with client.stream("GET", url) as response:
+                        if response.status_code == 200:
+                            await stream_into(response, buffer)
+                            downloaded[kind] = buffer.view()
+                            leases.append(buffer)
+                            buffer = None
                 except Exception as e:
-                    print(f"Error downloading {kind}: {e}")
+                    logger.warning("Error downloading %s: %s", kind, e)
+                finally:
+                    if buffer is not None:
+                        buffer.release()
     return downloaded
 
-def determine_decision(liveness_passed: bool, doc_auth: float) -> str:
-    """Determine suggested decision based on liveness and document authenticity."""
+def _release_media(downloaded: Dict[str, Any], leases: List[PooledBuffer]):
+    """Drop the views of a request's downloads and return their buffers to the pool."""
+    for view in downloaded.values():
+        if isinstance(view, memoryview):
+            view.release()
+    for buffer in leases:
+        buffer.release()
+
+def _save_debug_annotation(session_id: str, annotated: Optional[np.ndarray]):
+    """Queue the annotated document image of a debug request (written off the request path)."""
+    if annotated is None:
+        return
+    safe_id = "".join(c for c in session_id if c.isalnum() or c in "-_") or "session"
+    debug_artifacts.submit(safe_id, {"annotated": annotated}, passed=False)
+
+def _selfie_media_key(media: Dict[str, Any]) -> Optional[str]:
+    """Content hash of the selfie media (video, every burst frame, or the still)."""
+    mode = _selfie_mode(media)
+    if mode is None:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    if mode == "video":
+        digest.update(media["selfie_video"])
+    elif mode == "burst":
+        for frame in _selfie_burst(media):
+            digest.update(frame)
+    else:
+        digest.update(media["selfie"])
+    return digest.hexdigest()
+
+def _cached_embedding(key: Optional[str], compute) -> Optional[np.ndarray]:
+    """Embedding for key from the cache, else compute() (None = inputs not available, nothing cached)."""
+    if key is None:
+        return None
+    found, embedding = face_embeddings.get(key)
+    if not found and compute is not None:
+        embedding = compute()
+        face_embeddings.put(key, embedding)
+    return embedding
+
+def _embed_id_photo(photo_region: np.ndarray, verification_result: Dict) -> Optional[np.ndarray]:
+    """Embed the largest face of the card photo, reusing the photo check's detections when it ran."""
+    photo_check = verification_result.get('verification', {}).get('features', {}).get('photo_left_side', {})
+    boxes = photo_check.get('details', {}).get('face_boxes')
+    if boxes is None:
+        verifier = id_service.pipeline.verifier
+        boxes = verifier.face_detector.detect(photo_region, min_size=verifier.config.FACE_DETECTION['minSize'],
+                                              max_size=verifier.config.FACE_DETECTION['maxSize']).tolist()
+    if not boxes:
+        return None
+    return face_embedder.embed(photo_region, max(boxes, key=lambda box: box[2] * box[3]))
+
+def match_faces(session_id: str, driver_id: Optional[str], selfie_key: Optional[str],
+                selfie_face: Optional[Tuple[np.ndarray, np.ndarray]], id_key: Optional[str],
+                photo_region: Optional[np.ndarray], verification_result: Optional[Dict],
+                liveness_passed: bool, request_deadline: float) -> Dict[str, Any]:
+    """
+    Face-match stage: the selfie face against the ID card photo, against the
+    captain's previous selfies when driver_id is known, and against every other
+    captain's selfies (face index) to catch one person behind several accounts.
+    The captain is identified by driver_id or, failing that, by the card's
+    verified ID number; without either the face index is not consulted.
+    
+    Embeddings are computed for the face boxes liveness and the photo check already
+    found, and cached by media hash so resubmissions cost nothing. A selfie is
+    remembered (as the captain's reference face and in the face index) only when
+    it is live and matched both the ID photo and the captain's previous selfies.
+    """
+    if not face_embedder.available:
+        return {"status": "disabled"}
+    if time.monotonic() >= request_deadline:
+        return {"status": "deadline"}
+    
+    selfie_embedding = _cached_embedding(
+        selfie_key and "selfie:" + selfie_key,
+        (lambda: face_embedder.embed(*selfie_face)) if selfie_face is not None else None
+    )
+    id_embedding = _cached_embedding(
+        id_key and "id:" + id_key,
+        (lambda: _embed_id_photo(photo_region, verification_result)) if photo_region is not None else None
+    )
+    
+    face_match: Dict[str, Any] = {"status": "incomplete"}
+    if selfie_embedding is not None and id_embedding is not None:
+        distance = float(face_distances(id_embedding[np.newaxis], selfie_embedding)[0])
+        face_match = {"status": "compared", "distance": distance, "matched": distance <= FACE_MATCH_TOLERANCE}
+    else:
+        face_match["missing"] = [name for name, embedding in (("selfie", selfie_embedding), ("id_photo", id_embedding))
+                                 if embedding is None]
+    
+    history = None
+    if driver_id and selfie_embedding is not None:
+        history = captain_faces.compare(driver_id, selfie_embedding, FACE_MATCH_TOLERANCE, exclude_session=session_id)
+        if history is not None:
+            face_match["previous_selfies"] = history
+    
+    # Only live selfies that match the ID photo and the captain's earlier selfies
+    # (no FACE_CHANGED) become reference faces
+    enroll = (liveness_passed and face_match.get("matched") is True
+              and (history is None or history["matched"]))
+    if driver_id and enroll:
+        captain_faces.add(driver_id, session_id, selfie_embedding)
+    
+    extracted_data = (verification_result or {}).get('verification', {}).get('extracted_data', {})
+    id_number = extracted_data['id_number'] if extracted_data.get('valid', False) else None
+    if selfie_embedding is not None and (driver_id or id_number):
+        other_captains = face_index.search(selfie_embedding, exclude_driver=driver_id, exclude_session=session_id,
+                                           exclude_id_number=id_number)
+        if other_captains:
+            face_match["other_captains"] = other_captains
+        if enroll:
+            face_index.add(driver_id, session_id, selfie_embedding, id_number=id_number)
+    
+    return face_match
+
+def determine_decision(liveness_passed: bool, doc_auth: float, doc_timed_out: bool = False,
+                       face_mismatch: bool = False, id_back_issue: bool = False,
+                       liveness_timed_out: bool = False) -> str:
+    """Determine suggested decision based on liveness, document authenticity, face match and the card's back."""
     if not liveness_passed:
-        return "rejected"
+        # A selfie video cut off by the deadline is inconclusive, not a failure
+        return "manual_review" if liveness_timed_out else "rejected"
     
-    if doc_auth >= 70:
+    # Document checks cut off by their deadline leave the score incomplete
+    if doc_timed_out:
+        return "manual_review"
+    
+    # A selfie that does not match the ID photo (or the captain's earlier selfies) needs a human
+    review_score = EnhancedConfig.REVIEW_CONFIDENCE * 100
+    if face_mismatch and doc_auth >= review_score:
+        return "manual_review"
+    
+    # Likewise an expired card, or a back whose barcode contradicts the front
+    if id_back_issue and doc_auth >= review_score:
+        return "manual_review"
+    
+    if doc_auth >= EnhancedConfig.HIGH_CONFIDENCE * 100:
         return "approved"
-    elif doc_auth >= 50:
+    elif doc_auth >= review_score:
         return "manual_review"
     else:
         return "rejected"
@@ -230,9 +372,48 @@ async def verify_api_key(x_api_key: str = Header(...)):
 # ==================== Initialization ====================
 
 # Initialize ID Verification Service (loads OCR models)
-print("Initializing ID Verification Service...")
+logger.info("Initializing ID Verification Service...")
 id_service = IDVerificationService()
-print("ID Verification Service initialized.")
+logger.info("ID Verification Service initialized.")
+
+# Results of previously seen id_front uploads (invalidated when EnhancedConfig changes)
+result_cache = VerificationResultCache(
+    EnhancedConfig.fingerprint,
+    max_entries=RESULT_CACHE_SIZE,
+    ttl_seconds=RESULT_CACHE_TTL,
+    db_path=RESULT_CACHE_DB
+)
+
+# Reusable download buffers (one compressed image per buffer, returned after each request)
+media_buffers = BufferPool(max_buffers=MEDIA_BUFFER_POOL_SIZE)
+
+# Debug annotations are encoded and written by a background thread
+debug_artifacts = ArtifactWriter(DEBUG_OUTPUT_DIR)
+
+# Perceptual hashes of every verified card, to spot the same card reused across sessions
+duplicate_index = NearDuplicateIndex(
+    db_path=DUPLICATE_INDEX_DB,
+    max_distance=DUPLICATE_MAX_DISTANCE,
+    reuse_max_distance=DUPLICATE_REUSE_DISTANCE
+)
+
+# Validated national ID numbers -> sessions; consulted by the ID number check
+id_number_index = IDNumberIndex(db_path=ID_NUMBER_INDEX_DB)
+id_service.pipeline.verifier.id_number_index = id_number_index
+
+# Thumbnail-level quality checks that turn away unusable photos before the heavy stages
+preflight = PreflightGate(id_service.pipeline.detector, liveness_engine)
+
+# Back of the card (barcode, expiry date), read alongside the front
+id_back_pipeline = IDBackPipeline(id_service.pipeline.detector, id_service.pipeline.verifier,
+                                  max_workers=ID_BACK_WORKERS)
+
+# Selfie <-> ID photo face matching (needs face_recognition) and per-captain selfie history
+face_embedder = FaceEmbedder()
+face_embeddings = EmbeddingCache(max_entries=EMBEDDING_CACHE_SIZE)
+captain_faces = CaptainFaceHistory(db_path=FACE_HISTORY_DB)
+# Every captain's live selfies, for one-to-many duplicate-face lookups
+face_index = FaceEmbeddingIndex(directory=FACE_INDEX_DIR, max_distance=FACE_DUPLICATE_DISTANCE)
 
 # ==================== App Setup ====================
 
@@ -274,25 +455,35 @@ async def get_status():
     return {
         "status": "running",
         "idle_timeout_seconds": shutdown_manager.timeout_seconds,
-        "remaining_seconds": shutdown_manager.get_remaining_seconds()
+        "remaining_seconds": shutdown_manager.get_remaining_seconds(),
+        "document_detection": id_service.pipeline.detector.get_strategy_stats(),
+        "feature_checks": FeatureCheckExecutor.stats(),
+        "result_cache": result_cache.stats(),
+        "duplicate_index": duplicate_index.stats(),
+        "id_number_index": id_number_index.stats(),
+        "face_embeddings": face_embeddings.stats(),
+        "captain_faces": captain_faces.stats(),
+        "face_index": face_index.stats(),
+        "id_back": id_back_pipeline.stats(),
+        "debug_artifacts": debug_artifacts.stats(),
+        "media_buffers": media_buffers.stats()
     }
 
-@app.post("/internal/verify", response_model=VerifyResponse)
-async def verify_documents(
-    request: VerifyRequest,
-    api_key: str = Depends(verify_api_key)
-):
+def _verify_media(session_id: str, downloaded_media: Dict[str, Any], debug: bool,
+                  request_deadline: float, driver_id: Optional[str] = None) -> VerifyResponse:
     """
-    Main verification endpoint.
+    Verification core shared by the URL and upload endpoints.
+    0. Pre-flight quality gate - tiny, dark, overexposed or blurred photos (and ID
+       photos without a card) are answered with retake reason codes right away
     1. Liveness detection - verify selfie is a real human (not photo of photo)
     2. ID document verification - validate Egyptian National ID authenticity
-    """
-    # Reset idle timer on each verification request
-    shutdown_manager.ping()
-    
-    session_id = request.session_id
-    media = request.media
+    3. Face matching - selfie vs. ID photo (and the captain's previous selfies)
+    4. Back of the card (id_back, optional) - barcode and expiry date, read in the
+       background from the start; its barcode number is checked against the front's
     
+    downloaded_media maps media kinds (selfie, selfie_video, selfie_frame_<n>, id_front, id_back, ...)
+    to encoded image/video buffers.
+    """
     reason_codes = []
     
     # Initialize response values
@@ -300,39 +491,119 @@ async def verify_documents(
     liveness_details = {}
     doc_auth_score = 0.0
     doc_extracted_fields = {}
+    doc_timed_out = False
+    liveness_timed_out = False
+    face_match = {}
+    image_quality = {}
+    id_back = {}
+    risk_signals = {}
     
     try:
-        # 1. Download media files
-        downloaded_media = await download_media(media)
-        
-        # 2. Liveness detection on selfie
-        if "selfie" in downloaded_media:
-            selfie_np = _bytes_to_numpy(downloaded_media["selfie"])
-            liveness_result = check_liveness(selfie_np)
-            liveness_passed = liveness_result["passed"]
-            liveness_details = liveness_result
-            if not liveness_passed:
-                reason_codes.append(ReasonCode(
-                    code="LIVENESS_FAILED",
-                    message=liveness_result.get("message", "Liveness check failed")
-                ))
-        else:
-            reason_codes.append(ReasonCode(
-                code="MISSING_SELFIE",
-                message="Selfie image is required for liveness detection"
-            ))
+        selfie_face = None
+        photo_region = None
+        verification_result = None
+        cache_key = None
         
-        # 3. ID document OCR and validation
+        # 0. Pre-flight quality gate on thumbnails (10-20 ms per phone photo, see quality_gate)
+        id_usable = selfie_usable = True
         if "id_front" in downloaded_media:
-            id_front_np = _bytes_to_numpy(downloaded_media["id_front"])
+            image_quality["id_front"] = preflight.check(downloaded_media["id_front"], "id_front")
+            id_usable = image_quality["id_front"]["passed"]
+        if _selfie_mode(downloaded_media) == "still":
+            image_quality["selfie"] = preflight.check(downloaded_media["selfie"], "selfie")
+            selfie_usable = image_quality["selfie"]["passed"]
+        id_back_usable = True
+        if "id_back" in downloaded_media:
+            image_quality["id_back"] = preflight.check(downloaded_media["id_back"], "id_back")
+            id_back_usable = image_quality["id_back"]["passed"]
+        
+        # The back is read concurrently with everything below; if its barcode is in by
+        # then, the front's ID number check uses it as a cross-check (see verify_all_features)
+        id_back_future = None
+        id_number_hint = None
+        if "id_back" in downloaded_media and id_back_usable:
+            barcode_hint = BarcodeHint()
+            # A copy: the worker may outlive this request's download buffers
+            id_back_future = id_back_pipeline.submit(bytes(downloaded_media["id_back"]), barcode_hint,
+                                                     request_deadline)
+            id_number_hint = barcode_hint.get
+        
+        # A still selfie shares the face detector pass with the ID photo region
+        # when the backend batches (DNN); otherwise liveness detects on its own
+        selfie_frame = None
+        selfie_faces = None
+        if (liveness_engine.face_detector.batched and "id_front" in downloaded_media and id_usable
+                and _selfie_mode(downloaded_media) == "still" and selfie_usable):
+            selfie_frame = liveness_engine.normalize(decode_image(downloaded_media["selfie"]))
+        
+        # 2. ID document OCR and validation (before liveness, which may reuse its face detections)
+        if not id_usable:
+            reason_codes.extend(ReasonCode(**issue) for issue in image_quality["id_front"]["issues"])
+        elif "id_front" in downloaded_media:
+            # Resubmissions of the exact same photo are answered from the cache
+            cache_key = result_cache.make_key(downloaded_media["id_front"])
+            verification_result = None if debug else result_cache.get(cache_key)
+            near_duplicates = {}
+            
+            if verification_result is None:
+                id_front_np = decode_image(downloaded_media["id_front"])
+                
+                def reuse_trusted_result(hashes):
+                    # Look up near-duplicates once the card is warped; a trusted
+                    # result for (almost) the same card and portrait skips the visual
+                    # checks (the ID number is always read from this card)
+                    near_duplicates.update(duplicate_index.lookup(hashes, exclude_session=session_id))
+                    reuse_key = None if debug else duplicate_index.trusted_result_key(near_duplicates)
+                    return result_cache.get(reuse_key) if reuse_key else None
+                
+                # Call the production verifier
+                verification_result = id_service.verify_image_array(
+                    id_front_np, annotate=debug, full_report=debug,
+                    budget_seconds=request_deadline - time.monotonic(),
+                    reuse_result=reuse_trusted_result,
+                    face_images=[selfie_frame[0]] if selfie_frame is not None else None,
+                    keep_photo_region=face_embedder.available,
+                    id_number_hint=id_number_hint
+                )
+                selfie_faces = (verification_result.pop('face_detections', None) or [None])[0]
+                photo_region = verification_result.pop('photo_region', None)
+                if debug:
+                    _save_debug_annotation(session_id, verification_result.pop('annotated', None))
+                if not verification_result.get('timed_out', False):
+                    result_cache.put(cache_key, verification_result)
+                fresh_result = not verification_result.get('reused_near_duplicate', False)
+                trusted = (fresh_result
+                           and verification_result['success']
+                           and verification_result['is_egyptian_id']
+                           and not verification_result['timed_out']
+                           and verification_result['confidence'] >= EnhancedConfig.HIGH_CONFIDENCE)
+            else:
+                logger.debug("Result cache hit for session %s", session_id)
+                fresh_result = False
+                trusted = False  # already indexed by the session that produced it
             
-            # Call the production verifier
-            verification_result = id_service.verify_image_array(id_front_np)
+            hashes = verification_result.get('perceptual_hashes')
+            if hashes:
+                if not near_duplicates:
+                    near_duplicates = duplicate_index.lookup(hashes, exclude_session=session_id)
+                duplicate_index.add(session_id, hashes, result_key=cache_key, trusted=trusted)
+                if near_duplicates['card'] or near_duplicates['photo']:
+                    risk_signals["near_duplicates"] = {
+                        kind: [{"session_id": m["session_id"], "distance": m["distance"]} for m in matches]
+                        for kind, matches in near_duplicates.items()
+                    }
+                if verification_result.get('reused_near_duplicate', False):
+                    risk_signals["reused_near_duplicate_result"] = True
             
             if verification_result['success']:
                 # Map confidence (0-1) to score (0-100)
                 doc_auth_score = verification_result.get('confidence', 0.0) * 100
                 
+                # Glare on the rectified card, as the feature checks saw it
+                card_glare = verification_result.get('verification', {}).get('glare')
+                if card_glare is not None:
+                    image_quality["id_front"]["card_glare"] = card_glare
+
                 # Extract fields from nested structure
                 extracted_data = verification_result.get('verification', {}).get('extracted_data', {})
                 info = extracted_data.get('info', {})
@@ -346,12 +617,35 @@ async def verify_documents(
                     "is_valid_egyptian_id": verification_result.get('is_egyptian_id', False)
                 }
                 
-                if not verification_result.get('is_egyptian_id', False):
+                # Same national ID number submitted from other sessions
+                if extracted_data.get('valid', False):
+                    id_number = extracted_data['id_number']
+                    if fresh_result and 'registered_sessions' in extracted_data:
+                        previous_sessions = [s for s in extracted_data['registered_sessions'] if s != session_id]
+                    else:
+                        # Cached results carry the sessions known when they were computed
+                        previous_sessions = id_number_index.sessions_for(id_number, exclude_session=session_id)
+                    id_number_index.add(id_number, session_id)
+                    if previous_sessions:
+                        risk_signals["duplicate_id_number_sessions"] = previous_sessions
+                        reason_codes.append(ReasonCode(
+                            code="DUPLICATE_ID_NUMBER",
+                            message=f"ID number already submitted in {len(previous_sessions)} other session(s)"
+                        ))
+                
+                if verification_result.get('timed_out', False):
+                    doc_timed_out = True
+                    reason_codes.append(ReasonCode(
+                        code="DOC_CHECK_TIMEOUT",
+                        message="Document checks exceeded their time budget: "
+                                + ", ".join(verification_result['verification'].get('timed_out_features', []))
+                    ))
+                elif not verification_result.get('is_egyptian_id', False):
                     reason_codes.append(ReasonCode(
                         code="INVALID_ID_TYPE",
                         message="Document is not a valid Egyptian ID"
                     ))
-                elif doc_auth_score < 50:
+                elif doc_auth_score < EnhancedConfig.REVIEW_CONFIDENCE * 100:
                     reason_codes.append(ReasonCode(
                         code="LOW_DOC_AUTHENTICITY",
                         message="Document authenticity score too low"
@@ -367,12 +661,104 @@ async def verify_documents(
                 message="ID front image is required"
             ))
         
-        # 4. Determine suggested decision (liveness + document only, no face matching)
-        suggested_decision = determine_decision(liveness_passed, doc_auth_score)
+        # 1. Liveness detection on the selfie video, burst or still (reported first)
+        liveness_result = None
+        if not selfie_usable:
+            reason_codes[0:0] = [ReasonCode(**issue) for issue in image_quality["selfie"]["issues"]]
+        else:
+            liveness_result = check_selfie_liveness(downloaded_media, selfie_frame, selfie_faces,
+                                                    keep_face=face_embedder.available, deadline=request_deadline)
+        if liveness_result is not None:
+            selfie_face = liveness_result.pop("face", None)
+            liveness_passed = liveness_result["passed"]
+            liveness_details = liveness_result
+            liveness_timed_out = liveness_result.get("timed_out", False)
+            if liveness_timed_out:
+                reason_codes.insert(0, ReasonCode(
+                    code="LIVENESS_TIMEOUT",
+                    message=liveness_result["message"]
+                ))
+            elif not liveness_passed:
+                reason_codes.insert(0, ReasonCode(
+                    code="LIVENESS_FAILED",
+                    message=liveness_result.get("message", "Liveness check failed")
+                ))
+        elif selfie_usable:
+            reason_codes.insert(0, ReasonCode(
+                code="MISSING_SELFIE",
+                message="Selfie image is required for liveness detection"
+            ))
+        
+        # 3. Face matching (reuses the face boxes found above)
+        face_mismatch = False
+        if liveness_result is not None and verification_result is not None and verification_result['success']:
+            face_match = match_faces(session_id, driver_id, _selfie_media_key(downloaded_media), selfie_face,
+                                     cache_key, photo_region, verification_result, liveness_passed,
+                                     request_deadline)
+            if face_match.get("matched") is False:
+                face_mismatch = True
+                reason_codes.append(ReasonCode(
+                    code="FACE_MISMATCH",
+                    message=f"Selfie does not match the ID photo (distance {face_match['distance']:.2f})"
+                ))
+            previous = face_match.get("previous_selfies")
+            if previous is not None and not previous["matched"]:
+                face_mismatch = True
+                reason_codes.append(ReasonCode(
+                    code="FACE_CHANGED",
+                    message=f"Selfie matches none of the captain's {previous['previous_sessions']} previous selfie(s)"
+                ))
+            other_captains = face_match.pop("other_captains", None)
+            if other_captains:
+                risk_signals["face_duplicates"] = other_captains
+                reason_codes.append(ReasonCode(
+                    code="DUPLICATE_FACE",
+                    message=f"Selfie matches {len(other_captains)} selfie(s) from other captain accounts"
+                ))
+        
+        # 4. Back of the card (started before step 2)
+        id_back_issue = False
+        if not id_back_usable:
+            reason_codes.extend(ReasonCode(**issue) for issue in image_quality["id_back"]["issues"])
+        elif id_back_future is not None:
+            try:
+                id_back = id_back_future.result(timeout=max(0.0, request_deadline - time.monotonic()))
+            except FutureTimeoutError:
+                reason_codes.append(ReasonCode(
+                    code="ID_BACK_TIMEOUT",
+                    message="Back of the ID was not read within the time budget"
+                ))
+            else:
+                if not id_back['success']:
+                    reason_codes.append(ReasonCode(
+                        code="ID_BACK_PROCESSING_FAILED",
+                        message=id_back.get('error', 'Failed to process the back of the ID')
+                    ))
+                else:
+                    expiry = id_back['expiry']
+                    if expiry.get('date'):
+                        doc_extracted_fields["expiry_date"] = expiry['date']
+                    if expiry.get('expired'):
+                        id_back_issue = True
+                        reason_codes.append(ReasonCode(
+                            code="ID_EXPIRED",
+                            message=f"ID card expired on {expiry['date']}"
+                        ))
+                    barcode_id = id_back['barcode'].get('id_number')
+                    front_id = doc_extracted_fields.get("id_number")
+                    if barcode_id and front_id and barcode_id != front_id:
+                        id_back_issue = True
+                        reason_codes.append(ReasonCode(
+                            code="ID_SIDES_MISMATCH",
+                            message="ID number in the back's barcode differs from the front"
+                        ))
+        
+        # 5. Determine suggested decision
+        suggested_decision = determine_decision(liveness_passed, doc_auth_score, doc_timed_out, face_mismatch,
+                                                id_back_issue, liveness_timed_out)
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Verification failed for session %s", session_id)
         reason_codes.append(ReasonCode(
             code="PROCESSING_ERROR",
             message=str(e)
@@ -386,9 +772,145 @@ async def verify_documents(
         doc_auth_score=doc_auth_score,
         doc_extracted_fields=doc_extracted_fields,
         suggested_decision=suggested_decision,
-        reason_codes=reason_codes
+        reason_codes=reason_codes,
+        face_match=face_match,
+        image_quality=image_quality,
+        id_back=id_back,
+        risk_signals=risk_signals
+    )
+
+def _timeout_response(session_id: str) -> VerifyResponse:
+    """Response for a request whose media did not arrive within the request deadline."""
+    return VerifyResponse(
+        session_id=session_id,
+        liveness_passed=False,
+        liveness_details={},
+        doc_auth_score=0.0,
+        doc_extracted_fields={},
+        suggested_decision="manual_review",
+        reason_codes=[ReasonCode(
+            code="REQUEST_TIMEOUT",
+            message="Verification exceeded its time budget"
+        )]
     )
 
+@app.post("/internal/verify", response_model=VerifyResponse)
+async def verify_documents(
+    request: VerifyRequest,
+    api_key: str = Depends(verify_api_key),
+    x_kyc_debug: Optional[str] = Header(None)
+):
+    """
+    Main verification endpoint: downloads the media from signed URLs, then
+    runs liveness and ID document verification (front, plus the back when sent).
+    
+    Send `X-KYC-Debug: 1` to also save the annotated document image and run every
+    document check (no short-circuit) for a full audit report.
+    """
+    debug = x_kyc_debug in ("1", "true", "yes")
+    # Reset idle timer on each verification request
+    shutdown_manager.ping()
+    
+    request_deadline = time.monotonic() + REQUEST_DEADLINE_SECONDS
+    downloaded_media = {}
+    media_leases: List[PooledBuffer] = []
+    
+    try:
+        downloaded_media = await asyncio.wait_for(download_media(request.media, media_leases),
+                                                  timeout=REQUEST_DEADLINE_SECONDS)
+        return _verify_media(request.session_id, downloaded_media, debug, request_deadline, request.driver_id)
+    except asyncio.TimeoutError:
+        logger.warning("Media download for session %s exceeded %.0fs", request.session_id, REQUEST_DEADLINE_SECONDS)
+        return _timeout_response(request.session_id)
+    finally:
+        _release_media(downloaded_media, media_leases)
+
+async def _read_upload(request: Request, ingest: MultipartIngest):
+    """Feed the request body to the multipart parser as it arrives."""
+    async for chunk in request.stream():
+        ingest.feed(chunk)
+    ingest.finish()
+
+@app.post("/internal/verify/upload", response_model=VerifyResponse)
+async def verify_upload(
+    request: Request,
+    api_key: str = Depends(verify_api_key),
+    x_kyc_debug: Optional[str] = Header(None)
+):
+    """
+    Verification for callers that already hold the image bytes (no signed-URL round trip).
+    
+    multipart/form-data body: a `session_id` field (optional `driver_id`) plus one file part per media kind
+    (`selfie` or `selfie_video` / `selfie_frame_<n>`, `id_front`, `id_back`, ...). Parts are written into pooled decode buffers as the
+    body streams in. Returns the same VerifyResponse as /internal/verify.
+    """
+    debug = x_kyc_debug in ("1", "true", "yes")
+    shutdown_manager.ping()
+    
+    request_deadline = time.monotonic() + REQUEST_DEADLINE_SECONDS
+    uploaded_media = {}
+    media_leases: List[PooledBuffer] = []
+    
+    try:
+        try:
+            ingest = MultipartIngest(request.headers.get("content-type", ""), media_buffers, media_leases,
+                                     max_part_size=MAX_UPLOAD_PART_BYTES)
+            await asyncio.wait_for(_read_upload(request, ingest), timeout=REQUEST_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Upload exceeded %.0fs", REQUEST_DEADLINE_SECONDS)
+            return _timeout_response(ingest.fields.get("session_id", ""))
+        except ValueError as e:  # MultipartError and python-multipart parse errors
+            raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+        
+        session_id = ingest.fields.get("session_id")
+        if not session_id:
+            raise HTTPException(status_code=422, detail="session_id field is required")
+        
+        uploaded_media = {kind: buffer.view() for kind, buffer in ingest.files.items()}
+        return _verify_media(session_id, uploaded_media, debug, request_deadline, ingest.fields.get("driver_id"))
+    finally:
+        _release_media(uploaded_media, media_leases)
+
+PRECHECK_KINDS = ("selfie", "id_front")
+
+@app.post("/internal/precheck", response_model=PrecheckResponse)
+async def precheck_upload(
+    request: Request,
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Capture-time quality hints, so the app can prompt for a retake before submitting.
+    
+    multipart/form-data body with a `selfie` and/or `id_front` file part. Only the
+    cheap checks run, on downscaled images: size, blur, brightness, glare, card
+    aspect ratio and face count (no OCR, no liveness analysis; roughly 10-20 ms for
+    an ID photo and 30-70 ms for a selfie, see quality_gate).
+    """
+    shutdown_manager.ping()
+    
+    uploaded_media = {}
+    media_leases: List[PooledBuffer] = []
+    try:
+        try:
+            ingest = MultipartIngest(request.headers.get("content-type", ""), media_buffers, media_leases,
+                                     max_part_size=MAX_UPLOAD_PART_BYTES)
+            await asyncio.wait_for(_read_upload(request, ingest), timeout=REQUEST_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=408, detail="Upload timed out")
+        except ValueError as e:  # MultipartError and python-multipart parse errors
+            raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+        
+        uploaded_media = {kind: buffer.view() for kind, buffer in ingest.files.items() if kind in PRECHECK_KINDS}
+        if not uploaded_media:
+            raise HTTPException(status_code=422, detail="a selfie or id_front file part is required")
+        
+        checks = {kind: preflight.precheck(data, kind) for kind, data in uploaded_media.items()}
+        hints = [ReasonCode(**issue) for kind in PRECHECK_KINDS if kind in checks
+                 for issue in checks[kind]["issues"]]
+        return PrecheckResponse(passed=not hints, hints=hints, checks=checks)
+    finally:
+        _release_media(uploaded_media, media_leases)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8100)